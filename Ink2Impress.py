@@ -10,25 +10,80 @@ Known Issues:
 """
 
 from lxml import etree
+from io import BytesIO
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 import re
 import math
 
-import matutil
-from matutil import E_X, E_Y, Matrix, scale_matrix, rotation_matrix, eye, translation_matrix
+from affine import Affine, parse_transform_list
+import batch
+import cache
+import chunking
+import compress
+import stats
+import culling
+import dedup
+import lod
+import minify
+import profiling
+import segments
 
 TRANSFORM_MATRIX_PAT = r"matrix\(([^,]*),([^,]*),([^,]*),([^,]*),([^,]*),([^,]*)\)"
 TRANSFORM_TRANSLATE_PAT = r"translate\(([^,]*),([^,]*)\)"
 TRANSFORM_SCALE_PAT = r"scale\(([^,]*),([^,]*)\)"
 
+SVG_NAMESPACE = "http://www.w3.org/2000/svg"
+INKSCAPE_LABEL = "{http://www.inkscape.org/namespaces/inkscape}label"
+
 BASE_WIDTH      = 900
 BASE_HEIGHT     = 600
 
 ID_OVERVIEW = "overview"
 
+# Length of the content hash in the file names of assets (files written next
+# to the page)
+ASSET_HASH_LENGTH = 12
+
+# Minimal number of steps for using the NumPy batch path by default
+NUMPY_MIN_STEPS = 1000
+
+# Step attributes that are inherited from the closest ancestor that sets them.
+INHERITED_ATTRIBUTES = [
+    "rotation-direction",
+    "rotation-extra",
+    ]
+
+# A target browser window size - the steps are scaled to fit it
+Viewport = namedtuple("Viewport", "name width height")
+DEFAULT_VIEWPORT = Viewport("default", BASE_WIDTH, BASE_HEIGHT)
+
+# A page of a multi-page conversion: the label of its layout layer (None for
+# the default layout), its Viewport, and its target HTML path
+Variant = namedtuple("Variant", "layout viewport target")
+
+# The parts of the impress.js page, see `build_impress`
+ImpressParts = namedtuple("ImpressParts", "pagecolor steps graphics culled chunks styles")
+
+# The outcome of converting a file in a batch, see `convert_files`
+Conversion = namedtuple("Conversion", "source target result error seconds cached")
+
 class Rect(object):
-    def __init__(self, x=0, y=0, h=0, w=0, r=0, id_=None, element=None, transform=None):
+    __slots__ = ("_x", "_y", "_h", "_w", "_id", "_r")
+    
+    def __init__(self, x=0, y=0, h=0, w=0, r=0, id_=None, element=None, transform=None, inherited=None):
         if element is not None:
-            self._init_from_element(element, transform)
+            self._init_from_element(element, transform, inherited)
         else:
             self._x = x
             self._y = y
@@ -37,7 +92,7 @@ class Rect(object):
             self._id = id_
             self._r = r
             
-    def _init_from_element(self, element, transform):
+    def _init_from_element(self, element, transform, inherited=None):
         # Define transform-independant parameters
         if element.get("id"):
             self._id = element.get("id")
@@ -45,67 +100,44 @@ class Rect(object):
             self._id = None
             
         # Init all the params that might be affected by the transformation
-        if element.get("x"):
-            self._x = float(element.get("x"))
-        else:
-            self._x = 0
-            
-        if element.get("y"):
-            self._y = float(element.get("y"))
-        else:
-            self._y = 0
-            
-        if element.get("height"):
-            self._h = float(element.get("height"))
-        else:
-            self._h = 0
-            
-        if element.get("width"):
-            self._w = float(element.get("width"))
-        else:
-            self._w = 0
+        self._x, self._y, self._w, self._h = get_rect_box(element)
            
         # Get the transform of the element
-        if transform:
-            self._transform = transform
-        else:
-            self._transform = get_element_transform(element)
+        if not transform:
+            transform = get_element_transform(element)
             
         # Apply the transformation to all properties
         # Get the rotation
-        r = self._r = self._transform.r
+        r = self._r = transform.r
         
         # Get the scale and apply to width and height
-        self._w = w = self._w * self._transform.sx
-        self._h = h = self._h * self._transform.sy
+        self._w = w = self._w * transform.sx
+        self._h = h = self._h * transform.sy
         # Calculate new x and y coordinates
         x_center = self._x + (w / 2)
         y_center = self._y + (h / 2)
         
         x, y = rotate(x_center, y_center, r)
-        x += self._transform.dx
-        y += self._transform.dy
+        x += transform.dx
+        y += transform.dy
         
         self._x = x
         self._y = y
         
         # Try and change the rotation based on rotation-direction and rotation-extra
         # attributes
-        rotation_direction = get_attribute(element, "rotation-direction", inherit=True)
-        rotation_extra = get_attribute(element, "rotation-extra", inherit=True)
+        rotation_direction, rotation_extra = get_rotation_settings(element, inherited)
         
         # Set rotation direction
-        if rotation_direction:
-            if rotation_direction.lower() == "cw":
-                # Make sure r is clockwise
-                r = r % (math.pi * 2)
-            elif rotation_direction.lower() == "ccw":
-                # Make r counter-clockwise
-                r = r % (-(math.pi * 2))
+        if rotation_direction == batch.DIRECTION_CW:
+            # Make sure r is clockwise
+            r = r % (math.pi * 2)
+        elif rotation_direction == batch.DIRECTION_CCW:
+            # Make r counter-clockwise
+            r = r % (-(math.pi * 2))
             
         # Set rotation extra
-        if rotation_extra is not None:
-            rotation_extra = int(rotation_extra)
+        if rotation_extra:
             r += (math.pi * 2) * rotation_extra
             
         # Set the rotation
@@ -147,63 +179,100 @@ class Rect(object):
     def r(self):
         return self.rotation
         
+def get_rect_box(element):
+    """Return the untransformed (x, y, width, height) of a <rect> element.
+    """
+    box = []
+    for attrib in ("x", "y", "width", "height"):
+        if element.get(attrib):
+            box.append(float(element.get(attrib)))
+        else:
+            box.append(0)
+    return box
+
+def get_rotation_settings(element, inherited=None):
+    """Return the (direction, extra) rotation settings of a step.
+    
+    direction is one of the `batch.DIRECTION_*` values, and extra is the number
+    of extra full turns, from the 'rotation-direction' and 'rotation-extra'
+    attributes. `inherited` is the attributes dict from `iter_layout_tree`.
+    """
+    if inherited is not None:
+        rotation_direction = inherited.get("rotation-direction")
+        rotation_extra = inherited.get("rotation-extra")
+    else:
+        rotation_direction = get_attribute(element, "rotation-direction", inherit=True)
+        rotation_extra = get_attribute(element, "rotation-extra", inherit=True)
+    
+    direction = batch.DIRECTION_NONE
+    if rotation_direction:
+        if rotation_direction.lower() == "cw":
+            direction = batch.DIRECTION_CW
+        elif rotation_direction.lower() == "ccw":
+            direction = batch.DIRECTION_CCW
+    
+    extra = 0
+    if rotation_extra is not None:
+        extra = int(rotation_extra)
+    
+    return direction, extra
+
 class Transform(object):
-    def __init__(self, matrix=None):
-        if not matrix:
-            matrix = eye(3)
-        self._matrix = matrix
+    __slots__ = ("_affine", )
+    
+    def __init__(self, affine=None):
+        if affine is None:
+            affine = Affine()
+        elif not isinstance(affine, Affine):
+            # Support the old 3x3 `matrix.Matrix` representation
+            affine = Affine.from_matrix(affine)
+        self._affine = affine
         
     def __add__(self, other):
-        return Transform(other._matrix * self._matrix)
+        return Transform(other._affine * self._affine)
+    
+    @property
+    def affine(self):
+        return self._affine
     
     @property
     def dx(self):
-        return self._matrix[(0, 2)]
+        return self._affine.e
     
     @property
     def dy(self):
-        return self._matrix[(1, 2)]
+        return self._affine.f
         
     @property
     def r(self):
-        return matutil.decompose_rotation2(self._matrix.minor(2, 2))
+        return self._affine.decompose_rotation()
         
     @property
     def sx(self):
-        return matutil.decompose_scale(self._matrix.minor(2, 2))[0]
+        return self._affine.decompose_scale()[0]
         
     @property
     def sy(self):
-        return matutil.decompose_scale(self._matrix.minor(2, 2))[1]
+        return self._affine.decompose_scale()[1]
     
 def rotate(x, y, r):
-    rot_mat = rotation_matrix(2, 0, 1, r)
-    vec = x * E_X + y * E_Y
-    vec_tag = rot_mat * vec
-    x = vec_tag[(0, 0)]
-    y = vec_tag[(1, 0)]
-    
-    return x, y
+    return Affine.rotation(r).apply(x, y)
     
     
 def scale_transform(sx, sy):
-    return Transform(scale_matrix(sx, sy, 1))
+    return Transform(Affine.scaling(sx, sy))
     
 def rotation_transform(r):
-    return Transform(rotation_matrix(3, 0, 1, r))
+    return Transform(Affine.rotation(r))
     
 def translate_transform(dx, dy):
-    return Transform(translation_matrix(dx, dy))
+    return Transform(Affine.translation(dx, dy))
 
 def parse_matrix(mat):
     matrix_parts = re.match(TRANSFORM_MATRIX_PAT, mat).groups()
     matrix_parts = [float(part) for part in matrix_parts]
-    a, b, c, d, e, f = matrix_parts
-    matrix = Matrix([[a, c, e],
-                     [b, d, f],
-                     [0,0, 1]])
     
-    return Transform(matrix)
+    return Transform(Affine(*matrix_parts))
 
 def parse_translate(trans):
     translate_parts = re.match(TRANSFORM_TRANSLATE_PAT, trans).groups()
@@ -221,17 +290,22 @@ def parse_scale(scale):
 
 def parse_transform(value):
     """Parse the 'transform=' attribute of SVG tags.
-    Return (r, x, y)
+    Return a Transform. Missing or invalid values give the identity transform.
     """
-    for parser in [parse_translate, parse_matrix, parse_scale]:
-        try:
-            return parser(value)
-        except TypeError:
-            raise
-        except:
-            pass
-    return Transform(eye(3))
+    if value is None:
+        return Transform()
+    try:
+        return Transform(parse_transform_list(value))
+    except ValueError:
+        return Transform()
     
+def _use_numpy(use_numpy, count):
+    if use_numpy is None:
+        return batch.available() and count >= NUMPY_MIN_STEPS
+    if use_numpy and not batch.available():
+        raise ImportError("NumPy is required for the batch path")
+    return use_numpy
+
 def calc_scale(base_width, base_height, width, height):
     width_scale = width / base_width
     height_scale = height / base_height
@@ -245,10 +319,7 @@ def calc_scale(base_width, base_height, width, height):
         return height_scale
     
 def get_element_transform(element):
-    try:
-        return parse_transform(element.get("transform"))
-    except:
-        return Transform()
+    return parse_transform(element.get("transform"))
     
 def is_ancestor(ancestor, decendant):
     if ancestor not in list(decendant.iterancestors()):
@@ -274,6 +345,65 @@ def sum_parent_transform(element, topmost, include_self=True):
             break
     return transform
 
+def register_inherited_attribute(attrib):
+    """Make 'attrib' inherited by steps from their closest ancestor.
+    """
+    if attrib not in INHERITED_ATTRIBUTES:
+        INHERITED_ATTRIBUTES.append(attrib)
+
+def _inherit_attributes(element, parent_attributes, attribs):
+    attributes = parent_attributes
+    for attrib in attribs:
+        value = element.get(attrib)
+        if value is not None:
+            if attributes is parent_attributes:
+                attributes = dict(parent_attributes)
+            attributes[attrib] = value
+    return attributes
+
+def iter_layout_tree(topmost, inherited_attributes=None):
+    """Yield (element, transform, attributes) for `topmost` and all its
+    decendants, in document order.
+    
+    The transform of every element is the sum of its own transform and those
+    of all its ancestors up to (and including) `topmost`, just like
+    `sum_parent_transform`.
+    `attributes` maps each of `inherited_attributes` (by default
+    `INHERITED_ATTRIBUTES`) to its value as `get_attribute(..., inherit=True)`
+    would return it. Elements that set none of them share their parent's dict,
+    so treat it as read-only.
+    
+    Both are computed once per element, from its parent's, in a single
+    top-down pass.
+    """
+    if inherited_attributes is None:
+        inherited_attributes = INHERITED_ATTRIBUTES
+    
+    transform = get_element_transform(topmost)
+    attributes = {}
+    for attrib in inherited_attributes:
+        value = get_attribute(topmost, attrib, inherit=True)
+        if value is not None:
+            attributes[attrib] = value
+    yield topmost, transform, attributes
+    
+    # Depth-first, keeping document order by pushing children in reverse.
+    stack = [(child, transform, attributes) for child in reversed(topmost)]
+    while stack:
+        element, parent_transform, parent_attributes = stack.pop()
+        if not isinstance(element.tag, basestring):
+            # Skip comments and processing instructions
+            continue
+        
+        if element.get("transform") is None:
+            transform = parent_transform
+        else:
+            transform = get_element_transform(element) + parent_transform
+        attributes = _inherit_attributes(element, parent_attributes, inherited_attributes)
+        yield element, transform, attributes
+        
+        stack.extend((child, transform, attributes) for child in reversed(element))
+
 def inherit_attribute(element, attrib, topmost=None):
     """Inherit attribute 'attrib' from closest parent possible.
     """
@@ -293,19 +423,57 @@ def get_attribute(element, attrib, inherit=False, topmost=None):
     else:
         return inherit_attribute(element, attrib, topmost)
     
-def process_layout_layer(layout_layer):
+def calc_scales(base_width, base_height, rects, use_numpy=None):
+    """Return the `calc_scale` value of every rect.
+    
+    use_numpy - True or False to force or disable the NumPy batch path. By
+    default it is used when NumPy is installed and there are many rects.
+    """
+    if _use_numpy(use_numpy, len(rects)):
+        return batch.calc_scales(
+            base_width, base_height,
+            [rect.w for rect in rects],
+            [rect.h for rect in rects],
+            )
+    return [calc_scale(base_width, base_height, rect.w, rect.h) for rect in rects]
+    
+def _process_rects_batch(layout_rects):
+    coefficients = []
+    boxes = []
+    directions = []
+    extras = []
+    for element, transform, attributes in layout_rects:
+        coefficients.append(transform.affine.coefficients)
+        boxes.append(get_rect_box(element))
+        direction, extra = get_rotation_settings(element, attributes)
+        directions.append(direction)
+        extras.append(extra)
+    
+    geometry = batch.rect_geometry(coefficients, boxes, directions, extras)
+    return [
+        Rect(x=x, y=y, w=w, h=h, r=r, id_=(element.get("id") or None)) for
+            (element, _, _), x, y, w, h, r in zip(layout_rects, *geometry)
+        ]
+    
+def process_layout_layer(layout_layer, use_numpy=None):
     # First, we want to get all the rects in the layer
     #BUG: for now, we are assumins that there is only 1 rect per group!
-    rects = layout_layer.xpath(".//rect")
-    
-    # Get the parent-induced transformation for all rects
-    parent_transforms = [sum_parent_transform(rect, layout_layer) for rect in rects]
+    # Get the parent-induced transformation and inherited attributes for all
+    # rects, computing them only once for each group.
+    layout_rects = [
+        (element, transform, attributes) for
+            element, transform, attributes in iter_layout_tree(layout_layer)
+            if element is not layout_layer and element.tag == "rect"
+        ]
     
     # Parse all the rects, and apply transformations
-    rect_objects = [
-        Rect(element=rect, transform=transform) for
-            rect, transform in zip(rects, parent_transforms)
-        ]
+    if _use_numpy(use_numpy, len(layout_rects)):
+        rect_objects = _process_rects_batch(layout_rects)
+    else:
+        rect_objects = [
+            Rect(element=element, transform=transform, inherited=attributes) for
+                element, transform, attributes in layout_rects
+            ]
     
     #TODO: this will be the place to add metadata based filtering!
     
@@ -335,31 +503,103 @@ def get_background_color(svg_root):
     
     return pagecolor
 
-def create_impress(svg_tree):
-    # Get the <svg> node
+def load_svg(source):
+    """Parse an SVG file (a filename or a file-like object) into an ElementTree.
     
-    svg_root = svg_tree.getroot()
+    The file is parsed directly, without reading it into a string first.
+    Tags in the SVG namespace have the namespace removed while they are being
+    parsed, so the rest of the code can use plain tag names ("g", "rect").
+    """
+    svg_prefix = "{%s}" % (SVG_NAMESPACE, )
+    prefix_length = len(svg_prefix)
     
-    # Get all layers (<g> nodes under the <svg> node)
-    # First layer is the graphics, the second is the layout.
-    layers = svg_root.xpath("g")
-    graphics_layer = layers[0]
-    layout_layer = layers[1]
+    # huge_tree is needed for large embedded bitmaps
+    context = etree.iterparse(source, events=("end", ), huge_tree=True)
+    for _, element in context:
+        tag = element.tag
+        if tag.startswith(svg_prefix):
+            element.tag = tag[prefix_length:]
     
-    # Get the page color
-    pagecolor = get_background_color(svg_root)
+    svg_root = context.root
+    # Drop the now unused SVG namespace declarations
+    etree.cleanup_namespaces(svg_root)
+    return svg_root.getroottree()
+
+def layer_label(layer):
+    """The Inkscape label of a layer, or its id if it has none.
+    """
+    return layer.get(INKSCAPE_LABEL) or layer.get("id")
+
+def find_layer(svg_root, label):
+    """Return the layer (<g> node under the <svg> node) with the given
+    Inkscape label (or id). Raise ValueError if there is none.
+    """
+    layers = svg_root.xpath("g")
+    for layer in layers:
+        if layer.get(INKSCAPE_LABEL) == label:
+            return layer
+    for layer in layers:
+        if layer.get("id") == label:
+            return layer
+    raise ValueError("No layer labeled %r (the layers are: %s)" % (
+        label, ", ".join(repr(layer_label(layer)) for layer in layers)))
+
+def get_layers(svg_root, graphics_label=None, layout_label=None):
+    """Return the (graphics, layout) layers of the SVG.
     
-    # Get all the frame-rects from the layout layer, correctly transformed!
-    step_rects_data = process_layout_layer(layout_layer)
+    The layers are selected by their Inkscape label, if given. By default the
+    first layer is the graphics, the second is the layout.
+    """
+    # Get all layers (<g> nodes under the <svg> node)
+    layers = svg_root.xpath("g")
+    if graphics_label is None:
+        graphics_layer = layers[0]
+    else:
+        graphics_layer = find_layer(svg_root, graphics_label)
+    if layout_label is None:
+        layout_layer = layers[1]
+    else:
+        layout_layer = find_layer(svg_root, layout_label)
+    return graphics_layer, layout_layer
+
+def parse_viewport(text):
+    """Parse a viewport profile - "<width>x<height>", optionally prefixed
+    with "<name>=". Raise ValueError if invalid.
+    """
+    name, sep, size = text.rpartition("=")
+    width, sep, height = size.partition("x")
+    try:
+        width = int(width)
+        height = int(height)
+    except ValueError:
+        raise ValueError("Invalid viewport %r, expected [<name>=]<width>x<height>" % (text, ))
+    if width <= 0 or height <= 0:
+        raise ValueError("Invalid viewport size %r" % (text, ))
+    return Viewport(name or size, width, height)
+
+def step_scales(step_rects_data, use_numpy=None, viewport=None):
+    """Return the scale of every step, for the Viewport (by default 900x600).
+    """
+    if viewport is None:
+        viewport = DEFAULT_VIEWPORT
+    return calc_scales(float(viewport.width), float(viewport.height), step_rects_data, use_numpy)
+
+def build_step_divs(step_rects_data, use_numpy=None, precision=None, viewport=None):
+    """Create a <div> from each layout `Rect`.
     
-    # Set sizes for scaling
-    base_width = BASE_WIDTH
-    base_height = BASE_HEIGHT
+    precision - round the step positions, rotations and scales to this many
+    decimal digits, None to keep them as they are.
+    viewport - the Viewport the steps are scaled for, by default 900x600.
+    """
+    if precision is None:
+        format_number = format_scale = str
+    else:
+        format_number = lambda value: minify.format_number(value, precision)
+        format_scale = lambda value: minify.format_scale(value, precision)
     
-    # Create a <div> from each layout <rect>
     divs = []
-    for data in step_rects_data:
-        scale = calc_scale(base_width, base_height, data.w, data.h)
+    scales = step_scales(step_rects_data, use_numpy, viewport)
+    for data, scale in zip(step_rects_data, scales):
         rotate = data.r
         # Here we add the location of the layout layer to compensate for
         # its translations.
@@ -367,86 +607,1298 @@ def create_impress(svg_tree):
         x = data.x
         y = data.y
         div = etree.Element("div")
-        div.set("data-scale",str(scale))
-        div.set("data-rotate", str(rotate))
-        div.set("data-x", str(x))
-        div.set("data-y", str(y))
+        div.set("data-scale", format_scale(scale))
+        div.set("data-rotate", format_number(rotate))
+        div.set("data-x", format_number(x))
+        div.set("data-y", format_number(y))
         div.set("class", "step")
         div.set("id", data.id)
         # Add empty data - cause we have to...
+        # The size in pixels is truncated, but not rounding errors: a step as
+        # wide as the viewport may come out as 899.9999999999 pixels.
+        size = (int(round(data.w / scale, 6)), int(round(data.h / scale, 6)))
         # Don't make a clickable span for the overview
         if data.id != ID_OVERVIEW:
-            span = etree.Element("span", style="width:%dpx;height:%dpx;display:block" % (data.w / scale, data.h / scale, ))
+            span = etree.Element("span", style="width:%dpx;height:%dpx;display:block" % size)
         else:
-            span = etree.Element("span", style="width:%dpx;height:%dpx;" % (data.w / scale, data.h / scale, ))
+            span = etree.Element("span", style="width:%dpx;height:%dpx;" % size)
         span.text = " "
         div.append(span)
         divs.append(div)
-        
-    # Wrap the graphics layer in a <div> tag, use the width and height of the <svg> tag.
+    
+    return divs
+
+def build_graphics_svg(svg_root, graphics_layer):
+    """Wrap the graphics layer in an <svg> tag, use the width and height of
+    the source <svg> tag.
+    """
     graphics_wrapper_text = (
         '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" width="%s" height="%s"></svg>' %
          (svg_root.get("width"), svg_root.get("height"))
          )
     graphics_div = etree.fromstring(graphics_wrapper_text)
     graphics_div.append(graphics_layer)
+    return graphics_div
+
+def _asset_re(target_html):
+    stem = os.path.splitext(os.path.basename(target_html))[0]
+    return re.compile(r"(%s\.(graphics|image|chunk)\.[0-9a-f]{%d}\.\w+|%s)(\.gz)?$" % (
+        re.escape(stem), ASSET_HASH_LENGTH, re.escape(os.path.basename(target_html) + compress.SUFFIX)))
+
+def page_assets(target_html):
+    """Return the paths of the assets of target_html - the files written next
+    to it (see `write_asset`), and its compressed copy.
+    """
+    directory = os.path.dirname(os.path.abspath(target_html))
+    asset_re = _asset_re(target_html)
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if asset_re.match(name))
+
+def remove_page_assets(target_html, keep=()):
+    """Remove the assets of target_html, except `keep` (file names).
+    """
+    for path in page_assets(target_html):
+        if os.path.basename(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def remove_compressed_copy(target_html):
+    """Remove the compressed copy of target_html, left by a previous
+    conversion with gzip_level.
+    """
+    try:
+        os.remove(target_html + compress.SUFFIX)
+    except OSError:
+        pass
+
+def write_asset(content, target_html, kind, extension, gzip_level=None):
+    """Write content into a file next to target_html, named after the page,
+    the kind of asset and a hash of the content - so it can be cached by
+    browsers for as long as it does not change. With gzip_level, a
+    gzip-compressed copy (.gz) is written too.
     
-    # Put all <div>s in a nice HTML page
+    Return the names of the written files, the uncompressed one first. It is
+    also the href of the file, relative to target_html.
+    """
+    digest = hashlib.sha1(content).hexdigest()[:ASSET_HASH_LENGTH]
+    stem = os.path.splitext(os.path.basename(target_html))[0]
+    name = "%s.%s.%s.%s" % (stem, kind, digest, extension)
+    directory = os.path.dirname(os.path.abspath(target_html))
     
-    # Build the HTML template
-    base_html_text = """\
-<html>
-    <head>
-    </head>
-    <body>
+    path = os.path.join(directory, name)
+    with open(path, "wb") as asset:
+        asset.write(content)
+    written = [name]
+    stats.count("asset_bytes", len(content))
+    if gzip_level is not None:
+        compressed_size = compress.write_compressed(path + compress.SUFFIX, content, gzip_level)
+        written.append(name + compress.SUFFIX)
+        stats.count("gzip_bytes", compressed_size)
+    return written
+
+def write_graphics_asset(graphics, target_html, gzip_level=None):
+    """Write the serialized graphics <svg> into a standalone SVG asset of
+    target_html (see `write_asset`).
     
-        <div id="impress">
-        </div>
+    Return the names of the written files.
+    """
+    content = '<?xml version="1.0" encoding="UTF-8"?>\n' + graphics
+    return write_asset(content, target_html, "graphics", "svg", gzip_level)
+
+def image_writer(target_html, written, gzip_level=None):
+    """Return a function writing extracted images as assets of target_html,
+    for `dedup.dedup_graphics`. The names of the files are added to the
+    `written` list. With gzip_level, SVG images get a compressed copy too
+    (the other formats are compressed already).
+    """
+    def write_image(data, extension):
+        names = write_asset(data, target_html, "image", extension,
+                            gzip_level if extension == "svg" else None)
+        written.extend(names)
+        return names[0]
+    return write_image
+
+def build_graphics_reference(graphics_div, href):
+    """Create an <img> showing the externalized graphics, in place of the
+    graphics <svg> element.
+    """
+    return etree.Element("img", OrderedDict([
+        ("src", href),
+        ("width", graphics_div.get("width")),
+        ("height", graphics_div.get("height")),
+        ("alt", ""),
+        ]))
+
+def process_graphics(graphics_layer, step_rects_data, cull=False, precision=None,
+                     strip_editor_data=False, dedup_graphics=False,
+                     write_image=None, extract_min_bytes=0):
+    """Process the graphics layer in place, see `build_impress` for the
+    options. step_rects_data are the `Rect`s of all the steps that show the
+    graphics.
     
-        <script type="text/javascript" src="js/impress.js">;</script>
-    </body>
-</html>\
-"""
-    base_html = etree.fromstring(base_html_text)
+    Return the CullResult, None if not culling.
+    """
+    culled = None
+    if cull:
+        with stats.stage("culling"):
+            culled = culling.cull_graphics(graphics_layer, step_rects_data)
+        stats.count("culled_nodes", culled.nodes)
+    
+    if precision is not None or strip_editor_data:
+        with stats.stage("minify"):
+            removed = minify.minify_graphics(graphics_layer, precision, strip_editor_data, strip_editor_data)
+        stats.count("stripped_nodes", removed)
+    
+    if dedup_graphics:
+        with stats.stage("dedup"):
+            deduped = dedup.dedup_graphics(graphics_layer, write_image, extract_min_bytes)
+        stats.count("merged_definitions", deduped.definitions)
+        stats.count("shared_images", deduped.images)
+        stats.count("extracted_images", deduped.extracted)
+    return culled
+
+def add_detail_levels(graphics_layer, step_rects_data, pixels, use_numpy=None, viewport=None):
+    """Add simplified copies of the paths in graphics_layer for the steps
+    that are zoomed out (see `lod`), within `pixels` pixels of the Viewport.
+    
+    Return the style sheets switching between them, by the active step.
+    """
+    with stats.stage("lod"):
+        scales = step_scales(step_rects_data, use_numpy, viewport)
+        levels = lod.detail_levels([(rect.id, scale) for rect, scale in zip(step_rects_data, scales)],
+                                   pixels, (ID_OVERVIEW, ))
+        simplified = lod.add_detail_levels(graphics_layer, levels)
+    stats.count("lod_levels", len(levels))
+    stats.count("lod_paths", simplified)
+    if not levels:
+        return []
+    return [lod.level_style(levels)]
+
+def build_impress(svg_tree, use_numpy=None, cull=False, precision=None, strip_editor_data=False,
+                  dedup_graphics=False, write_image=None, extract_min_bytes=0,
+                  graphics_label=None, layout_label=None, viewport=None, lazy_graphics=False,
+                  lod_pixels=None):
+    """Convert the parsed SVG into the parts of the impress.js page.
+    
+    cull - remove graphics that are not visible in any step (see `culling`).
+    precision - round the step attributes and the graphics path data to this
+    many decimal digits (see `minify`), None to keep them as they are.
+    strip_editor_data - remove Inkscape/Sodipodi data, metadata and
+    indentation from the graphics.
+    dedup_graphics - merge repeated definitions and embedded images (see
+    `dedup`). With write_image, embedded images of at least
+    extract_min_bytes are extracted into files too.
+    graphics_label, layout_label - the labels of the graphics and layout
+    layers (see `get_layers`).
+    viewport - the Viewport to scale the steps for.
+    lazy_graphics - move the graphics that are not visible in the first step
+    out of the graphics layer, into chunks (see `chunking`).
+    lod_pixels - add simplified copies of the paths, within this many window
+    pixels, for the zoomed out steps (see `lod`). None for no copies.
+    
+    Return ImpressParts: the page background color, a <div> element for every
+    step, an <svg> element wrapping the graphics layer, the CullResult
+    (None if not culling), the SplitGraphics (None if not lazy_graphics) and
+    the style sheets of the page.
+    """
+    # Get the <svg> node
+    svg_root = svg_tree.getroot()
+    
+    graphics_layer, layout_layer = get_layers(svg_root, graphics_label, layout_label)
+    
+    # Get the page color
+    with stats.stage("background_color"):
+        pagecolor = get_background_color(svg_root)
+    
+    # Get all the frame-rects from the layout layer, correctly transformed!
+    with stats.stage("process_layout_layer"):
+        step_rects_data = process_layout_layer(layout_layer, use_numpy)
+    stats.count("rects", len(step_rects_data))
+    
+    culled = process_graphics(graphics_layer, step_rects_data, cull, precision, strip_editor_data,
+                              dedup_graphics, write_image, extract_min_bytes)
+    styles = []
+    if lod_pixels is not None:
+        styles.extend(add_detail_levels(graphics_layer, step_rects_data, lod_pixels,
+                                        use_numpy, viewport))
+    chunks = None
+    if lazy_graphics:
+        with stats.stage("chunking"):
+            chunks = chunking.split_graphics(graphics_layer, step_rects_data)
+        stats.count("graphics_chunks", len(chunks.files))
+    
+    with stats.stage("step_divs"):
+        divs = build_step_divs(step_rects_data, use_numpy, precision, viewport)
+    with stats.stage("graphics_wrapping"):
+        graphics_div = build_graphics_svg(svg_root, graphics_layer)
+    
+    return ImpressParts(pagecolor, divs, graphics_div, culled, chunks, styles)
+
+def write_page(output, pagecolor, divs, graphics, pretty_print=True, scripts=(), styles=()):
+    """Write the impress.js page into `output`, a filename or a file-like
+    object opened for writing bytes.
+    
+    divs are the step <div> elements. graphics is the graphics <svg> element,
+    or its serialized bytes (output must be a file-like object then).
+    scripts are HTML <script> elements (bytes) to add before impress.js
+    (output must be a file-like object too). styles are CSS style sheets.
     
+    The page is serialized one element at a time, so only a single step (or
+    the graphics) is ever held as serialized text.
+    """
+    def newline(level):
+        if pretty_print:
+            xf.write("\n" + "    " * level)
+    
+    body_attrib = {}
     # Add background color
     if pagecolor:
-        body_tag = base_html.xpath("body")[0]
-        body_tag.set("style", "background-color:%s;" % (pagecolor, ))
+        body_attrib["style"] = "background-color:%s;" % (pagecolor, )
+    
+    with etree.xmlfile(output) as xf:
+        # Don't forget the <!doctype html> !
+        xf.write_doctype("<!doctype html>")
+        with xf.element("html"):
+            newline(1)
+            with xf.element("head"):
+                for style in styles:
+                    newline(2)
+                    with xf.element("style", type="text/css"):
+                        xf.write(style)
+                newline(1)
+            newline(1)
+            with xf.element("body", body_attrib):
+                newline(2)
+                with xf.element("div", id="impress"):
+                    # All layout <div> nodes go into the impress one
+                    for div in divs:
+                        newline(3)
+                        xf.write(div)
+                    
+                    # The graphics <div> too
+                    newline(3)
+                    if isinstance(graphics, bytes):
+                        xf.flush()
+                        output.write(graphics)
+                    else:
+                        xf.write(graphics)
+                    newline(2)
+                newline(2)
+                for script in scripts:
+                    xf.flush()
+                    output.write(script)
+                    newline(2)
+                script_attrib = OrderedDict([("type", "text/javascript"), ("src", "js/impress.js")])
+                with xf.element("script", script_attrib):
+                    xf.write(";")
+                newline(1)
+            newline(0)
+
+@contextmanager
+def open_output(output, gzip_level=None, target_html=None):
+    """Open output (a filename or a file-like object opened for writing
+    bytes) for writing a page.
+    
+    With gzip_level, the yielded file-like object also writes a
+    gzip-compressed copy into target_html + ".gz", in the same pass. Without
+    it, a compressed copy left by a previous conversion is removed.
+    target_html defaults to output, if it is a filename.
+    """
+    if isinstance(output, basestring):
+        if target_html is None:
+            target_html = output
+        with open(output, "wb") as opened:
+            with open_output(opened, gzip_level, target_html) as writer:
+                yield writer
+        return
+    
+    if gzip_level is None:
+        if target_html is not None:
+            remove_compressed_copy(target_html)
+        yield output
+        return
+    if target_html is None:
+        raise ValueError("Compressing needs the path of the page")
+    with open(target_html + compress.SUFFIX, "wb") as compressed_output:
+        writer = compress.GzipTee(output, compressed_output, gzip_level)
+        yield writer
+        writer.close()
+        stats.count("gzip_bytes", writer.bytes_out)
+
+def write_impress(svg_tree, output, pretty_print=True, use_numpy=None, cull=False,
+                  precision=None, strip_editor_data=False,
+                  external_graphics=False, dedup_graphics=False, extract_images=None,
+                  gzip_level=None, graphics_label=None, layout_label=None, viewport=None,
+                  lazy_graphics=False, lod_pixels=None, target_html=None):
+    """Write the impress.js page for the parsed SVG into `output`, a filename
+    or a file-like object opened for writing bytes.
+    
+    external_graphics - write the graphics into a separate SVG file next to
+    the page (see `write_graphics_asset`), instead of inlining them.
+    dedup_graphics - merge repeated definitions and embedded images.
+    extract_images - extract embedded images of at least this many bytes
+    into files next to the page, None to keep them embedded. Implies
+    dedup_graphics.
+    gzip_level - also write gzip-compressed copies (.gz) of the page and the
+    files next to it, with this compression level. None for no copies.
+    graphics_label, layout_label, viewport - see `build_impress`.
+    lazy_graphics - write the graphics that are not visible in the first
+    step into files next to the page, loaded by a script when their steps
+    are shown (see `chunking`).
+    lod_pixels - see `build_impress`.
+    target_html - the path of the page, if output is a file-like object.
     
-    # Get the impress <div>
-    impress_div = base_html.xpath("//div")[0]
+    The assets of the page (the files written next to it) of previous
+    conversions are removed.
     
-    # Append all layout <div> nodes into the impress one
-    for div in divs:
-        impress_div.append(div)
+    Return the CullResult if culling, None otherwise.
+    """
+    if external_graphics and extract_images is not None:
+        # Images inside an SVG shown by <img> can't load other files
+        raise ValueError("Can't extract images from external graphics")
+    if external_graphics and lazy_graphics:
+        raise ValueError("Can't load external graphics lazily")
+    writes_assets = (external_graphics or extract_images is not None or gzip_level is not None or
+                     lazy_graphics)
+    if writes_assets and target_html is None:
+        if not isinstance(output, basestring):
+            raise ValueError("Writing assets needs the path of the page")
+        target_html = output
+    
+    assets = []
+    write_image = None
+    if extract_images is not None:
+        write_image = image_writer(target_html, assets, gzip_level)
+    pagecolor, divs, graphics_div, culled, chunks, styles = build_impress(
+        svg_tree, use_numpy, cull, precision, strip_editor_data,
+        dedup_graphics or extract_images is not None, write_image, extract_images or 0,
+        graphics_label, layout_label, viewport, lazy_graphics, lod_pixels)
+    scripts = []
+    if chunks is not None and chunks.files:
+        with stats.stage("chunk_assets"):
+            urls = []
+            for content in chunks.files:
+                written = write_asset(content, target_html, "chunk", "svg", gzip_level)
+                assets.extend(written)
+                urls.append(written[0])
+            scripts.append(chunking.loader_script(urls, chunks.steps))
+    if external_graphics:
+        with stats.stage("graphics_asset"):
+            written = write_graphics_asset(etree.tostring(graphics_div), target_html, gzip_level)
+            assets.extend(written)
+            graphics_div = build_graphics_reference(graphics_div, written[0])
+    if writes_assets:
+        remove_page_assets(target_html, keep=assets)
+    with stats.stage("serialization"):
+        with open_output(output, gzip_level, target_html) as writer:
+            write_page(writer, pagecolor, divs, graphics_div, pretty_print, scripts, styles)
+    return culled
+
+def file_name_parts(names):
+    """Return a part of a file name for each of the names - with the
+    characters that don't belong in file names replaced, and a number added
+    to the names that would be the same after that.
+    """
+    parts = []
+    used = set()
+    for name in names:
+        part = re.sub(r"[^\w.-]+", "_", name)
+        unique = part
+        number = 2
+        while unique in used:
+            unique = "%s-%d" % (part, number)
+            number += 1
+        used.add(unique)
+        parts.append(unique)
+    return parts
+
+def variant_targets(target_html, layouts, viewports):
+    """Return a Variant for every combination of the layout labels and the
+    viewports.
+    
+    The target of each variant is target_html, with the layout label and the
+    viewport name added to the file name (when there's more than one of them).
+    Labels that would give the same file name are numbered.
+    """
+    base, extension = os.path.splitext(target_html)
+    layout_parts = file_name_parts([layout or "default" for layout in layouts])
+    viewport_parts = file_name_parts([viewport.name for viewport in viewports])
+    variants = []
+    for layout, layout_part in zip(layouts, layout_parts):
+        for viewport, viewport_part in zip(viewports, viewport_parts):
+            parts = [base]
+            if len(layouts) > 1:
+                parts.append(layout_part)
+            if len(viewports) > 1:
+                parts.append(viewport_part)
+            variants.append(Variant(layout, viewport, "-".join(parts) + extension))
+    return variants
+
+def write_variants(svg_tree, variants, pretty_print=True, use_numpy=None, cull=False,
+                   precision=None, strip_editor_data=False, external_graphics=False,
+                   dedup_graphics=False, gzip_level=None, graphics_label=None):
+    """Write a page for each Variant (layout layer, viewport and target HTML
+    path) of the parsed SVG.
+    
+    The graphics are shared by all the pages, so they are processed and
+    serialized once. When culling, graphics visible in any of the layouts
+    are kept. Each layout is processed once, however many viewports it has.
+    See `write_impress` for the options.
+    
+    Return the CullResult if culling, None otherwise.
+    """
+    svg_root = svg_tree.getroot()
+    graphics_layer = get_layers(svg_root, graphics_label)[0]
+    with stats.stage("background_color"):
+        pagecolor = get_background_color(svg_root)
+    
+    layouts = OrderedDict()
+    with stats.stage("process_layout_layer"):
+        for variant in variants:
+            if variant.layout not in layouts:
+                layout_layer = get_layers(svg_root, graphics_label, variant.layout)[1]
+                layouts[variant.layout] = process_layout_layer(layout_layer, use_numpy)
+    all_rects = [rect for rects in layouts.itervalues() for rect in rects]
+    stats.count("rects", len(all_rects))
+    
+    culled = process_graphics(graphics_layer, all_rects, cull, precision, strip_editor_data,
+                              dedup_graphics)
+    with stats.stage("graphics_wrapping"):
+        graphics_div = build_graphics_svg(svg_root, graphics_layer)
+        graphics = etree.tostring(graphics_div)
+    
+    step_divs = {}
+    for variant in variants:
+        key = (variant.layout, variant.viewport)
+        if key not in step_divs:
+            with stats.stage("step_divs"):
+                step_divs[key] = build_step_divs(layouts[variant.layout], use_numpy, precision,
+                                                 variant.viewport)
+        page_graphics = graphics
+        assets = []
+        if external_graphics:
+            with stats.stage("graphics_asset"):
+                assets = write_graphics_asset(graphics, variant.target, gzip_level)
+                page_graphics = etree.tostring(build_graphics_reference(graphics_div, assets[0]))
+        if external_graphics or gzip_level is not None:
+            remove_page_assets(variant.target, keep=assets)
+        with stats.stage("serialization"):
+            with open_output(variant.target, gzip_level) as writer:
+                write_page(writer, pagecolor, step_divs[key], page_graphics, pretty_print)
+    return culled
+
+class IncrementalConverter(object):
+    """Converts the same source over and over, redoing only the stages whose
+    input changed since the last conversion.
+    
+    The parsed source is kept between conversions, and only the top-level
+    elements whose bytes changed are parsed again (see `segments`). The steps
+    are rebuilt only when the bytes of the layout layer changed, and the
+    graphics are reprocessed and serialized only when the bytes of the
+    graphics layer changed (or, when culling, of the layout too).
+    
+    scripts are HTML <script> elements (bytes) to add to the page, see
+    `write_page`. The other options are those of `write_impress`.
+    """
+    def __init__(self, use_numpy=None, cull=False, pretty_print=True,
+                 precision=None, strip_editor_data=False,
+                 external_graphics=False, dedup_graphics=False, extract_images=None,
+                 gzip_level=None, graphics_label=None, layout_label=None, viewport=None,
+                 lod_pixels=None, scripts=()):
+        self._use_numpy = use_numpy
+        self._cull = cull
+        self._pretty_print = pretty_print
+        self._precision = precision
+        self._strip_editor_data = strip_editor_data
+        self._external_graphics = external_graphics
+        self._gzip_level = gzip_level
+        self._dedup_graphics = dedup_graphics or extract_images is not None
+        self._extract_images = extract_images
+        self._graphics_label = graphics_label
+        self._layout_label = layout_label
+        self._viewport = viewport
+        self._lod_pixels = lod_pixels
+        self._scripts = list(scripts)
+        if external_graphics and extract_images is not None:
+            raise ValueError("Can't extract images from external graphics")
+        # The bytes and the Segments (None if it can't be split) of the last
+        # source, and its parsed top-level elements. An element is None once
+        # it's processed (modified), it's parsed again if needed.
+        self._source = None
+        self._segments = None
+        self._elements = None
+        # An <svg> element like the source's, with a copy of each top-level
+        # element without its content - for finding the layers
+        self._outline = None
+        # (key, rects, divs) of the last layout
+        self._layout = None
+        # (key, serialized graphics, CullResult, styles) of the last graphics
+        self._graphics = None
+        # The background color of the last page
+        self._pagecolor = None
+    
+    @staticmethod
+    def _read(source_svg):
+        if isinstance(source_svg, basestring):
+            with open(source_svg, "rb") as source:
+                return source.read()
+        return source_svg.read()
+    
+    @staticmethod
+    def _parse_element(source, found, index):
+        """Parse the top-level element at index of the source, split into the
+        Segments found.
+        """
+        text = segments.element_source(source, found, index)
+        return load_svg(BytesIO(text)).getroot()[0]
+    
+    @staticmethod
+    def _outline_element(element):
+        return etree.Element(element.tag, element.attrib, nsmap=element.nsmap)
+    
+    def _load(self, source):
+        """Update the parsed source to the source bytes, parsing only the
+        top-level elements that changed.
+        """
+        update = None
+        if self._segments is not None:
+            update = segments.update_segments(self._source, self._segments, source)
+        if update is None:
+            svg_root = load_svg(BytesIO(source)).getroot()
+            elements = [child for child in svg_root if isinstance(child.tag, basestring)]
+            found = segments.split_source(source)
+            if found is not None and len(found.ranges) != len(elements):
+                found = None
+            self._outline = self._outline_element(svg_root)
+            self._outline.extend(self._outline_element(element) for element in elements)
+            self._source, self._segments, self._elements = source, found, elements
+            return
         
-    # Append the graphics <div> too
-    impress_div.append(graphics_div)
+        # Parse all of them before changing anything, the source may be invalid
+        found, changed = update
+        parsed = [(index, self._parse_element(source, found, index)) for index in changed]
+        self._source, self._segments = source, found
+        for index, element in parsed:
+            self._elements[index] = element
+            self._outline[index] = self._outline_element(element)
+    
+    def _element(self, index):
+        """The top-level element at index, as it is in the source.
+        """
+        if self._elements[index] is None:
+            self._elements[index] = self._parse_element(self._source, self._segments, index)
+        return self._elements[index]
+    
+    def _key(self, index):
+        """The source bytes of the top-level element at index, None if
+        unknown.
+        """
+        if self._segments is None:
+            return None
+        start, end = self._segments.ranges[index]
+        return buffer(self._source, start, end - start)
+    
+    def convert(self, source_svg, output):
+        """Convert source_svg (a filename or a file-like object) into output -
+        a filename or a file-like object opened for writing bytes (a filename
+        with external graphics).
+        
+        Return (layout_rebuilt, graphics_rebuilt).
+        """
+        writes_assets = (self._external_graphics or self._extract_images is not None or
+                         self._gzip_level is not None)
+        if writes_assets and not isinstance(output, basestring):
+            raise ValueError("Writing assets needs the path of the page")
+        source = self._read(source_svg)
+        if source == self._source:
+            self._write(output)
+            return False, False
+        
+        self._load(source)
+        try:
+            rebuilt = self._rebuild(output, writes_assets)
+        except:
+            # Start over with the next conversion
+            self._source = self._segments = None
+            raise
+        self._write(output)
+        return rebuilt
+    
+    def _rebuild(self, output, writes_assets):
+        outline = self._outline
+        graphics_outline, layout_outline = get_layers(outline, self._graphics_label,
+                                                      self._layout_label)
+        graphics_index, layout_index = outline.index(graphics_outline), outline.index(layout_outline)
+        self._pagecolor = get_background_color(outline)
+        
+        layout_key = self._key(layout_index)
+        layout_rebuilt = (self._layout is None or layout_key is None or
+                          self._layout[0] != layout_key)
+        if layout_rebuilt:
+            rects = process_layout_layer(self._element(layout_index), self._use_numpy)
+            divs = build_step_divs(rects, self._use_numpy, self._precision, self._viewport)
+            self._layout = (layout_key, rects, divs)
+        rects = self._layout[1]
+        
+        graphics_key = self._key(graphics_index)
+        uses_layout = self._cull or self._lod_pixels is not None
+        if graphics_key is not None and not (uses_layout and layout_key is None):
+            graphics_key = (graphics_key, outline.get("width"), outline.get("height"),
+                            layout_key if uses_layout else None)
+        else:
+            graphics_key = None
+        graphics_rebuilt = (self._graphics is None or graphics_key is None or
+                            self._graphics[0] != graphics_key)
+        if graphics_rebuilt:
+            graphics_layer = self._element(graphics_index)
+            # Processed in place, parsed again when needed
+            self._elements[graphics_index] = None
+            self._graphics = (graphics_key, ) + self._process_graphics(
+                graphics_layer, rects, output, writes_assets)
+        return layout_rebuilt, graphics_rebuilt
+    
+    def _process_graphics(self, graphics_layer, rects, output, writes_assets):
+        """Return the serialized graphics, the CullResult and the styles.
+        """
+        assets = []
+        write_image = None
+        if self._extract_images is not None:
+            write_image = image_writer(output, assets, self._gzip_level)
+        culled = process_graphics(
+            graphics_layer, rects, self._cull, self._precision, self._strip_editor_data,
+            self._dedup_graphics, write_image, self._extract_images or 0)
+        styles = []
+        if self._lod_pixels is not None:
+            styles = add_detail_levels(graphics_layer, rects, self._lod_pixels,
+                                       self._use_numpy, self._viewport)
+        graphics_div = build_graphics_svg(self._outline, graphics_layer)
+        graphics = etree.tostring(graphics_div)
+        if self._external_graphics:
+            written = write_graphics_asset(graphics, output, self._gzip_level)
+            assets.extend(written)
+            graphics = etree.tostring(build_graphics_reference(graphics_div, written[0]))
+        if writes_assets:
+            remove_page_assets(output, keep=assets)
+        return graphics, culled, styles
+    
+    def _write(self, output):
+        with open_output(output, self._gzip_level) as writer:
+            write_page(writer, self._pagecolor, self._layout[2], self._graphics[1],
+                       self._pretty_print, self._scripts, self._graphics[3])
+
+def _source_stat(path):
+    """The (mtime, size) of path, for detecting changes. None if missing.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+def watch(source_svg, target_html, interval=0.2, **options):
+    """Convert source_svg into target_html whenever it changes, until
+    interrupted.
+    
+    The source is polled for changes every `interval` seconds. options are
+    passed to `IncrementalConverter`.
+    """
+    converter = IncrementalConverter(**options)
+    last_stat = None
+    print "Watching %s (Ctrl+C to stop)" % (source_svg, )
+    try:
+        while True:
+            stat = _source_stat(source_svg)
+            if stat is not None and stat != last_stat:
+                last_stat = stat
+                start = time.time()
+                try:
+                    layout_rebuilt, graphics_rebuilt = converter.convert(source_svg, target_html)
+                except Exception as e:
+                    # Probably saved in the middle of writing. Wait for the next save.
+                    print "Conversion failed: %s" % (e, )
+                else:
+                    reused = [name for name, rebuilt in
+                        (("layout", layout_rebuilt), ("graphics", graphics_rebuilt)) if not rebuilt]
+                    print "Converted in %.0fms%s" % (
+                        (time.time() - start) * 1000,
+                        " (reused %s)" % (", ".join(reused), ) if reused else "")
+            
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+# Injected into served pages, reloads the page when the server says so.
+LIVE_RELOAD_SCRIPT = """\
+<script type="text/javascript">
+new EventSource("/__reload").onmessage = function () { location.reload(); };
+</script>
+"""
+
+class _PreviewState(object):
+    """The current page of the preview server, updated by a watcher thread.
+    
+    The page is converted by an `IncrementalConverter`, which keeps the
+    parsed source between the updates.
+    """
+    def __init__(self, source_svg, **options):
+        self.source_svg = source_svg
+        self.page = None
+        self.error = None
+        self.version = 0
+        self.changed = threading.Condition()
+        self._converter = IncrementalConverter(scripts=[LIVE_RELOAD_SCRIPT], **options)
+    
+    def update(self):
+        """Convert the source again. The browsers reload only if the page
+        changed (or the conversion failed).
+        
+        Return the formatted traceback if the conversion failed, None
+        otherwise.
+        """
+        output = BytesIO()
+        try:
+            self._converter.convert(self.source_svg, output)
+        except Exception:
+            error = traceback.format_exc()
+            page = None
+        else:
+            error = None
+            page = output.getvalue()
+        
+        with self.changed:
+            if error is None and self.error is None and page == self.page:
+                # Saved without changes
+                return None
+            if page is not None:
+                self.page = page
+            self.error = error
+            self.version += 1
+            self.changed.notify_all()
+        return error
+    
+    def wait_for_change(self, version, timeout):
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout)
+            return self.version
+
+class _PreviewHandler(BaseHTTPServer.BaseHTTPRequestHandler, object):
+    # Set by `serve`
+    state = None
+    impress_js = None
     
-    # String-ize the result and return it
-    # Don't forget the <!doctype html> !
-    result_text = "<!doctype html>\n" + etree.tostring(base_html, pretty_print=True)
-    return result_text
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/index.html"):
+            self._send_page()
+        elif path == "/js/impress.js":
+            self._send_impress_js()
+        elif path == "/__reload":
+            self._send_reload_events()
+        else:
+            self.send_error(404)
+    
+    def _send(self, content, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(content)
+    
+    def _send_page(self):
+        page, error = self.state.page, self.state.error
+        if page is None:
+            self.send_error(500, "Conversion failed")
+            if error:
+                self.wfile.write(error)
+            return
+        self._send(page, "text/html")
+    
+    def _send_impress_js(self):
+        if self.impress_js is None:
+            self.send_error(404, "impress.js not found - use --impress-js")
+            return
+        with open(self.impress_js, "rb") as script:
+            self._send(script.read(), "application/javascript")
+    
+    def _send_reload_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        version = self.state.version
+        try:
+            while True:
+                new_version = self.state.wait_for_change(version, 15)
+                if new_version == version:
+                    # Keep the connection alive
+                    self.wfile.write(": ping\n\n")
+                else:
+                    version = new_version
+                    self.wfile.write("data: reload\n\n")
+                self.wfile.flush()
+        except socket.error:
+            # The browser went away
+            pass
+    
+    def log_message(self, format, *args):
+        pass
+
+class _PreviewServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def find_impress_js(source_svg):
+    """Look for js/impress.js next to the source SVG, in the current
+    directory and next to this script.
+    """
+    for base in (os.path.dirname(os.path.abspath(source_svg)), os.getcwd(),
+                 os.path.dirname(os.path.abspath(__file__))):
+        path = os.path.join(base, "js", "impress.js")
+        if os.path.isfile(path):
+            return path
+    return None
+
+def serve(source_svg, port=8000, impress_js=None, interval=0.2, **options):
+    """Serve a live preview of source_svg on http://localhost:port/, until
+    interrupted.
+    
+    The page is converted in memory and served with impress.js. Whenever the
+    source changes, it is converted again (parsing and processing only what
+    changed, see `IncrementalConverter`) and the browser reloads.
+    
+    impress_js - the path of impress.js (default: see `find_impress_js`).
+    options are passed to `IncrementalConverter`.
+    """
+    if impress_js is None:
+        impress_js = find_impress_js(source_svg)
+        if impress_js is None:
+            print "Warning: js/impress.js not found, use --impress-js"
+    
+    state = _PreviewState(source_svg, **options)
+    handler = type("PreviewHandler", (_PreviewHandler, ), dict(state=state, impress_js=impress_js))
+    server = _PreviewServer(("127.0.0.1", port), handler)
+    
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    print "Serving %s on http://localhost:%d/ (Ctrl+C to stop)" % (source_svg, server.server_address[1])
+    
+    last_stat = None
+    try:
+        while True:
+            stat = _source_stat(source_svg)
+            if stat is not None and stat != last_stat:
+                last_stat = stat
+                start = time.time()
+                error = state.update()
+                if error is None:
+                    print "Converted in %.0fms" % ((time.time() - start) * 1000, )
+                else:
+                    print "Conversion failed:\n%s" % (error, )
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def create_impress(svg_tree, use_numpy=None, pretty_print=True, cull=False,
+                   precision=None, strip_editor_data=False):
+    """Return the impress.js page for the parsed SVG, as a string.
+    """
+    output = BytesIO()
+    write_impress(svg_tree, output, pretty_print, use_numpy, cull, precision, strip_editor_data)
+    result = output.getvalue()
+    stats.count("output_bytes", len(result))
+    return result
+
+def _writes_assets(options):
+    return (options.get("external_graphics") or options.get("extract_images") is not None or
+            options.get("gzip_level") is not None or options.get("lazy_graphics"))
+
+def convert_file(source_svg, target_html, **options):
+    """Convert a single SVG file into an impress.js HTML file.
+    
+    options are passed on to `write_impress`. Return its result.
+    """
+    with stats.stage("parse"):
+        svg_tree = load_svg(source_svg)
+    options = dict(options, target_html=target_html)
+    with open(target_html, "wb") as target:
+        result = write_impress(svg_tree, target, **options)
+    stats.count("output_bytes", os.path.getsize(target_html))
+    return result
+
+def convert_file_variants(source_svg, variants, **options):
+    """Convert a single SVG file into a page for every Variant, parsing it
+    once. options are passed on to `write_variants`. Return its result.
+    """
+    with stats.stage("parse"):
+        svg_tree = load_svg(source_svg)
+    return write_variants(svg_tree, variants, **options)
+
+def convert_file_cached(source_svg, target_html, build_cache=None, **options):
+    """Like `convert_file`, but reuse the output of a previous conversion of
+    the same source with the same options from `build_cache` (a
+    `cache.BuildCache`), if there is one.
+    
+    Return (result, cached).
+    """
+    if build_cache is None:
+        return convert_file(source_svg, target_html, **options), False
+    
+    key_options = options
+    if _writes_assets(options):
+        # The page refers to its assets by name
+        key_options = dict(options, target_name=os.path.basename(target_html))
+    key = build_cache.key(source_svg, key_options)
+    hit, result = build_cache.fetch(key, target_html)
+    if hit:
+        stats.count("build_cache_hits")
+        if _writes_assets(options):
+            remove_page_assets(target_html, keep=build_cache.asset_names(key))
+        else:
+            remove_compressed_copy(target_html)
+        return result, True
+    
+    result = convert_file(source_svg, target_html, **options)
+    assets = page_assets(target_html) if _writes_assets(options) else ()
+    build_cache.store(key, target_html, result, assets)
+    return result, False
+
+def _convert_job(job):
+    """Run a single conversion of a batch. Never raises, so one failure does
+    not stop the others.
+    
+    Return a Conversion.
+    """
+    source_svg, target_html, options, cache_settings = job
+    start = time.time()
+    try:
+        build_cache = None
+        if cache_settings is not None:
+            build_cache = cache.BuildCache(*cache_settings)
+        result, cached = convert_file_cached(source_svg, target_html, build_cache, **options)
+    except Exception:
+        return Conversion(source_svg, target_html, None, traceback.format_exc(), time.time() - start, False)
+    return Conversion(source_svg, target_html, result, None, time.time() - start, cached)
+
+def convert_files(pairs, jobs=1, cache_settings=None, **options):
+    """Convert many (source_svg, target_html) pairs, using `jobs` worker
+    processes.
+    
+    cache_settings - (directory, max_bytes) of a `cache.BuildCache` to use, or
+    None for no caching.
+    
+    Yield a Conversion for every pair as it finishes. Its error is the
+    formatted traceback of a failed conversion, or None.
+    """
+    job_list = [(source, target, options, cache_settings) for source, target in pairs]
+    if jobs <= 1 or len(job_list) <= 1:
+        for job in job_list:
+            yield _convert_job(job)
+        return
+    
+    pool = multiprocessing.Pool(min(jobs, len(job_list)))
+    try:
+        for outcome in pool.imap_unordered(_convert_job, job_list):
+            yield outcome
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def read_manifest(manifest_path, output_dir=None):
+    """Read (source_svg, target_html) pairs from a manifest file.
+    
+    Every line holds a source SVG path, optionally followed by the target HTML
+    path. Without a target, the HTML goes into `output_dir` (or next to the
+    source). Relative paths are relative to the manifest. Empty lines and lines
+    starting with # are ignored.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pairs = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.split(None, 1)
+            source = os.path.join(base_dir, parts[0])
+            if len(parts) > 1:
+                target = os.path.join(base_dir, parts[1].strip())
+            else:
+                target = default_target(source, output_dir)
+            pairs.append((source, target))
+    return pairs
+
+def default_target(source_svg, output_dir=None):
+    """The HTML path for a source SVG - same name, in output_dir if given.
+    """
+    target = os.path.splitext(source_svg)[0] + ".html"
+    if output_dir is not None:
+        target = os.path.join(output_dir, os.path.basename(target))
+    return target
+
+def _format_result(result):
+    if result is None:
+        return ""
+    return " (culled %d nodes, %d bytes)" % (result.nodes, result.bytes)
+
+def _format_compression(target_html):
+    sizes = compress.compressed_sizes(target_html)
+    if sizes is None:
+        return ""
+    size, compressed_size = sizes
+    return " (gzip: %d bytes, %.1f%% of %d)" % (compressed_size, 100. * compressed_size / max(size, 1), size)
+
+@contextmanager
+def _profiling(prefix, top=profiling.DEFAULT_TOP):
+    """Profile the with-block with `profiling.profiling`, if prefix is not
+    None. Yields the Profiler, or None.
+    """
+    if prefix is None:
+        yield None
+        return
+    with profiling.profiling(prefix, top) as profiler:
+        yield profiler
+
+def _print_profile(profiler):
+    if profiler is not None:
+        print profiler.format_top()
+        print "Wrote the profile to %s" % (", ".join(profiler.paths), )
+
+def _viewport_argument(text):
+    import argparse
+    try:
+        return parse_viewport(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 def main():
-    import sys
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Create an impress.js presentation from an Inkscape SVG.",
+        usage="%(prog)s [options] <source_svg> <target_html>\n"
+              "       %(prog)s [options] -o <output_dir> <source_svg>...\n"
+              "       %(prog)s [options] --manifest <manifest>\n"
+              "       %(prog)s [options] --serve <source_svg>")
+    parser.add_argument("paths", nargs="*", metavar="path",
+        help="the source SVG and target HTML, or the source SVGs in batch mode")
+    parser.add_argument("-o", "--output-dir",
+        help="convert every source SVG into an HTML file in this directory")
+    parser.add_argument("--manifest",
+        help="convert the files listed in this file (a source SVG and an optional target HTML per line)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="number of files to convert in parallel (batch mode only)")
+    parser.add_argument("--compact", action="store_true",
+        help="don't indent the HTML output")
+    parser.add_argument("--precision", type=int,
+        help="round step attributes and graphics path data to this many decimal digits")
+    parser.add_argument("--minify", action="store_true",
+        help="strip Inkscape data, metadata and whitespace; implies --compact and --precision 3")
+    parser.add_argument("--external-graphics", action="store_true",
+        help="write the graphics into a separate, content-hashed SVG file next to the HTML")
+    parser.add_argument("--lazy-graphics", action="store_true",
+        help="write the graphics not visible in the first step into files loaded as their steps are shown")
+    parser.add_argument("--lod", action="store_true",
+        help="add simplified paths for zoomed out steps like the overview")
+    parser.add_argument("--lod-pixels", type=float, default=lod.DEFAULT_PIXELS, metavar="PIXELS",
+        help="how far the simplified paths may be from the paths, in pixels (default: %(default)s)")
+    parser.add_argument("--gzip", action="store_true",
+        help="also write gzip-compressed copies (.gz) of the HTML and the files next to it")
+    parser.add_argument("--gzip-level", type=int, default=compress.DEFAULT_LEVEL,
+        help="the gzip compression level, 1-9 (default: %(default)s)")
+    parser.add_argument("--dedup", action="store_true",
+        help="merge repeated definitions and embedded images in the graphics")
+    parser.add_argument("--extract-images", type=int, metavar="KB",
+        help="move embedded images of at least this size into files next to the HTML (implies --dedup)")
+    parser.add_argument("--cull", action="store_true",
+        help="remove graphics that are not visible in any step")
+    parser.add_argument("--watch", action="store_true",
+        help="convert again whenever the source SVG changes")
+    parser.add_argument("--serve", action="store_true",
+        help="serve a live preview of the source SVG instead of writing HTML")
+    parser.add_argument("--port", type=int, default=8000,
+        help="the port of the preview server (default: %(default)s)")
+    parser.add_argument("--impress-js",
+        help="the impress.js file for the preview server (default: js/impress.js)")
+    parser.add_argument("--no-cache", action="store_true",
+        help="always convert, don't reuse the output of unchanged sources")
+    parser.add_argument("--cache-dir", default=cache.DEFAULT_CACHE_DIR,
+        help="the build cache directory (default: %(default)s)")
+    parser.add_argument("--cache-size", type=int, default=cache.DEFAULT_MAX_BYTES // (1024 * 1024),
+        help="the maximal size of the build cache, in MB (default: %(default)s)")
+    parser.add_argument("--graphics-layer", metavar="LABEL",
+        help="the label of the graphics layer (default: the first layer)")
+    parser.add_argument("--layout", metavar="LABEL", action="append",
+        help="the label of the layout layer (default: the second layer). "
+             "Repeat to write a page for each layout (single file only)")
+    parser.add_argument("--viewport", metavar="[NAME=]WxH", action="append", type=_viewport_argument,
+        help="the window size to scale the steps for (default: 900x600). "
+             "Repeat to write a page for each viewport (single file only)")
+    parser.add_argument("--stats", action="store_true",
+        help="print the time and memory of every conversion stage, and counters (single file only)")
+    parser.add_argument("--stats-json", action="store_true",
+        help="like --stats, as JSON")
+    parser.add_argument("--profile", metavar="PREFIX",
+        help="profile the conversion into PREFIX.pstats, PREFIX.folded (for flame graphs) "
+             "and PREFIX.memory.txt (single file only, skips the cache)")
+    parser.add_argument("--profile-top", type=int, default=profiling.DEFAULT_TOP, metavar="N",
+        help="the number of functions and allocations to report (default: %(default)s)")
+    args = parser.parse_args()
     
-    if len(sys.argv) != 3:
-        print "Usage: %s <source_svg> <target_html>" % (sys.argv[0],)
+    precision = args.precision
+    if precision is None and args.minify:
+        precision = 3
+    if precision is not None and precision < 0:
+        parser.error("--precision must not be negative")
+    options = dict(pretty_print=not (args.compact or args.minify), cull=args.cull,
+                   precision=precision, strip_editor_data=args.minify)
+    if args.external_graphics:
+        options.update(external_graphics=True)
+    if args.dedup:
+        options.update(dedup_graphics=True)
+    if args.extract_images is not None:
+        if args.external_graphics:
+            parser.error("--extract-images can't be used with --external-graphics")
+        options.update(extract_images=args.extract_images * 1024)
+    if args.lazy_graphics:
+        if args.external_graphics:
+            parser.error("--lazy-graphics can't be used with --external-graphics")
+        options.update(lazy_graphics=True)
+    if args.lod:
+        if args.lod_pixels <= 0:
+            parser.error("--lod-pixels must be positive")
+        options.update(lod_pixels=args.lod_pixels)
+    if args.gzip:
+        if not 1 <= args.gzip_level <= 9:
+            parser.error("--gzip-level must be between 1 and 9")
+        options.update(gzip_level=args.gzip_level)
+    if args.graphics_layer is not None:
+        options.update(graphics_label=args.graphics_layer)
+    layouts = args.layout or [None]
+    viewports = args.viewport or [DEFAULT_VIEWPORT]
+    variants = len(layouts) > 1 or len(viewports) > 1
+    if not variants:
+        if args.layout:
+            options.update(layout_label=layouts[0])
+        if args.viewport:
+            options.update(viewport=viewports[0])
+    cache_settings = None
+    if not args.no_cache:
+        cache_settings = (args.cache_dir, args.cache_size * 1024 * 1024)
+    
+    if args.serve:
+        if len(args.paths) != 1:
+            parser.error("--serve expects a single <source_svg>")
+        if (args.external_graphics or args.extract_images is not None or args.gzip or
+                args.lazy_graphics):
+            parser.error("--serve doesn't write files next to the page")
+        if variants:
+            parser.error("--serve shows a single layout and viewport")
+        if args.profile is not None:
+            parser.error("--profile converts a single file")
+        serve(args.paths[0], args.port, args.impress_js, **options)
         return
     
-    #HACK: removing the xmlns issue...
-    svg_text = open(sys.argv[1]).read()
-    svg_text = svg_text.replace('xmlns="http://www.w3.org/2000/svg"', "", 1)
-    svg_root = etree.fromstring(svg_text)
-    svg_tree = svg_root.getroottree()
-        
-    #svg_tree = etree.parse(sys.argv[1])
-    html_text = create_impress(svg_tree)
-    open(sys.argv[2], "wb").write(html_text)
+    if args.output_dir is None and args.manifest is None:
+        if len(args.paths) != 2:
+            parser.error("expected <source_svg> <target_html>")
+        if args.watch:
+            if variants:
+                parser.error("--watch converts a single layout and viewport")
+            if args.lazy_graphics:
+                parser.error("--watch doesn't load graphics lazily")
+            if args.profile is not None:
+                parser.error("--profile converts once, not with --watch")
+            watch(args.paths[0], args.paths[1], **options)
+            return
+        if variants:
+            if args.extract_images is not None:
+                parser.error("--extract-images converts a single layout and viewport")
+            if args.lazy_graphics:
+                parser.error("--lazy-graphics converts a single layout and viewport")
+            if args.lod:
+                parser.error("--lod converts a single layout and viewport")
+            page_variants = variant_targets(args.paths[1], layouts, viewports)
+            with stats.collecting() as collector, _profiling(args.profile, args.profile_top) as profiler:
+                result = convert_file_variants(args.paths[0], page_variants, **options)
+            if args.stats_json:
+                print collector.to_json()
+            elif args.stats:
+                print collector.format_table()
+            _print_profile(profiler)
+            if result is not None:
+                print "Culled %d nodes (%d bytes)" % (result.nodes, result.bytes)
+            for variant in page_variants:
+                print "Wrote %s (%s, %s)%s" % (
+                    variant.target, variant.layout or "default layout", variant.viewport.name,
+                    _format_compression(variant.target) if args.gzip else "")
+            return
+        build_cache = None
+        if cache_settings is not None and args.profile is None:
+            build_cache = cache.BuildCache(*cache_settings)
+        with stats.collecting() as collector, _profiling(args.profile, args.profile_top) as profiler:
+            result, cached = convert_file_cached(args.paths[0], args.paths[1], build_cache, **options)
+        if args.stats_json:
+            print collector.to_json()
+        elif args.stats:
+            print collector.format_table()
+        _print_profile(profiler)
+        if cached:
+            print "Source unchanged, reused the cached output"
+        if result is not None:
+            print "Culled %d nodes (%d bytes)" % (result.nodes, result.bytes)
+        if args.gzip:
+            print "Compressed %s%s" % (args.paths[1], _format_compression(args.paths[1]))
+        return
+    
+    # Batch mode
+    if args.watch:
+        parser.error("--watch converts a single file")
+    if variants:
+        parser.error("several layouts or viewports need a single file")
+    if args.stats or args.stats_json:
+        parser.error("--stats converts a single file")
+    if args.profile is not None:
+        parser.error("--profile converts a single file")
+    pairs = []
+    if args.manifest is not None:
+        pairs.extend(read_manifest(args.manifest, args.output_dir))
+    pairs.extend((source, default_target(source, args.output_dir)) for source in args.paths)
+    if not pairs:
+        parser.error("no source SVGs given")
+    if args.output_dir is not None and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    
+    start = time.time()
+    failures = []
+    cached_count = 0
+    for conversion in convert_files(pairs, args.jobs, cache_settings, **options):
+        if conversion.error is None:
+            print "%s -> %s [%s]%s" % (
+                conversion.source, conversion.target,
+                "cached" if conversion.cached else "%.2fs" % (conversion.seconds, ),
+                _format_result(conversion.result) +
+                (_format_compression(conversion.target) if args.gzip else ""))
+            cached_count += conversion.cached
+        else:
+            failures.append(conversion.source)
+            sys.stderr.write("%s FAILED:\n%s\n" % (conversion.source, conversion.error))
+    
+    print "Converted %d of %d files (%d cached) in %.2fs, %d failed" % (
+        len(pairs) - len(failures), len(pairs), cached_count, time.time() - start, len(failures))
+    for source in failures:
+        print "    failed: %s" % (source, )
+    if failures:
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
-    
-    
\ No newline at end of file
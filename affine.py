@@ -0,0 +1,213 @@
+"""
+2d affine transformations stored as the 6 SVG matrix coefficients.
+
+An Affine (a, b, c, d, e, f) stands for the matrix
+
+    a   c   e
+    b   d   f
+    0   0   1
+
+exactly like the SVG `matrix(a, b, c, d, e, f)` transform. All operations are
+done in closed form, without building intermediate matrices.
+"""
+import math
+import re
+
+import matrix
+
+
+class Affine(object):
+    __slots__ = ("a", "b", "c", "d", "e", "f")
+
+    def __init__(self, a=1.0, b=0.0, c=0.0, d=1.0, e=0.0, f=0.0):
+        self.a = a
+        self.b = b
+        self.c = c
+        self.d = d
+        self.e = e
+        self.f = f
+
+    @classmethod
+    def identity(cls):
+        return cls()
+
+    @classmethod
+    def translation(cls, dx, dy):
+        return cls(1, 0, 0, 1, dx, dy)
+
+    @classmethod
+    def scaling(cls, sx, sy):
+        return cls(sx, 0, 0, sy, 0, 0)
+
+    @classmethod
+    def rotation(cls, angle):
+        cos = math.cos(angle)
+        sin = math.sin(angle)
+        return cls(cos, sin, -sin, cos, 0, 0)
+
+    @classmethod
+    def from_matrix(cls, mat):
+        """Create an Affine from a 3x3 `matrix.Matrix`.
+        """
+        return cls(mat[(0, 0)], mat[(1, 0)],
+                   mat[(0, 1)], mat[(1, 1)],
+                   mat[(0, 2)], mat[(1, 2)])
+
+    def to_matrix(self):
+        return matrix.Matrix([[self.a, self.c, self.e],
+                              [self.b, self.d, self.f],
+                              [0, 0, 1]])
+
+    @property
+    def coefficients(self):
+        return (self.a, self.b, self.c, self.d, self.e, self.f)
+
+    def __mul__(self, other):
+        """Compose self*other (other is applied first).
+        """
+        a1, b1, c1, d1, e1, f1 = self.a, self.b, self.c, self.d, self.e, self.f
+        a2, b2, c2, d2, e2, f2 = other.a, other.b, other.c, other.d, other.e, other.f
+        return Affine(
+            a1 * a2 + c1 * b2,
+            b1 * a2 + d1 * b2,
+            a1 * c2 + c1 * d2,
+            b1 * c2 + d1 * d2,
+            a1 * e2 + c1 * f2 + e1,
+            b1 * e2 + d1 * f2 + f1,
+            )
+
+    def __eq__(self, other):
+        if not isinstance(other, Affine):
+            return NotImplemented
+        return self.coefficients == other.coefficients
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "Affine(%r, %r, %r, %r, %r, %r)" % self.coefficients
+
+    def apply(self, x, y):
+        """Transform the point (x, y).
+        """
+        return (self.a * x + self.c * y + self.e,
+                self.b * x + self.d * y + self.f)
+
+    def decompose_scale(self):
+        """Decompose the scale factors, assuming no shear.
+        """
+        return (math.sqrt(self.a * self.a + self.b * self.b),
+                math.sqrt(self.c * self.c + self.d * self.d))
+
+    def decompose_rotation(self):
+        """Decompose the rotation angle, assuming no shear.
+        """
+        sx = math.sqrt(self.a * self.a + self.b * self.b)
+        return math.atan2(self.b / sx, self.a / sx)
+
+
+# SVG transform-list grammar
+_TRANSFORM_RE = re.compile(
+    r"[\s,]*(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^()]*)\)")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_SEPARATORS = " \t\r\n,"
+
+# Number of arguments each transform function accepts
+_ARITY = {
+    "matrix": (6,),
+    "translate": (1, 2),
+    "scale": (1, 2),
+    "rotate": (1, 3),
+    "skewX": (1,),
+    "skewY": (1,),
+    }
+
+# Parsed transform-lists, by attribute value
+_PARSE_CACHE = {}
+PARSE_CACHE_SIZE = 4096
+
+# Number of transform-lists parsed, and of those found in the cache
+PARSE_COUNTS = {"parsed": 0, "cache_hits": 0}
+
+
+def _transform_function(name, args):
+    if name == "matrix":
+        return Affine(*args)
+    elif name == "translate":
+        if len(args) == 1:
+            return Affine.translation(args[0], 0)
+        return Affine.translation(*args)
+    elif name == "scale":
+        if len(args) == 1:
+            return Affine.scaling(args[0], args[0])
+        return Affine.scaling(*args)
+    elif name == "rotate":
+        rotation = Affine.rotation(math.radians(args[0]))
+        if len(args) == 1:
+            return rotation
+        # Rotate around (cx, cy)
+        cx, cy = args[1:]
+        return Affine.translation(cx, cy) * rotation * Affine.translation(-cx, -cy)
+    elif name == "skewX":
+        return Affine(1, 0, math.tan(math.radians(args[0])), 1, 0, 0)
+    else:
+        return Affine(1, math.tan(math.radians(args[0])), 0, 1, 0, 0)
+
+
+def _parse_transform_list(value):
+    affine = None
+    pos = 0
+    for match in _TRANSFORM_RE.finditer(value):
+        if match.start() != pos:
+            raise ValueError("Invalid transform list %r" % (value, ))
+        pos = match.end()
+
+        name, args_text = match.groups()
+        # The text around the numbers: separators only, and a single comma
+        # between two numbers at most
+        gaps = _NUMBER_RE.split(args_text)
+        if (any(gap.strip(_SEPARATORS) for gap in gaps) or
+                "," in gaps[0] or "," in gaps[-1] or
+                any(gap.count(",") > 1 for gap in gaps)):
+            raise ValueError("Invalid arguments for %s in %r" % (name, value))
+        args = [float(arg) for arg in _NUMBER_RE.findall(args_text)]
+        if len(args) not in _ARITY[name]:
+            raise ValueError("Wrong number of arguments for %s in %r" % (name, value))
+
+        current = _transform_function(name, args)
+        if affine is None:
+            affine = current
+        else:
+            affine = affine * current
+
+    if value[pos:].strip(_SEPARATORS):
+        raise ValueError("Invalid transform list %r" % (value, ))
+
+    if affine is None:
+        affine = Affine()
+    return affine
+
+
+def parse_transform_list(value):
+    """Parse an SVG transform-list (the value of a 'transform=' attribute)
+    into a single Affine.
+
+    All transform functions are supported: matrix, translate, scale, rotate,
+    skewX and skewY. Results are cached by value, so the returned Affine
+    must not be modified.
+
+    Raise ValueError if the value is not a valid transform-list.
+    """
+    affine = _PARSE_CACHE.get(value)
+    if affine is not None:
+        PARSE_COUNTS["cache_hits"] += 1
+    else:
+        PARSE_COUNTS["parsed"] += 1
+        affine = _parse_transform_list(value)
+        if len(_PARSE_CACHE) >= PARSE_CACHE_SIZE:
+            _PARSE_CACHE.clear()
+        _PARSE_CACHE[value] = affine
+    return affine
@@ -0,0 +1,83 @@
+"""
+Vectorized layout geometry, for decks with many steps.
+
+Computes the same values as `Ink2Impress.Rect` and `Ink2Impress.calc_scale`,
+for all steps at once using NumPy. NumPy is optional - `numpy` is None when it
+is not installed, and callers should fall back to the pure Python path.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Rotation directions, as passed to `rect_geometry`
+DIRECTION_NONE  = 0
+DIRECTION_CW    = 1
+DIRECTION_CCW   = -1
+
+TWO_PI = math.pi * 2
+
+
+def available():
+    return numpy is not None
+
+
+def rect_geometry(coefficients, boxes, directions, extras):
+    """Transform many layout rects at once.
+
+    coefficients - (N, 6) affine coefficients (a, b, c, d, e, f) of each rect.
+    boxes - (N, 4) untransformed (x, y, width, height) of each rect.
+    directions - N rotation directions (DIRECTION_*).
+    extras - N extra full turns to add to each rotation.
+
+    Return (x, y, width, height, rotation) lists, rotation in radians.
+    """
+    coefficients = numpy.asarray(coefficients, dtype=float).reshape(-1, 6)
+    boxes = numpy.asarray(boxes, dtype=float).reshape(-1, 4)
+    directions = numpy.asarray(directions, dtype=int)
+    extras = numpy.asarray(extras, dtype=float)
+
+    a, b, c, d, e, f = coefficients.T
+    x, y, w, h = boxes.T
+
+    sx = numpy.sqrt(a * a + b * b)
+    sy = numpy.sqrt(c * c + d * d)
+    with numpy.errstate(divide="raise", invalid="raise"):
+        r = numpy.arctan2(b / sx, a / sx)
+
+    w = w * sx
+    h = h * sy
+    x_center = x + (w / 2)
+    y_center = y + (h / 2)
+
+    cos = numpy.cos(r)
+    sin = numpy.sin(r)
+    x = cos * x_center + (-sin) * y_center + e
+    y = sin * x_center + cos * y_center + f
+
+    r = numpy.where(directions == DIRECTION_CW, numpy.mod(r, TWO_PI), r)
+    r = numpy.where(directions == DIRECTION_CCW, numpy.mod(r, -TWO_PI), r)
+    # Adding 0.0 would turn -0.0 into 0.0
+    r = numpy.where(extras != 0, r + TWO_PI * extras, r)
+
+    return x.tolist(), y.tolist(), w.tolist(), h.tolist(), r.tolist()
+
+
+def calc_scales(base_width, base_height, widths, heights):
+    """Vectorized `Ink2Impress.calc_scale`. Return a list of scales.
+    """
+    widths = numpy.asarray(widths, dtype=float)
+    heights = numpy.asarray(heights, dtype=float)
+    if not (widths.all() and heights.all()):
+        raise ZeroDivisionError("float division by zero")
+
+    width_scale = widths / base_width
+    height_scale = heights / base_height
+
+    scaled_height_diff = (heights / width_scale) - base_height
+    scaled_width_diff = (widths / height_scale) - base_width
+
+    scales = numpy.where(scaled_width_diff > scaled_height_diff, width_scale, height_scale)
+    return scales.tolist()
@@ -0,0 +1,96 @@
+"""
+Time the conversion end to end and per stage, on generated presentations of
+several sizes.
+
+Usage: python benchmarks/bench_convert.py [--json results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import Ink2Impress
+import stats
+from generate_svg import generate_svg
+
+# (name, generate_svg arguments)
+SCALES = [
+    ("small", dict(steps=20, depth=2, graphics=200)),
+    ("medium", dict(steps=500, depth=4, graphics=5000)),
+    ("large", dict(steps=5000, depth=6, graphics=20000)),
+    ]
+
+
+def bench_scale(work_dir, name, generate_args, repeats, options):
+    source = os.path.join(work_dir, name + ".svg")
+    target = os.path.join(work_dir, name + ".html")
+    with open(source, "wb") as output:
+        generate_svg(output, **generate_args)
+
+    best = None
+    for _ in xrange(repeats):
+        with stats.collecting() as collector:
+            with stats.stage("total"):
+                Ink2Impress.convert_file(source, target, **options)
+        seconds = dict((stage, entry["seconds"]) for stage, entry in collector.stages.iteritems())
+        if best is None or seconds["total"] < best["total"]:
+            best = seconds
+            counters = dict(collector.counters)
+
+    return {
+        "source_bytes": os.path.getsize(source),
+        "seconds": best,
+        "counters": counters,
+        }
+
+
+def print_results(results, previous=None):
+    for name, result in results.iteritems():
+        print "%s (%d bytes, %d rects)" % (name, result["source_bytes"], result["counters"].get("rects", 0))
+        old = (previous or {}).get(name)
+        for stage, seconds in sorted(result["seconds"].iteritems(), key=lambda item: -item[1]):
+            line = "    %-22s %10.1fms" % (stage, seconds * 1000)
+            if old and stage in old["seconds"] and old["seconds"][stage] > 0:
+                line += "   x%.2f vs. previous" % (seconds / old["seconds"][stage], )
+            print line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion.")
+    parser.add_argument("--scales", nargs="*", choices=[name for name, _ in SCALES],
+        help="the scales to run (default: all)")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per scale, the fastest is kept")
+    parser.add_argument("--cull", action="store_true", help="convert with culling")
+    parser.add_argument("--json", help="save the results into this file")
+    parser.add_argument("--compare", help="compare with results saved by --json")
+    args = parser.parse_args()
+
+    options = dict(cull=args.cull)
+    previous = None
+    if args.compare:
+        with open(args.compare) as previous_file:
+            previous = json.load(previous_file)
+
+    work_dir = tempfile.mkdtemp(prefix="ink2impress-bench-")
+    results = OrderedDict()
+    try:
+        for name, generate_args in SCALES:
+            if args.scales and name not in args.scales:
+                continue
+            results[name] = bench_scale(work_dir, name, generate_args, args.repeats, options)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print_results(results, previous)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
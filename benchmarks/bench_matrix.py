@@ -0,0 +1,84 @@
+"""
+Time the basic operations of matrix.Matrix, optionally against another
+implementation of the module (e.g. an older version).
+
+Usage: python benchmarks/bench_matrix.py [reference_matrix.py]
+
+    git show <revision>:matrix.py > /tmp/matrix_ref.py
+    python benchmarks/bench_matrix.py /tmp/matrix_ref.py
+"""
+import imp
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import matrix
+
+# The reference determinant may expand by minors, keep the sizes small
+DETERMINANT_SIZES = [3, 5, 7]
+MULTIPLY_SIZES = [2, 3, 20]
+MIN_SECONDS = 0.2
+
+
+def random_values(size, seed=0):
+    rng = random.Random(seed)
+    return [[rng.uniform(-1, 1) for _ in xrange(size)] for _ in xrange(size)]
+
+
+def timed(func):
+    """Seconds per call of func, repeated for at least MIN_SECONDS.
+    """
+    calls = 0
+    start = time.time()
+    while True:
+        func()
+        calls += 1
+        elapsed = time.time() - start
+        if elapsed >= MIN_SECONDS:
+            return elapsed / calls
+
+
+def cases(module):
+    """(name, function) for every timed operation.
+    """
+    result = []
+    for size in MULTIPLY_SIZES:
+        a = module.Matrix(random_values(size, 0))
+        b = module.Matrix(random_values(size, 1))
+        result.append(("%dx%d multiply" % (size, size), lambda a=a, b=b: a * b))
+    for size in DETERMINANT_SIZES:
+        a = module.Matrix(random_values(size, 2))
+        result.append(("%dx%d determinant" % (size, size), a.determinant))
+    values = random_values(10, 3)
+    result.append(("10x10 create", lambda: module.Matrix(values)))
+    a = module.Matrix(random_values(10, 4))
+    result.append(("10x10 transpose", a.transpose))
+    result.append(("10x10 add", lambda: a + a))
+    vector = module.column_vector([1.] * 10)
+    result.append(("10x10 * vector", lambda: a * vector))
+    return result
+
+
+def main():
+    reference = None
+    if len(sys.argv) > 1:
+        reference = imp.load_source("matrix_reference", sys.argv[1])
+
+    times = [(name, timed(func)) for name, func in cases(matrix)]
+    if reference is None:
+        for name, seconds in times:
+            print "%-18s %10.2fus" % (name, seconds * 1e6)
+        return
+
+    reference_times = [timed(func) for _, func in cases(reference)]
+    print "%-18s %12s %12s" % ("", "reference", "matrix")
+    for (name, seconds), reference_seconds in zip(times, reference_times):
+        print "%-18s %10.2fus %10.2fus   x%.1f" % (
+            name, reference_seconds * 1e6, seconds * 1e6, reference_seconds / seconds)
+
+
+if __name__ == "__main__":
+    main()
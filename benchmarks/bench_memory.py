@@ -0,0 +1,75 @@
+"""
+Measure the memory used by the layout phase, in bytes per step, for the
+pure Python path and the NumPy batch path.
+
+Usage: python benchmarks/bench_memory.py [step count]
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from lxml import etree
+
+import Ink2Impress
+
+DEFAULT_COUNT = 10000
+
+
+def layout_layer(count, seed=0):
+    """A layout layer with `count` rects, each in its own transformed group.
+    """
+    rng = random.Random(seed)
+    layer = etree.Element("g")
+    for i in xrange(count):
+        angle = rng.uniform(-3.14, 3.14)
+        group = etree.SubElement(layer, "g", transform="rotate(%f) translate(%f,%f)" % (
+            angle, rng.uniform(0, 10000), rng.uniform(0, 10000)))
+        etree.SubElement(group, "rect", id="step%d" % (i, ),
+            x=str(rng.uniform(0, 100)), y=str(rng.uniform(0, 100)),
+            width=str(rng.uniform(100, 400)), height=str(rng.uniform(100, 400)))
+    return layer
+
+
+def deep_size(obj, seen):
+    """The size of obj and everything it references (that wasn't seen yet).
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.iteritems())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif not isinstance(obj, (basestring, int, long, float)):
+        if hasattr(obj, "__dict__"):
+            size += deep_size(obj.__dict__, seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(obj, name):
+                    size += deep_size(getattr(obj, name), seen)
+    return size
+
+
+def bytes_per_step(layer, count, use_numpy):
+    rects = Ink2Impress.process_layout_layer(layer, use_numpy)
+    # Don't count the id strings - they belong to the parsed SVG
+    seen = set(id(rect.id) for rect in rects)
+    return (deep_size(rects, seen) - sys.getsizeof(rects)) / count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+    layer = layout_layer(count)
+    paths = [("python", False)]
+    if Ink2Impress.batch.available():
+        paths.append(("numpy", True))
+    for name, use_numpy in paths:
+        print "%d steps, %s path: %d bytes per step" % (count, name, bytes_per_step(layer, count, use_numpy))
+
+
+if __name__ == "__main__":
+    main()
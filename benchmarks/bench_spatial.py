@@ -0,0 +1,86 @@
+"""
+Compare the step spatial index against a linear scan of the steps.
+
+Usage: python benchmarks/bench_spatial.py [step counts...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from Ink2Impress import Rect
+import spatial
+
+DEFAULT_COUNTS = [100, 10000, 100000]
+QUERIES = 200
+
+
+def random_steps(count, seed=0):
+    """Steps spread over a square canvas, 10 steps per 1000x1000 area.
+    """
+    rng = random.Random(seed)
+    side = 1000 * max(1, int((count / 10.) ** 0.5))
+    return [
+        Rect(x=rng.uniform(0, side), y=rng.uniform(0, side),
+             w=rng.uniform(100, 400), h=rng.uniform(100, 400),
+             r=rng.uniform(-3.14, 3.14), id_="step%d" % (i, ))
+        for i in xrange(count)
+        ], side
+
+
+def linear_query(rects, box):
+    return [rect for rect in rects if spatial.boxes_intersect(spatial.StepIndex.frame_box(rect), box)]
+
+
+def linear_at_point(rects, x, y):
+    return [rect for rect in rects if spatial.StepIndex.frame_contains(rect, x, y)]
+
+
+def linear_nearest(rects, x, y, k):
+    return sorted(rects, key=lambda rect: spatial.StepIndex.center_distance(rect, x, y))[:k]
+
+
+def timed(func, queries):
+    start = time.time()
+    for query in queries:
+        func(*query)
+    return (time.time() - start) / len(queries)
+
+
+def bench(count):
+    rects, side = random_steps(count)
+    rng = random.Random(1)
+    points = [(rng.uniform(0, side), rng.uniform(0, side)) for _ in xrange(QUERIES)]
+    boxes = [((x, y, x + 500, y + 500), ) for x, y in points]
+
+    start = time.time()
+    index = spatial.StepIndex(rects)
+    build_time = time.time() - start
+
+    # The linear scan is slow on big decks, so time it on fewer queries
+    linear = max(5, min(QUERIES, QUERIES * 1000 // count))
+    results = [
+        ("box query", timed(linear_query, [(rects, ) + box for box in boxes[:linear]]),
+            timed(index.query, boxes)),
+        ("point lookup", timed(linear_at_point, [(rects, x, y) for x, y in points[:linear]]),
+            timed(index.at_point, points)),
+        ("5-nearest", timed(linear_nearest, [(rects, x, y, 5) for x, y in points[:linear]]),
+            timed(index.nearest, [(x, y, 5) for x, y in points])),
+        ]
+
+    print "%d steps (index built in %.3fs)" % (count, build_time)
+    for name, linear_time, index_time in results:
+        print "    %-14s linear %10.3fms   index %8.3fms   x%.1f" % (
+            name, linear_time * 1000, index_time * 1000, linear_time / index_time)
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or DEFAULT_COUNTS
+    for count in counts:
+        bench(count)
+
+
+if __name__ == "__main__":
+    main()
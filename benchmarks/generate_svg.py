@@ -0,0 +1,200 @@
+"""
+Generate synthetic Inkscape SVG presentations, for benchmarking.
+
+Usage: python benchmarks/generate_svg.py [options] <target_svg>
+"""
+import argparse
+import math
+import random
+
+SVG_HEADER = """\
+<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg
+   xmlns:dc="http://purl.org/dc/elements/1.1/"
+   xmlns:cc="http://creativecommons.org/ns#"
+   xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+   xmlns:svg="http://www.w3.org/2000/svg"
+   xmlns="http://www.w3.org/2000/svg"
+   xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+   xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+   width="%(width)d"
+   height="%(height)d"
+   id="svg2"
+   version="1.1"
+   inkscape:version="0.48.4 r9939"
+   sodipodi:docname="generated.svg">
+  <defs
+     id="defs4" />
+  <sodipodi:namedview
+     id="base"
+     pagecolor="#ffffff"
+     bordercolor="#666666"
+     borderopacity="1.0"
+     inkscape:pageopacity="0.0"
+     inkscape:pageshadow="2"
+     inkscape:zoom="0.35"
+     inkscape:cx="375"
+     inkscape:cy="520"
+     inkscape:document-units="px"
+     inkscape:current-layer="layer2"
+     showgrid="false" />
+  <metadata
+     id="metadata7">
+    <rdf:RDF>
+      <cc:Work
+         rdf:about="">
+        <dc:format>image/svg+xml</dc:format>
+        <dc:type
+           rdf:resource="http://purl.org/dc/dcmitype/StillImage" />
+        <dc:title></dc:title>
+      </cc:Work>
+    </rdf:RDF>
+  </metadata>
+"""
+
+COLORS = ["#ff0000", "#00aa00", "#0000ff", "#ffcc00", "#333333", "#aa00aa"]
+
+
+class _Ids(object):
+    def __init__(self):
+        self._next = 1
+
+    def __call__(self, prefix):
+        self._next += 1
+        return "%s%d" % (prefix, self._next)
+
+
+def _random_transform(rng):
+    kind = rng.choice(["translate", "scale", "matrix", "matrix"])
+    if kind == "translate":
+        return "translate(%.5f,%.5f)" % (rng.uniform(-500, 500), rng.uniform(-500, 500))
+    elif kind == "scale":
+        scale = rng.uniform(0.5, 2)
+        return "scale(%.7f,%.7f)" % (scale, scale)
+    # Rotation and uniform scale, the way Inkscape writes it
+    angle = rng.uniform(-math.pi, math.pi)
+    scale = rng.uniform(0.5, 2)
+    return "matrix(%.7f,%.7f,%.7f,%.7f,%.5f,%.5f)" % (
+        scale * math.cos(angle), scale * math.sin(angle),
+        -scale * math.sin(angle), scale * math.cos(angle),
+        rng.uniform(-500, 500), rng.uniform(-500, 500))
+
+
+def _random_path(rng, x, y, size, points):
+    parts = ["M %.6f,%.6f" % (x, y)]
+    for _ in xrange(points):
+        parts.append("C %.6f,%.6f %.6f,%.6f %.6f,%.6f" % tuple(
+            rng.uniform(-size, size) + (x if i % 2 == 0 else y) for i in xrange(6)))
+    parts.append("z")
+    return " ".join(parts)
+
+
+def _graphics(rng, ids, count, width, height, path_points):
+    lines = []
+    for i in xrange(count):
+        x = rng.uniform(0, width)
+        y = rng.uniform(0, height)
+        kind = rng.random()
+        style = ("fill:%s;fill-opacity:1;stroke:#000000;stroke-width:%.1fpx;"
+                 "stroke-linecap:butt;stroke-linejoin:miter;stroke-opacity:1" % (
+                    rng.choice(COLORS), rng.uniform(0.5, 4)))
+        if kind < 0.6:
+            lines.append(
+                '    <path\n       style="%s"\n       d="%s"\n       id="%s"\n'
+                '       inkscape:connector-curvature="0"\n       sodipodi:nodetypes="cc" />' % (
+                    style, _random_path(rng, x, y, 200, path_points), ids("path")))
+        elif kind < 0.8:
+            lines.append(
+                '    <rect\n       style="%s"\n       id="%s"\n       width="%.6f"\n'
+                '       height="%.6f"\n       x="%.6f"\n       y="%.6f" />' % (
+                    style, ids("rect"), rng.uniform(10, 300), rng.uniform(10, 300), x, y))
+        elif kind < 0.9:
+            lines.append(
+                '    <g\n       transform="%s"\n       id="%s">\n'
+                '      <path\n         style="%s"\n         d="%s"\n         id="%s" />\n    </g>' % (
+                    _random_transform(rng), ids("g"), style,
+                    _random_path(rng, x, y, 100, path_points), ids("path")))
+        else:
+            lines.append(
+                '    <text\n       xml:space="preserve"\n       style="font-size:40px;font-family:Sans"\n'
+                '       x="%.6f"\n       y="%.6f"\n       id="%s"\n       sodipodi:linespacing="125%%">'
+                '<tspan\n         sodipodi:role="line"\n         id="%s"\n         x="%.6f"\n'
+                '         y="%.6f">Text %d</tspan></text>' % (
+                    x, y, ids("text"), ids("tspan"), x, y, i))
+    return lines
+
+
+def _layout(rng, ids, count, depth, width, height):
+    lines = []
+    # The overview step covers the whole page
+    lines.append('    <rect\n       id="overview"\n       width="%d"\n       height="%d"\n'
+                 '       x="0"\n       y="0"\n       style="fill:none;stroke:#ff0000" />' % (width, height))
+
+    for i in xrange(count):
+        indent = "    "
+        opened = rng.randint(0, depth)
+        for _ in xrange(opened):
+            attributes = ['transform="%s"' % (_random_transform(rng), ), 'id="%s"' % (ids("g"), )]
+            if rng.random() < 0.2:
+                attributes.append('rotation-direction="%s"' % (rng.choice(["cw", "ccw"]), ))
+            if rng.random() < 0.1:
+                attributes.append('rotation-extra="%d"' % (rng.randint(-1, 1), ))
+            lines.append("%s<g\n%s   %s>" % (indent, indent, ("\n%s   " % (indent, )).join(attributes)))
+            indent += "  "
+
+        step_width = rng.uniform(100, 1000)
+        lines.append(
+            '%s<rect\n%s   id="step%d"\n%s   width="%.6f"\n%s   height="%.6f"\n'
+            '%s   x="%.6f"\n%s   y="%.6f"\n%s   style="fill:none;stroke:#ff0000" />' % (
+                indent, indent, i, indent, step_width, indent, step_width * 2 / 3.,
+                indent, rng.uniform(0, width), indent, rng.uniform(0, height), indent))
+        for _ in xrange(opened):
+            indent = indent[:-2]
+            lines.append("%s</g>" % (indent, ))
+    return lines
+
+
+def generate_svg(output, steps=100, depth=3, graphics=1000, path_points=8,
+                 width=10000, height=10000, seed=0):
+    """Write a synthetic Inkscape SVG presentation into `output`, a file-like
+    object.
+
+    steps - number of layout rects (besides the overview).
+    depth - maximal group nesting around each layout rect.
+    graphics - number of elements in the graphics layer.
+    path_points - number of curve segments in each path.
+    """
+    rng = random.Random(seed)
+    ids = _Ids()
+    output.write(SVG_HEADER % dict(width=width, height=height))
+
+    output.write('  <g\n     inkscape:label="Graphics"\n     inkscape:groupmode="layer"\n'
+                 '     id="layer1">\n')
+    for line in _graphics(rng, ids, graphics, width, height, path_points):
+        output.write(line + "\n")
+    output.write("  </g>\n")
+
+    output.write('  <g\n     inkscape:groupmode="layer"\n     id="layer2"\n'
+                 '     inkscape:label="Layout">\n')
+    for line in _layout(rng, ids, steps, depth, width, height):
+        output.write(line + "\n")
+    output.write("  </g>\n</svg>\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Inkscape SVG presentation.")
+    parser.add_argument("target_svg")
+    parser.add_argument("--steps", type=int, default=100, help="number of layout rects")
+    parser.add_argument("--depth", type=int, default=3, help="maximal group nesting of layout rects")
+    parser.add_argument("--graphics", type=int, default=1000, help="number of graphics elements")
+    parser.add_argument("--path-points", type=int, default=8, help="curve segments per path")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.target_svg, "wb") as output:
+        generate_svg(output, steps=args.steps, depth=args.depth, graphics=args.graphics,
+                     path_points=args.path_points, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Content-hash build cache for converted presentations.
+
+Entries are keyed by a hash of the source SVG bytes, the conversion options and
+the converter's own code, so any change in any of them is a miss. The cache
+directory is bounded in size - the least recently used entries are evicted.
+
+An entry holds the HTML output, the conversion result and the files written
+next to the HTML (assets, e.g. externalized graphics).
+"""
+import glob
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ink2impress")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_CHUNK_SIZE = 1024 * 1024
+
+_converter_version = None
+
+
+def converter_version():
+    """A hash of the converter's code (the modules next to this one).
+    """
+    global _converter_version
+    if _converter_version is None:
+        digest = hashlib.sha256()
+        code_dir = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(code_dir, "*.py"))):
+            digest.update(os.path.basename(path))
+            with open(path, "rb") as code:
+                digest.update(code.read())
+        _converter_version = digest.hexdigest()
+    return _converter_version
+
+
+def _hash_file(path, digest):
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+
+
+class BuildCache(object):
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def key(self, source_path, options):
+        """The cache key for converting source_path with the given options.
+        """
+        digest = hashlib.sha256()
+        digest.update(converter_version())
+        digest.update(repr(sorted(options.items())))
+        _hash_file(source_path, digest)
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self._directory, key)
+        return base + ".html", base + ".result"
+
+    def _asset_paths(self, key):
+        return glob.glob(os.path.join(self._directory, key + ".asset.*"))
+
+    def asset_names(self, key):
+        """Return the file names of the assets stored under `key`.
+        """
+        prefix_length = len(key + ".asset.")
+        return [os.path.basename(path)[prefix_length:] for path in self._asset_paths(key)]
+
+    def fetch(self, key, target_path):
+        """Copy the cached output for `key` into target_path, and its assets
+        next to it.
+
+        Return (True, result) on a hit, with the result of the conversion that
+        was cached, or (False, None) on a miss.
+        """
+        html_path, result_path = self._paths(key)
+        target_dir = os.path.dirname(os.path.abspath(target_path))
+        try:
+            with open(result_path, "rb") as result_file:
+                result = pickle.load(result_file)
+            asset_paths = self._asset_paths(key)
+            for path, name in zip(asset_paths, self.asset_names(key)):
+                shutil.copyfile(path, os.path.join(target_dir, name))
+            shutil.copyfile(html_path, target_path)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+        # Mark as recently used
+        for path in [html_path, result_path] + asset_paths:
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+        return True, result
+
+    def store(self, key, target_path, result=None, assets=()):
+        """Store the output in target_path (and the conversion result) under
+        `key`, with the asset files in `assets`.
+        """
+        html_path, result_path = self._paths(key)
+        # Write to temporary files and rename, so concurrent conversions never
+        # see partial entries. The result goes last - it marks the entry as done.
+        for path in assets:
+            self._atomic_copy(path, os.path.join(self._directory, key + ".asset." + os.path.basename(path)))
+        self._atomic_copy(target_path, html_path)
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as result_file:
+            pickle.dump(result, result_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, result_path)
+
+        self.evict()
+
+    def _atomic_copy(self, source_path, path):
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(source_path, temp_path)
+        os.rename(temp_path, path)
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in its size.
+        """
+        entries = []
+        total = 0
+        for path in glob.glob(os.path.join(self._directory, "*.html")):
+            key = os.path.splitext(path)[0]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size = stat.st_size
+            for asset_path in glob.glob(key + ".asset.*"):
+                try:
+                    size += os.path.getsize(asset_path)
+                except OSError:
+                    pass
+            entries.append((stat.st_mtime, key, size))
+            total += size
+
+        entries.sort()
+        for _, key, size in entries:
+            if total <= self._max_bytes:
+                break
+            for path in [key + ".result", key + ".html"] + glob.glob(key + ".asset.*"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self._directory, "*")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
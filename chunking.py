@@ -0,0 +1,233 @@
+"""
+Splitting the graphics into chunks that are loaded as the steps are shown.
+
+Every graphics element is assigned to the first step it is visible in. The
+elements of the first step stay in the page, the others are moved into a
+chunk file per step, leaving an empty placeholder <g> in their place - so the
+drawing order stays the same when they are loaded back in. Elements whose
+bounds can't be computed (see `culling`) always stay in the page.
+
+Groups that are visible in more than one step are split between the steps,
+unless that would change how they are drawn (opacity, filters, masks...).
+"""
+import json
+from collections import namedtuple, OrderedDict
+
+from lxml import etree
+
+from affine import Affine, parse_transform_list
+import culling
+import spatial
+
+PLACEHOLDER_PREFIX = "impress-chunk-"
+
+# Group properties that apply to the group as a whole, so its children can't
+# be drawn separately
+_GROUP_EFFECTS = ("opacity", "filter", "mask", "clip-path")
+
+# files - the serialized chunk files. steps - for every step (in
+# presentation order), the indices of the files it shows.
+SplitGraphics = namedtuple("SplitGraphics", "files steps")
+
+# Loads the chunk files of the current and the next step. "%(manifest)s" is
+# replaced with the JSON of {"files": [file URL...], "steps": [[file index...]...]}
+LOADER_SCRIPT = """\
+<script type="text/javascript">
+(function () {
+    var manifest = %(manifest)s;
+    var loaded = {};
+    function insert(text) {
+        var chunks = new DOMParser().parseFromString(text, "image/svg+xml").documentElement.childNodes;
+        for (var i = 0; i < chunks.length; i++) {
+            var chunk = chunks[i];
+            if (chunk.nodeType !== 1) continue;
+            var placeholder = document.getElementById("%(prefix)s" + chunk.getAttribute("data-chunk"));
+            for (var child = chunk.firstChild; child; child = child.nextSibling) {
+                placeholder.appendChild(document.importNode(child, true));
+            }
+        }
+    }
+    function load(file) {
+        if (loaded[file]) return;
+        loaded[file] = true;
+        var request = new XMLHttpRequest();
+        request.open("GET", manifest.files[file]);
+        request.onload = function () { insert(request.responseText); };
+        request.onerror = function () { loaded[file] = false; };
+        request.send();
+    }
+    function show(step) {
+        var steps = document.querySelectorAll(".step");
+        var index = Array.prototype.indexOf.call(steps, step);
+        if (index < 0) index = 0;
+        var next = [index, (index + 1) %% steps.length];
+        for (var i = 0; i < next.length; i++) {
+            var files = manifest.steps[next[i]] || [];
+            for (var j = 0; j < files.length; j++) load(files[j]);
+        }
+    }
+    document.addEventListener("impress:stepenter", function (event) { show(event.target); }, false);
+    document.addEventListener("DOMContentLoaded", function () {
+        show(document.getElementById(location.hash.replace(/^#\\/?/, "")));
+    }, false);
+})();
+</script>
+"""
+
+
+def loader_script(file_urls, steps):
+    """Return the loader <script> (HTML) for the chunk files at file_urls.
+    """
+    manifest = json.dumps({"files": file_urls, "steps": steps}, separators=(",", ":"))
+    # Never close the script element early
+    manifest = manifest.replace("<", "\\u003c")
+    return LOADER_SCRIPT % {"manifest": manifest, "prefix": PLACEHOLDER_PREFIX}
+
+
+class _Splitter(object):
+    def __init__(self, index, referenced):
+        self._index = index
+        self._referenced = referenced
+        # element -> box on the canvas, or None if unknown
+        self._boxes = {}
+        # home step -> [(placeholder number, [element...])...]
+        self.chunks = OrderedDict()
+        # step -> home steps of the elements it shows
+        self.step_homes = {}
+        self._placeholders = 0
+
+    def measure(self, element, parent_transform, inherited_stroke):
+        """Store the canvas boxes of element and its descendants.
+        Return the box of element, None if unknown.
+        """
+        tag = element.tag
+        if not isinstance(tag, basestring) or tag in culling.REFERENCED_CONTAINERS:
+            return None
+        box = None
+        try:
+            transform = parent_transform
+            if element.get("transform") is not None:
+                transform = parent_transform * parse_transform_list(element.get("transform"))
+        except ValueError:
+            transform = None
+
+        style = culling.parse_style(element)
+        margin, stroke = culling.stroke_margin(element, style, inherited_stroke)
+        if tag in culling.GROUP_ELEMENTS and transform is not None:
+            boxes = [self.measure(child, transform, stroke) for child in element
+                     if isinstance(child.tag, basestring) and
+                     child.tag not in culling.REFERENCED_CONTAINERS]
+            if boxes and None not in boxes:
+                box = reduce(spatial.union_box, boxes)
+        elif transform is not None and margin is not None:
+            shape_box = culling.element_box(element)
+            if shape_box is not None:
+                shape_box = (shape_box[0] - margin, shape_box[1] - margin,
+                             shape_box[2] + margin, shape_box[3] + margin)
+                box = spatial.transform_box(shape_box, transform)
+
+        if box is not None and not self._measurable(element, style):
+            box = None
+        self._boxes[element] = box
+        return box
+
+    def _measurable(self, element, style):
+        if element.get("id") in self._referenced:
+            return False
+        if culling.get_property(element, style, "filter") not in (None, "none"):
+            return False
+        return not culling.has_markers(element, style)
+
+    def _steps(self, element):
+        """The steps element is visible in, None if unknown.
+        """
+        box = self._boxes.get(element)
+        if box is None:
+            return None
+        return self._index.query(box)
+
+    def _splittable(self, element):
+        """Can the children of element be drawn separately?
+        """
+        if element.tag != "g" or element.get("id") in self._referenced:
+            return False
+        style = culling.parse_style(element)
+        return all(culling.get_property(element, style, name) in (None, "none", "1")
+                   for name in _GROUP_EFFECTS)
+
+    def split(self, element):
+        """Move the descendants of element that are first visible after the
+        first step into chunks.
+        """
+        run_home = None
+        run = []
+        for child in list(element):
+            steps = self._steps(child)
+            home = None
+            if steps is None or (len(steps) > 1 and steps[0] == 0):
+                # Partly in the page anyway - or unknown, its parts may not be
+                if self._splittable(child):
+                    self.split(child)
+            elif steps:
+                home = steps[0]
+                for step in steps:
+                    self.step_homes.setdefault(step, set()).add(home)
+                if home == 0:
+                    home = None
+            if home != run_home:
+                self._flush(run_home, run)
+                run = []
+            run_home = home
+            if home is not None:
+                run.append(child)
+        self._flush(run_home, run)
+
+    def _flush(self, home, run):
+        if home is None or not run:
+            return
+        placeholder = etree.Element("g", id="%s%d" % (PLACEHOLDER_PREFIX, self._placeholders))
+        run[0].addprevious(placeholder)
+        placeholder.tail = run[-1].tail
+        for child in run:
+            child.tail = None
+            child.getparent().remove(child)
+        self.chunks.setdefault(home, []).append((self._placeholders, run))
+        self._placeholders += 1
+
+
+def split_graphics(graphics_layer, rects, margin=culling.DEFAULT_MARGIN, parent_transform=None):
+    """Move the graphics that are not visible in the first step out of
+    graphics_layer (modified in place), into a chunk file for each step.
+
+    graphics_layer - the graphics layer <g> element.
+    rects - the step `Rect`s, from `process_layout_layer`.
+    margin - extra visible margin around each step, relative to its size.
+    parent_transform - the Affine of the graphics layer's parent, if any.
+
+    Return SplitGraphics.
+    """
+    if parent_transform is None:
+        parent_transform = Affine()
+    boxes = culling.step_boxes(rects, margin)
+    index = spatial.RTree((box, step) for step, box in enumerate(boxes))
+    splitter = _Splitter(index, culling.referenced_ids(graphics_layer.getroottree().getroot()))
+    if len(index):
+        splitter.measure(graphics_layer, parent_transform, (None, None))
+        splitter.split(graphics_layer)
+
+    files = []
+    file_indices = {}
+    for home, chunks in splitter.chunks.iteritems():
+        root = etree.fromstring('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+        for number, elements in chunks:
+            chunk = etree.SubElement(root, "g")
+            chunk.set("data-chunk", str(number))
+            chunk.extend(elements)
+        file_indices[home] = len(files)
+        files.append(etree.tostring(root))
+
+    steps = []
+    for step in xrange(len(rects)):
+        homes = splitter.step_homes.get(step, ())
+        steps.append(sorted(file_indices[home] for home in homes if home in file_indices))
+    return SplitGraphics(files, steps)
@@ -0,0 +1,68 @@
+"""
+Precompressed (gzip) copies of the output files, for static hosts that serve
+a .gz sibling when there is one.
+
+Gzip headers hold no file name and a fixed time, so equal content compresses
+into equal files.
+"""
+import gzip
+import os
+
+DEFAULT_LEVEL = 9
+
+# Suffix of the compressed copy of a file
+SUFFIX = ".gz"
+
+
+def _gzip_file(fileobj, level):
+    return gzip.GzipFile("", "wb", level, fileobj, 0)
+
+
+class GzipTee(object):
+    """A file-like object that writes into `output`, and a gzip-compressed
+    copy into `compressed_output` at the same time - so the data is never
+    held twice.
+
+    close() finishes the compressed stream, it does not close the outputs.
+    """
+    def __init__(self, output, compressed_output, level=DEFAULT_LEVEL):
+        self._output = output
+        self._compressed_output = compressed_output
+        self._gzip = _gzip_file(compressed_output, level)
+        self.bytes_in = 0
+
+    def write(self, data):
+        self._output.write(data)
+        self._gzip.write(data)
+        self.bytes_in += len(data)
+
+    def flush(self):
+        self._output.flush()
+
+    def close(self):
+        self._gzip.close()
+
+    @property
+    def bytes_out(self):
+        return self._compressed_output.tell()
+
+
+def write_compressed(path, content, level=DEFAULT_LEVEL):
+    """Write the gzip-compressed content into path.
+
+    Return the compressed size.
+    """
+    with open(path, "wb") as raw:
+        with _gzip_file(raw, level) as compressed:
+            compressed.write(content)
+        return raw.tell()
+
+
+def compressed_sizes(path):
+    """Return (size, compressed size) of path and its compressed copy, or None
+    if there's no compressed copy.
+    """
+    try:
+        return os.path.getsize(path), os.path.getsize(path + SUFFIX)
+    except OSError:
+        return None
@@ -0,0 +1,389 @@
+"""
+Viewport culling - remove graphics that are never visible in any step.
+
+Bounding boxes are computed for the graphics elements (including their
+transforms), and tested against the area visible in the steps. Elements that
+can't be measured (text, <use>, filtered elements, etc.) are always kept.
+"""
+import math
+import re
+from collections import namedtuple
+
+from lxml import etree
+
+from affine import Affine, parse_transform_list
+import spatial
+
+# Elements whose content is only rendered by reference
+REFERENCED_CONTAINERS = set([
+    "defs", "symbol", "clipPath", "mask", "marker", "pattern",
+    "linearGradient", "radialGradient", "filter",
+    ])
+
+# Elements that only group their children
+GROUP_ELEMENTS = set(["g", "a", "switch"])
+
+# Extra margin around each step, relative to the larger side of the step.
+# The browser window rarely has the exact proportions of the step.
+DEFAULT_MARGIN = 0.5
+
+CullResult = namedtuple("CullResult", "nodes bytes")
+
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+_PATH_TOKEN_RE = re.compile(r"([MmLlHhVvCcSsQqTtAaZz])|" + _NUMBER_RE.pattern)
+# An arc flag is a single digit, it may be packed with the next number
+_ARC_FLAG_RE = re.compile(r"[\s,]*([01])")
+_URL_REF_RE = re.compile(r"url\(\s*['\"]?#([^'\")\s]+)")
+
+# Number of arguments for each path command
+PATH_ARGS = {
+    "M": 2, "L": 2, "H": 1, "V": 1, "C": 6, "S": 4, "Q": 4, "T": 2, "A": 7,
+    }
+
+# The indices of the flags in the arguments of an arc
+_ARC_FLAGS = (3, 4)
+
+MARKER_PROPERTIES = ("marker-start", "marker-mid", "marker-end", "marker")
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+
+def parse_style(element):
+    """Return the properties in the 'style=' attribute of the element.
+    """
+    properties = {}
+    style = element.get("style")
+    if style:
+        for declaration in style.split(";"):
+            name, sep, value = declaration.partition(":")
+            if sep:
+                properties[name.strip()] = value.strip()
+    return properties
+
+
+def get_property(element, style, name):
+    """Get a presentation property, from the style or the attribute.
+    """
+    if name in style:
+        return style[name]
+    return element.get(name)
+
+
+def parse_length(value):
+    """Parse a user-space length. Other units (or percentages) raise ValueError.
+    """
+    value = value.strip()
+    if value.endswith("px"):
+        value = value[:-2]
+    return float(value)
+
+
+def _length(element, attrib):
+    value = element.get(attrib)
+    if value is None:
+        return 0.
+    return parse_length(value)
+
+
+def path_commands(d):
+    """Yield (command, args) for every command of the path data - the command
+    letter as written, and its arguments as floats (none for closepath).
+    A command with repeated arguments is yielded for each set of them, the
+    extra coordinate pairs after a moveto as linetos.
+
+    Raise ValueError if the path data is invalid.
+    """
+    command = None
+    pending = []
+    pos = 0
+    while True:
+        if command in ("A", "a") and len(pending) in _ARC_FLAGS:
+            token = _ARC_FLAG_RE.match(d, pos)
+            if token is None:
+                raise ValueError("Invalid arc flag in path %r" % (d, ))
+            pos = token.end()
+            pending.append(float(token.group(1)))
+        else:
+            token = _PATH_TOKEN_RE.search(d, pos)
+            if token is None:
+                break
+            pos = token.end()
+            if token.group(1):
+                if pending:
+                    raise ValueError("Missing arguments in path %r" % (d, ))
+                command = token.group(1)
+                if command in "Zz":
+                    yield command, []
+                continue
+            if command is None or command in "Zz":
+                raise ValueError("Arguments without a command in path %r" % (d, ))
+            pending.append(float(token.group(0)))
+
+        upper = command.upper()
+        if len(pending) < PATH_ARGS[upper]:
+            continue
+        yield command, pending
+        pending = []
+        if upper == "M":
+            # Extra coordinate pairs after a moveto are lineto commands
+            command = "L" if command == "M" else "l"
+
+    if pending:
+        raise ValueError("Missing arguments in path %r" % (d, ))
+
+
+def path_points(d):
+    """Return points whose bounding box contains the path.
+
+    Curves are bounded by their control points, arcs by their radii.
+    Return None if the path data can't be parsed.
+    """
+    try:
+        commands = list(path_commands(d))
+    except ValueError:
+        return None
+    points = []
+    x = y = start_x = start_y = 0.
+    # Last control point, for reflection by S and T
+    control = None
+    for command, args in commands:
+        upper = command.upper()
+        if upper == "Z":
+            x, y = start_x, start_y
+            control = None
+            continue
+
+        relative = command.islower()
+        base_x, base_y = (x, y) if relative else (0., 0.)
+
+        if upper == "H":
+            x = args[0] + (x if relative else 0.)
+            points.append((x, y))
+            control = None
+            continue
+        if upper == "V":
+            y = args[0] + (y if relative else 0.)
+            points.append((x, y))
+            control = None
+            continue
+        if upper == "A":
+            end_x, end_y = args[5] + base_x, args[6] + base_y
+            # The arc stays within a diameter of its start point
+            radius = max(2 * max(abs(args[0]), abs(args[1])),
+                         math.hypot(end_x - x, end_y - y))
+            points.append((x - radius, y - radius))
+            points.append((x + radius, y + radius))
+            points.append((end_x, end_y))
+            x, y = end_x, end_y
+            control = None
+            continue
+
+        coords = [(args[i] + base_x, args[i + 1] + base_y) for i in xrange(0, len(args), 2)]
+        if upper in "ST":
+            if control is None:
+                reflected = (x, y)
+            else:
+                reflected = (2 * x - control[0], 2 * y - control[1])
+            points.append(reflected)
+        points.extend(coords)
+        if upper == "T":
+            control = reflected
+        else:
+            control = coords[-2] if len(coords) > 1 else None
+        x, y = coords[-1]
+
+        if upper == "M":
+            start_x, start_y = x, y
+    return points
+
+
+def element_box(element):
+    """Return the untransformed bounding box of a shape element, without
+    stroke. Return None if it can't be computed.
+    """
+    tag = element.tag
+    try:
+        if tag in ("rect", "image"):
+            x = _length(element, "x")
+            y = _length(element, "y")
+            return (x, y, x + _length(element, "width"), y + _length(element, "height"))
+        elif tag == "circle":
+            cx = _length(element, "cx")
+            cy = _length(element, "cy")
+            r = _length(element, "r")
+            return (cx - r, cy - r, cx + r, cy + r)
+        elif tag == "ellipse":
+            cx = _length(element, "cx")
+            cy = _length(element, "cy")
+            rx = _length(element, "rx")
+            ry = _length(element, "ry")
+            return (cx - rx, cy - ry, cx + rx, cy + ry)
+        elif tag == "line":
+            xs = (_length(element, "x1"), _length(element, "x2"))
+            ys = (_length(element, "y1"), _length(element, "y2"))
+            return (min(xs), min(ys), max(xs), max(ys))
+        elif tag in ("polyline", "polygon"):
+            numbers = [float(n) for n in _NUMBER_RE.findall(element.get("points", ""))]
+            points = zip(numbers[0::2], numbers[1::2])
+        elif tag == "path":
+            points = path_points(element.get("d", ""))
+        else:
+            return None
+    except ValueError:
+        return None
+
+    if not points:
+        return None
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def has_markers(element, style):
+    """Does the element (with its parsed style) draw markers?
+    """
+    for name in MARKER_PROPERTIES:
+        if get_property(element, style, name) not in (None, "none"):
+            return True
+    return False
+
+
+def stroke_margin(element, style, inherited_stroke):
+    """Return (margin, stroke) - half the stroke width, or None if unknown.
+    """
+    stroke = get_property(element, style, "stroke") or inherited_stroke[0]
+    stroke_width = get_property(element, style, "stroke-width") or inherited_stroke[1]
+    if not stroke or stroke == "none":
+        return 0., (stroke, stroke_width)
+    try:
+        return parse_length(stroke_width or "1") / 2., (stroke, stroke_width)
+    except ValueError:
+        return None, (stroke, stroke_width)
+
+
+def step_boxes(rects, margin=DEFAULT_MARGIN):
+    """Return the box of each step's frame, with a margin relative to its size.
+    """
+    boxes = []
+    for rect in rects:
+        box = spatial.rotated_rect_box(rect.x, rect.y, rect.w, rect.h, rect.r)
+        extra = margin * max(rect.w, rect.h)
+        boxes.append((box[0] - extra, box[1] - extra, box[2] + extra, box[3] + extra))
+    return boxes
+
+
+def visible_boxes(rects, margin=DEFAULT_MARGIN):
+    """Return the boxes that can be on screen while showing the steps.
+
+    A box covers each step (with a margin), together with the next step - so
+    the transition between the steps is covered too.
+    """
+    boxes = step_boxes(rects, margin)
+    if len(boxes) < 2:
+        return boxes
+    # impress.js goes back to the first step after the last one.
+    return [spatial.union_box(box, next_box) for box, next_box in zip(boxes, boxes[1:] + boxes[:1])]
+
+
+def referenced_ids(root):
+    """Return the ids referenced by href or url(#...) anywhere in the tree.
+    """
+    ids = set()
+    for element in root.iter(etree.Element):
+        for name, value in element.items():
+            if name in ("href", XLINK_HREF):
+                if value.startswith("#"):
+                    ids.add(value[1:])
+            elif "url(" in value:
+                ids.update(_URL_REF_RE.findall(value))
+    return ids
+
+
+def remove_element(element):
+    """Remove element from its parent, keeping its tail text (the whitespace
+    that followed it).
+    """
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or "") + element.tail
+        else:
+            parent.text = (parent.text or "") + element.tail
+    parent.remove(element)
+
+
+class _Culler(object):
+    def __init__(self, index, referenced):
+        self._index = index
+        self._referenced = referenced
+        self.nodes = 0
+        self.bytes = 0
+
+    def cull(self, element, parent_transform, inherited_stroke):
+        """Remove the invisible decendants of element.
+        Return True if element itself should be kept.
+        """
+        tag = element.tag
+        if not isinstance(tag, basestring) or tag in REFERENCED_CONTAINERS:
+            return True
+        if element.get("id") in self._referenced:
+            return True
+
+        transform_value = element.get("transform")
+        if transform_value is None:
+            transform = parent_transform
+        else:
+            try:
+                transform = parent_transform * parse_transform_list(transform_value)
+            except ValueError:
+                return True
+
+        style = parse_style(element)
+        if get_property(element, style, "filter") not in (None, "none"):
+            # Filters can draw way beyond the element
+            return True
+        if has_markers(element, style):
+            return True
+        margin, stroke = stroke_margin(element, style, inherited_stroke)
+
+        if tag in GROUP_ELEMENTS:
+            # Keep empty groups, only remove groups we emptied
+            kept = len(element) == 0
+            for child in list(element):
+                if self.cull(child, transform, stroke):
+                    kept = True
+                else:
+                    self._remove(child)
+            return kept
+
+        box = element_box(element)
+        if box is None or margin is None:
+            return True
+        box = (box[0] - margin, box[1] - margin, box[2] + margin, box[3] + margin)
+        return self._index.intersects(spatial.transform_box(box, transform))
+
+    def _remove(self, element):
+        self.nodes += sum(1 for _ in element.iter())
+        self.bytes += len(etree.tostring(element, with_tail=False))
+        remove_element(element)
+
+
+def cull_graphics(graphics_layer, rects, margin=DEFAULT_MARGIN, parent_transform=None):
+    """Remove the graphics elements that are not visible in any of the steps.
+
+    graphics_layer - the graphics layer <g> element, modified in place.
+    rects - the step `Rect`s, from `process_layout_layer`.
+    margin - extra visible margin around each step, relative to its size.
+    parent_transform - the Affine of the graphics layer's parent, if any.
+
+    Return a CullResult with the number of removed nodes and serialized bytes.
+    """
+    if parent_transform is None:
+        parent_transform = Affine()
+    index = spatial.RTree((box, None) for box in visible_boxes(rects, margin))
+    culler = _Culler(index, referenced_ids(graphics_layer.getroottree().getroot()))
+
+    if len(index):
+        culler.cull(graphics_layer, parent_transform, (None, None))
+    return CullResult(culler.nodes, culler.bytes)
@@ -0,0 +1,227 @@
+"""
+Deduplication of embedded images and repeated definitions in the graphics.
+
+Embedded (data: URI) images that appear more than once are defined once in
+<defs>, and drawn with <use>. Structurally identical definitions (gradients,
+filters, patterns, ...) are merged into the first one, and the references to
+the others are rewritten. Large embedded images can be extracted to files.
+"""
+import base64
+import binascii
+import hashlib
+import re
+from collections import namedtuple, OrderedDict
+
+from lxml import etree
+
+import culling
+
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+
+# Elements that are only rendered by reference, and can be merged
+DEFINITION_ELEMENTS = set([
+    "linearGradient", "radialGradient", "pattern", "filter", "clipPath",
+    "mask", "marker", "symbol",
+    ])
+
+# Attributes of an <image> that stay on the shared definition. The rest
+# (position, transform, style, id...) go on each <use>.
+SHARED_IMAGE_ATTRIBUTES = set(["width", "height", "preserveAspectRatio"])
+
+# File extensions of extractable image types
+IMAGE_EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/svg+xml": "svg",
+    }
+
+DedupResult = namedtuple("DedupResult", "images definitions extracted")
+
+_URL_REF_RE = re.compile(r"""url\(\s*(['"]?)#([^'")\s]+)\1\s*\)""")
+_DATA_URI_RE = re.compile(r"data:([^;,]*)(?:;[^;,]*)*?;base64,(.*)$", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _href_attribute(element):
+    """Return the name of the href attribute the element uses, or None.
+    """
+    for name in (XLINK_HREF, "href"):
+        if element.get(name) is not None:
+            return name
+    return None
+
+
+def _structure_key(element):
+    """A hashable key, equal for elements that differ only in their id.
+    """
+    attributes = tuple(sorted((name, value) for name, value in element.items() if name != "id"))
+    children = tuple(_structure_key(child) for child in element if isinstance(child.tag, basestring))
+    return (element.tag, attributes, (element.text or "").strip(), children)
+
+
+def _unique_id(prefix, used_ids):
+    number = 0
+    while "%s%d" % (prefix, number) in used_ids:
+        number += 1
+    new_id = "%s%d" % (prefix, number)
+    used_ids.add(new_id)
+    return new_id
+
+
+def _get_defs(graphics_layer):
+    """Return the <defs> child of the graphics layer, creating it if needed.
+    """
+    for child in graphics_layer:
+        if child.tag == "defs":
+            return child
+    defs = etree.Element("defs")
+    defs.tail = graphics_layer.text
+    graphics_layer.insert(0, defs)
+    return defs
+
+
+def rewrite_references(root, replacements):
+    """Replace the references (href="#id" and url(#id)) to the ids in the
+    `replacements` dict with references to their values.
+    """
+    def replace_url(match):
+        quote, ref = match.groups()
+        return "url(%s#%s%s)" % (quote, replacements.get(ref, ref), quote)
+
+    for element in root.iter(etree.Element):
+        for name, value in element.items():
+            if name in ("href", XLINK_HREF):
+                if value.startswith("#") and value[1:] in replacements:
+                    element.set(name, "#" + replacements[value[1:]])
+            elif "url(" in value:
+                element.set(name, _URL_REF_RE.sub(replace_url, value))
+        if element.tag == "style" and element.text and "url(" in element.text:
+            element.text = _URL_REF_RE.sub(replace_url, element.text)
+
+
+def merge_definitions(graphics_layer):
+    """Merge structurally identical definitions into the first of them.
+
+    Return the number of removed definitions.
+    """
+    removed = 0
+    # Merging can make more definitions identical (gradients referring to
+    # merged gradients), so repeat until nothing changes
+    while True:
+        keepers = {}
+        replacements = {}
+        for element in graphics_layer.iter(etree.Element):
+            if element.tag not in DEFINITION_ELEMENTS or element.get("id") is None:
+                continue
+            key = _structure_key(element)
+            keeper = keepers.setdefault(key, element)
+            if keeper is not element:
+                replacements[element.get("id")] = keeper.get("id")
+        if not replacements:
+            return removed
+
+        for element in list(graphics_layer.iter(etree.Element)):
+            if element.tag in DEFINITION_ELEMENTS and element.get("id") in replacements:
+                parent = element.getparent()
+                if parent is not None:
+                    culling.remove_element(element)
+                    removed += 1
+        rewrite_references(graphics_layer, replacements)
+
+
+def share_images(graphics_layer):
+    """Define every embedded image that is used more than once in <defs>,
+    and replace its uses with <use> elements.
+
+    Return the number of replaced images.
+    """
+    groups = OrderedDict()
+    for element in graphics_layer.iter("image"):
+        href_name = _href_attribute(element)
+        if href_name is None:
+            continue
+        href = element.get(href_name)
+        if not href.startswith("data:"):
+            continue
+        shared = tuple(sorted((name, value) for name, value in element.items()
+                              if name in SHARED_IMAGE_ATTRIBUTES))
+        key = (hashlib.sha1(_WHITESPACE_RE.sub("", href)).hexdigest(), shared)
+        groups.setdefault(key, []).append((element, href_name))
+
+    used_ids = set(element.get("id") for element in graphics_layer.iter(etree.Element))
+    replaced = 0
+    defs = None
+    for images in groups.itervalues():
+        if len(images) < 2:
+            continue
+        if defs is None:
+            defs = _get_defs(graphics_layer)
+
+        first, href_name = images[0]
+        definition = etree.SubElement(defs, "image")
+        definition.set("id", _unique_id("image", used_ids))
+        definition.set(href_name, first.get(href_name))
+        for name in SHARED_IMAGE_ATTRIBUTES:
+            if first.get(name) is not None:
+                definition.set(name, first.get(name))
+
+        for image, href_name in images:
+            use = etree.Element("use")
+            use.set(href_name, "#" + definition.get("id"))
+            for name, value in image.items():
+                if name not in SHARED_IMAGE_ATTRIBUTES and name != href_name:
+                    use.set(name, value)
+            use.tail = image.tail
+            image.getparent().replace(image, use)
+            replaced += 1
+    return replaced
+
+
+def extract_images(graphics_layer, write_image, min_bytes=0):
+    """Move embedded images of at least min_bytes (decoded) into files.
+
+    write_image(data, extension) writes the image data into a file, and
+    returns its href.
+
+    Return the number of extracted images.
+    """
+    extracted = 0
+    # The same image is written once
+    written = {}
+    for element in graphics_layer.iter("image"):
+        href_name = _href_attribute(element)
+        if href_name is None:
+            continue
+        match = _DATA_URI_RE.match(element.get(href_name))
+        if match is None or match.group(1) not in IMAGE_EXTENSIONS:
+            continue
+        encoded = _WHITESPACE_RE.sub("", match.group(2))
+        if encoded not in written:
+            try:
+                data = base64.b64decode(encoded)
+            except (TypeError, binascii.Error):
+                continue
+            if len(data) < min_bytes:
+                continue
+            written[encoded] = write_image(data, IMAGE_EXTENSIONS[match.group(1)])
+        element.set(href_name, written[encoded])
+        extracted += 1
+    return extracted
+
+
+def dedup_graphics(graphics_layer, write_image=None, extract_min_bytes=0):
+    """Deduplicate the definitions and embedded images of the graphics
+    layer, in place. With write_image (see `extract_images`), also extract
+    the embedded images of at least extract_min_bytes into files.
+
+    Return a DedupResult with the number of merged definitions, shared images
+    and extracted images.
+    """
+    definitions = merge_definitions(graphics_layer)
+    extracted = 0
+    if write_image is not None:
+        extracted = extract_images(graphics_layer, write_image, extract_min_bytes)
+    images = share_images(graphics_layer)
+    return DedupResult(images, definitions, extracted)
@@ -0,0 +1,358 @@
+"""
+Levels of detail - simplified copies of the paths, for the steps that show
+the graphics zoomed out (like the overview).
+
+At a step of scale s, a pixel of the window covers s units of the canvas, so
+the details of a path much smaller than that are never seen. For each level
+of detail, the paths are flattened into polylines and simplified with the
+Douglas-Peucker algorithm, within a tolerance of a fraction of a pixel. The
+simplified copy is added right after the path, and a style sheet shows one or
+the other depending on the active step - impress.js sets an
+"impress-on-<step id>" class on the <body>.
+
+Paths with arcs or markers, and referenced paths, are left as they are.
+"""
+import math
+import re
+from collections import namedtuple
+
+from lxml import etree
+
+from affine import Affine, parse_transform_list
+import culling
+import minify
+
+# The default tolerance, in window pixels
+DEFAULT_PIXELS = 0.5
+
+# Steps zoomed out at least this much more than the median step get a level
+LEVEL_SCALE_RATIO = 4.
+
+# Steps whose tolerances are within this ratio share a level
+LEVEL_MERGE_RATIO = 2.
+
+# The most segments a curve is flattened into
+MAX_CURVE_SEGMENTS = 64
+
+# Classes of the paths hidden by, and of the copies shown by, each level
+DETAIL_CLASS = "impress-detail-%d"
+LEVEL_CLASS = "impress-lod-%d"
+
+# tolerance - in canvas units. steps - the ids of the steps showing the level.
+Level = namedtuple("Level", "tolerance steps")
+
+_CSS_ESCAPE_RE = re.compile(r"[^\w-]")
+
+
+def detail_levels(steps, pixels=DEFAULT_PIXELS, overview_ids=()):
+    """Return the Levels for the steps zoomed out more than the others.
+
+    steps - (id, scale) of every step. Steps without an id are skipped.
+    pixels - the tolerance, in window pixels.
+    overview_ids - ids of steps that always get a level.
+    """
+    scales = sorted(scale for _, scale in steps)
+    if not scales:
+        return []
+    median = scales[len(scales) // 2]
+    zoomed_out = sorted((scale, step_id) for step_id, scale in steps
+                        if step_id is not None and
+                        (step_id in overview_ids or scale >= LEVEL_SCALE_RATIO * median))
+
+    levels = []
+    for scale, step_id in zoomed_out:
+        tolerance = scale * pixels
+        if levels and tolerance < levels[-1].tolerance * LEVEL_MERGE_RATIO:
+            levels[-1].steps.append(step_id)
+        else:
+            levels.append(Level(tolerance, [step_id]))
+    return levels
+
+
+def _curve_segments(deviation, tolerance):
+    """The number of straight segments for a curve, so they are never
+    further than tolerance from it. deviation is the maximal second
+    derivative of the curve, divided by 8.
+    """
+    if deviation <= tolerance:
+        return 1
+    return min(int(math.ceil(math.sqrt(deviation / tolerance))), MAX_CURVE_SEGMENTS)
+
+
+def _cubic_points(p0, p1, p2, p3, tolerance):
+    deviation = 0.75 * max(math.hypot(p0[0] - 2 * p1[0] + p2[0], p0[1] - 2 * p1[1] + p2[1]),
+                           math.hypot(p1[0] - 2 * p2[0] + p3[0], p1[1] - 2 * p2[1] + p3[1]))
+    count = _curve_segments(deviation, tolerance)
+    points = []
+    for i in xrange(1, count + 1):
+        t = float(i) / count
+        mt = 1 - t
+        a, b, c, d = mt * mt * mt, 3 * mt * mt * t, 3 * mt * t * t, t * t * t
+        points.append((a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+                       a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1]))
+    return points
+
+
+def _quadratic_points(p0, p1, p2, tolerance):
+    deviation = 0.25 * math.hypot(p0[0] - 2 * p1[0] + p2[0], p0[1] - 2 * p1[1] + p2[1])
+    count = _curve_segments(deviation, tolerance)
+    points = []
+    for i in xrange(1, count + 1):
+        t = float(i) / count
+        mt = 1 - t
+        a, b, c = mt * mt, 2 * mt * t, t * t
+        points.append((a * p0[0] + b * p1[0] + c * p2[0],
+                       a * p0[1] + b * p1[1] + c * p2[1]))
+    return points
+
+
+def flatten_path(d, tolerance):
+    """Return the subpaths of the path data as polylines, never further than
+    tolerance from the path - a list of (points, closed).
+
+    Return None if the path can't be flattened (arcs, invalid data).
+    """
+    try:
+        commands = list(culling.path_commands(d))
+    except ValueError:
+        return None
+    subpaths = []
+    points = None
+    x = y = 0.
+    # (command, point) - the last control point, for reflection by S and T
+    control = None
+    for command, args in commands:
+        upper = command.upper()
+        if upper == "Z":
+            if points is None:
+                return None
+            subpaths.append((points, True))
+            x, y = points[0]
+            points = None
+            control = None
+            continue
+
+        relative = command.islower()
+        base_x, base_y = (x, y) if relative else (0., 0.)
+
+        if upper == "M":
+            if points is not None:
+                subpaths.append((points, False))
+            x, y = args[0] + base_x, args[1] + base_y
+            points = [(x, y)]
+            control = None
+            continue
+        if upper == "A":
+            return None
+        if points is None:
+            # Drawing on after a closepath starts a new subpath
+            points = [(x, y)]
+
+        start = (x, y)
+        if upper == "H":
+            x = args[0] + (x if relative else 0.)
+            points.append((x, y))
+            control = None
+        elif upper == "V":
+            y = args[0] + (y if relative else 0.)
+            points.append((x, y))
+            control = None
+        elif upper == "L":
+            x, y = args[0] + base_x, args[1] + base_y
+            points.append((x, y))
+            control = None
+        elif upper in "CS":
+            coords = [(args[i] + base_x, args[i + 1] + base_y) for i in xrange(0, len(args), 2)]
+            if upper == "S":
+                if control is not None and control[0] == "C":
+                    first = (2 * x - control[1][0], 2 * y - control[1][1])
+                else:
+                    first = start
+                coords.insert(0, first)
+            points.extend(_cubic_points(start, coords[0], coords[1], coords[2], tolerance))
+            control = ("C", coords[1])
+            x, y = coords[2]
+        else:
+            coords = [(args[i] + base_x, args[i + 1] + base_y) for i in xrange(0, len(args), 2)]
+            if upper == "T":
+                if control is not None and control[0] == "Q":
+                    coords.insert(0, (2 * x - control[1][0], 2 * y - control[1][1]))
+                else:
+                    coords.insert(0, start)
+            points.extend(_quadratic_points(start, coords[0], coords[1], tolerance))
+            control = ("Q", coords[0])
+            x, y = coords[1]
+
+    if points is not None:
+        subpaths.append((points, False))
+    return subpaths
+
+
+def _segment_distance(point, start, end):
+    """Distance of point from the segment start-end.
+    """
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length = dx * dx + dy * dy
+    if length:
+        t = ((point[0] - start[0]) * dx + (point[1] - start[1]) * dy) / length
+        t = min(max(t, 0.), 1.)
+    else:
+        t = 0.
+    return math.hypot(point[0] - start[0] - t * dx, point[1] - start[1] - t * dy)
+
+
+def douglas_peucker(points, tolerance):
+    """Simplify the polyline, dropping the points that are within tolerance
+    of the simplified polyline. The first and last points are kept.
+    """
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest = None
+        max_distance = tolerance
+        for i in xrange(first + 1, last):
+            distance = _segment_distance(points[i], points[first], points[last])
+            if distance > max_distance:
+                farthest = i
+                max_distance = distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_path(d, tolerance):
+    """Return the path data simplified into polylines within tolerance of
+    the path. Subpaths smaller than tolerance are dropped.
+
+    Return None if the path can't be simplified (see `flatten_path`).
+    """
+    # Half of the tolerance for flattening, half for simplifying
+    subpaths = flatten_path(d, tolerance / 2.)
+    if subpaths is None:
+        return None
+    precision = max(0, int(-math.floor(math.log10(tolerance))) + 1)
+    parts = []
+    for points, closed in subpaths:
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        if max(xs) - min(xs) < tolerance and max(ys) - min(ys) < tolerance:
+            continue
+        points = douglas_peucker(points, tolerance / 2.)
+        parts.append("M" + " ".join("%s %s" % (minify.format_number(x, precision),
+                                              minify.format_number(y, precision))
+                                    for x, y in points))
+        if closed:
+            parts.append("Z")
+    return "".join(parts)
+
+
+def _add_class(element, name):
+    classes = element.get("class")
+    element.set("class", name if not classes else classes + " " + name)
+
+
+class _Simplifier(object):
+    def __init__(self, levels, referenced):
+        self._levels = levels
+        self._referenced = referenced
+        self.paths = 0
+
+    def simplify(self, element, parent_transform):
+        """Add the simplified copies of the paths in element.
+        """
+        tag = element.tag
+        if not isinstance(tag, basestring) or tag in culling.REFERENCED_CONTAINERS:
+            return
+        if element.get("id") in self._referenced:
+            return
+        transform = parent_transform
+        if element.get("transform") is not None:
+            try:
+                transform = parent_transform * parse_transform_list(element.get("transform"))
+            except ValueError:
+                return
+
+        style = culling.parse_style(element)
+        if culling.has_markers(element, style):
+            # Markers are drawn on every vertex
+            return
+
+        if tag in culling.GROUP_ELEMENTS:
+            for child in list(element):
+                self.simplify(child, transform)
+        elif tag == "path" and element.get("d"):
+            self._simplify_path(element, transform)
+
+    def _simplify_path(self, element, transform):
+        # The tolerance is in canvas units, the path data in its own
+        scale = math.sqrt(abs(transform.a * transform.d - transform.b * transform.c))
+        if not scale:
+            return
+        d = element.get("d")
+        classes = element.get("class")
+        previous = element
+        for number, level in enumerate(self._levels):
+            simplified = simplify_path(d, level.tolerance / scale)
+            if simplified is None:
+                return
+            if len(simplified) >= len(d):
+                # Not simpler, show the path itself
+                continue
+            _add_class(element, DETAIL_CLASS % number)
+            self.paths += 1
+            if not simplified:
+                # Too small to be seen
+                continue
+            copy = etree.Element(element.tag, dict(element.attrib))
+            copy.attrib.pop("id", None)
+            copy.set("d", simplified)
+            # The classes of the path, without those that hide it
+            copy.set("class", classes or "")
+            _add_class(copy, LEVEL_CLASS % number)
+            copy.tail = previous.tail
+            previous.addnext(copy)
+            previous = copy
+
+
+def add_detail_levels(graphics_layer, levels, parent_transform=None):
+    """Add a simplified copy for every level to the paths of graphics_layer
+    (modified in place), see `level_style`.
+
+    levels - the Levels, from `detail_levels`.
+    parent_transform - the Affine of the graphics layer's parent, if any.
+
+    Return the number of simplified paths (at any level).
+    """
+    if parent_transform is None:
+        parent_transform = Affine()
+    simplifier = _Simplifier(levels, culling.referenced_ids(graphics_layer.getroottree().getroot()))
+    if levels:
+        simplifier.simplify(graphics_layer, parent_transform)
+    return simplifier.paths
+
+
+def css_identifier(text):
+    """Escape text for use in a CSS selector.
+    """
+    return _CSS_ESCAPE_RE.sub(lambda match: "\\%x " % ord(match.group(0)), text)
+
+
+def level_style(levels):
+    """Return the style sheet showing the level of detail of the active step.
+    """
+    rules = []
+    for number, level in enumerate(levels):
+        steps = ["body.impress-on-%s " % css_identifier(step) for step in level.steps]
+        rules.append(".%s { display: none; }" % (LEVEL_CLASS % number, ))
+        rules.append("%s { display: inline; }" % (
+            ", ".join(step + "." + LEVEL_CLASS % number for step in steps), ))
+        rules.append("%s { display: none; }" % (
+            ", ".join(step + "." + DETAIL_CLASS % number for step in steps), ))
+    return "\n".join(rules)
@@ -1,3 +1,5 @@
+from __future__ import division
+
 import types
 import operator
 
@@ -15,20 +17,25 @@ vectors.
 Indexing is zero-based, i.e. the upper left-hand corner of a matrix is element
 (0,0), not element (1,1).
 
-Matricies are stored as a list of lists, where the top level lists are the rows
-and the sub-lists are the columns.  Because of the way Python handles list
-references, you have be careful when copying matrix objects.  If you have a
-matrix a, assign b=a, and then change values in b, you will change values in a
-as well.  Matrix copying should be done with copy.deepcopy.
+Matricies are stored as a single flat list of the values, row after row.  The
+m attribute gives (and takes) them as a list of lists, where the top level
+lists are the rows and the sub-lists are the columns; the rows it gives are
+views of the stored values, so changing them changes the matrix.
+If you have a matrix a, assign b=a, and then change values in b, you will
+change values in a as well.  Matrix copying should be done with copy.deepcopy.
+
+The in-place operators (+=, -=, *=) and add_product (a fused a += b*c) change
+the matrix they are applied to, instead of creating a new one.  Products of 2x2
+and 3x3 matricies are unrolled.
 
 This implementation has no memory-saving optimization for sparse matricies.  A
 derived class may implement a more sophisticated storage method by overriding 
 the __getitem__ and __setitem__ functions.
 
-Determinants are taken by expanding by minors on the top row.  The private 
-functions supplied for expansion by minors are more generic than what is needed
-by this implementation.  They may be used by a derived class that wishes to do
-more efficient expansion of sparse matricies.
+Determinants of 2x2 and 3x3 matricies are calculated directly, larger ones by
+Gaussian elimination.  The functions supplied for expansion by minors are
+still available for a derived class that wishes to do more efficient expansion
+of sparse matricies.
 
 By default, Matrix elements are members of the complex field, but if you want
 to perform linear algebra on something other than numbers you may redefine
@@ -44,6 +51,104 @@ __author__ = "Bill McNeill <billmcn@speakeasy.net>"
 __version__ = "1.0"
 
 
+class Row_View(object):
+	"""A row of a matrix, as a view of its stored values
+
+	Behaves like the list of the values of the row, but setting an item sets
+	the value in the matrix.
+	"""
+	def __init__(self, data, start, cols):
+		self._data = data
+		self._start = start
+		self._cols = cols
+
+	def _values(self):
+		return self._data[self._start:self._start + self._cols]
+
+	def __len__(self):
+		return self._cols
+
+	def __iter__(self):
+		return iter(self._values())
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return self._values()[i]
+		if i < 0:
+			i += self._cols
+		if not 0 <= i < self._cols:
+			raise IndexError("row index out of range")
+		return self._data[self._start + i]
+
+	def __setitem__(self, i, value):
+		if isinstance(i, slice):
+			values = self._values()
+			values[i] = value
+			if len(values) != self._cols:
+				raise ValueError("Cannot change the length of a row")
+			self._data[self._start:self._start + self._cols] = values
+			return
+		if i < 0:
+			i += self._cols
+		if not 0 <= i < self._cols:
+			raise IndexError("row index out of range")
+		self._data[self._start + i] = value
+
+	def __eq__(self, other):
+		return self._values() == list(other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	__hash__ = None
+
+	def __repr__(self):
+		return repr(self._values())
+
+
+class Rows_View(object):
+	"""The rows of a matrix, as Row_Views
+
+	Behaves like the list of the rows, but setting a row sets its values in
+	the matrix.
+	"""
+	def __init__(self, matrix):
+		self._matrix = matrix
+
+	def _row(self, i):
+		return Row_View(self._matrix._data, i * self._matrix._cols, self._matrix._cols)
+
+	def __len__(self):
+		return self._matrix._rows
+
+	def __iter__(self):
+		return (self._row(i) for i in xrange(self._matrix._rows))
+
+	def __getitem__(self, i):
+		rows = self._matrix._rows
+		if isinstance(i, slice):
+			return [self._row(index) for index in xrange(*i.indices(rows))]
+		if i < 0:
+			i += rows
+		if not 0 <= i < rows:
+			raise IndexError("list index out of range")
+		return self._row(i)
+
+	def __setitem__(self, i, row):
+		self[i][:] = row
+
+	def __eq__(self, other):
+		return list(self) == list(other)
+
+	def __ne__(self, other):
+		return not self == other
+
+	__hash__ = None
+
+	def __repr__(self):
+		return repr(self._matrix._row_lists())
+
+
 class Matrix_Error(Exception):
 	"""Abstract parent for all matrix exceptions
 	"""
@@ -137,7 +242,7 @@ class Matrix(object):
 		A matrix can be created in three ways.
 
 		1. A single integer argument is supplied.  The constructor creates a
-		null square matrix of that size.  For example 
+		null square matrix of that size.  For example
 
 			Matrix(2)
 
@@ -170,8 +275,8 @@ class Matrix(object):
 
 		"""
 		if not (len(args) == 1 or len(args) == 2):
-			raise TypeError("Matrix() takes 1 or 2 arguments (%d given)") % \
-				len(args)
+			raise TypeError("Matrix() takes 1 or 2 arguments (%d given)" % \
+				len(args))
 		if len(args) == 2:	# Two arguments
 			# Create an null n,m matrix.
 			row, col = args
@@ -182,22 +287,20 @@ class Matrix(object):
 				self.create_null_matrix(args[0], args[0])
 			else:
 				# Create a matrix from initial values.
-				self.m = args[0]
-				if __debug__:
-					# Verify correct format for m.
-					if not isinstance(args[0], types.ListType):
-						raise TypeError("Invalid initial data %s" % args[0])
-					for row in args[0]:
-						if not isinstance(row, types.ListType):
-							raise ValueError("Invalid initial data %s" % \
-								args[0])
-						if not (len(row) == len(args[0][0])):
-							raise ValueError("Non-rectangular initial data")
-					if not (self.cols() > 0):
-						raise ValueError("invalid number of columns %d" % \
-							self.cols())
-					if self.rows() == 1 and self.cols() == 1:
-						raise ValueError("Cannot create 1x1 matrix")
+				self._set_m(args[0])
+
+	@classmethod
+	def from_flat(cls, rows, cols, data):
+		"""Create a rows x cols matrix from a flat list of the values, row
+		after row.  The list is used as the storage of the matrix, not copied.
+
+		This is how results are created, the values are not verified.
+		"""
+		mat = cls.__new__(cls)
+		mat._rows = rows
+		mat._cols = cols
+		mat._data = data
+		return mat
 
 	def create_null_matrix(self, row, col):
 		""" Create a matrix using the null value
@@ -210,25 +313,84 @@ class Matrix(object):
 			raise ValueError("invalid number of columns %d" % col)
 		if row == 1 and col == 1:
 			raise ValueError("Cannot create 1x1 matrix")
-		# Note, you cannot simply write
-		#	self.m = [[self.null_element]*col]*row
-		# because this will make all the rows references of a single instance.
-		self.m = []
-		for i in xrange(row):
-			self.m.append([])
-			for j in xrange(col):
-				self.m[i].append(self.null_element)
+		self._rows = row
+		self._cols = col
+		self._data = [self.null_element] * (row * col)
+
+	def _row_lists(self):
+		"""A copy of the values as a list of rows
+		"""
+		cols = self._cols
+		data = self._data
+		return [data[i:i + cols] for i in xrange(0, len(data), cols)]
+
+	def _get_m(self):
+		return Rows_View(self)
+
+	def _set_m(self, m):
+		if type(m) is not types.ListType and isinstance(m, Rows_View):
+			m = m._matrix._row_lists()
+		data = []
+		if __debug__:
+			# Verify correct format for m, while copying it.  The exact type
+			# is checked first, it is faster than isinstance.
+			if not isinstance(m, types.ListType):
+				raise TypeError("Invalid initial data %s" % m)
+			cols = len(m[0]) if m else 0
+			for row in m:
+				if type(row) is not types.ListType and \
+						not isinstance(row, types.ListType):
+					raise ValueError("Invalid initial data %s" % m)
+				if len(row) != cols:
+					raise ValueError("Non-rectangular initial data")
+				data += row
+			if not (cols > 0):
+				raise ValueError("invalid number of columns %d" % cols)
+			if len(m) == 1 and cols == 1:
+				raise ValueError("Cannot create 1x1 matrix")
+		else:
+			for row in m:
+				data += row
+			cols = len(m[0])
+		self._rows = len(m)
+		self._cols = cols
+		self._data = data
+
+	m = property(_get_m, _set_m, doc="""The values as a list of rows
+
+		The rows are views of the values - setting a row, or a value in a
+		row, changes the matrix.  Assigning a list of lists to m replaces all
+		the values.
+		""")
 
 	def __str__(self):
 		s = ""
-		for row in self.m:
+		for row in self._row_lists():
 			s += "%s\n" % row
 		return s
 
 	def __cmp__(self, other):
 		if not isinstance(other, Matrix):
 			raise TypeError("Cannot compare matrix with %s" % type(other))
-		return cmp(self.m, other.m)
+		if self._cols == other._cols:
+			# Comparing the rows one after the other is the same as comparing
+			# the flat values
+			return cmp(self._data, other._data)
+		return cmp(self._row_lists(), other._row_lists())
+
+	def _index(self, row, col):
+		"""The index of (row, col) in the flat values.  Negative indices
+		count from the end, like list indices.
+		"""
+		rows = self._rows
+		cols = self._cols
+		if row < 0:
+			row += rows
+		if col < 0:
+			col += cols
+		if not (0 <= row < rows and 0 <= col < cols):
+			raise IndexError("matrix index out of range")
+		return row * cols + col
 
 	def __getitem__(self, (row, col)):
 		"""The value at (row, col)
@@ -237,7 +399,10 @@ class Matrix(object):
 
 			m[(1,3)]
 		"""
-		return self.m[row][col]
+		cols = self._cols
+		if 0 <= row < self._rows and 0 <= col < cols:
+			return self._data[row * cols + col]
+		return self._data[self._index(row, col)]
 
 	def __setitem__(self, (row, col), value):
 		"""Sets the value at (row, col)
@@ -246,44 +411,52 @@ class Matrix(object):
 
 			m[(1,3)] = 5
 		"""
-		self.m[row][col] = value
+		cols = self._cols
+		if 0 <= row < self._rows and 0 <= col < cols:
+			self._data[row * cols + col] = value
+		else:
+			self._data[self._index(row, col)] = value
 
 	def rows(self):
 		"""The number of rows in the matrix
 		"""
-		return len(self.m)
+		return self._rows
 
 	def cols(self):
 		"""The number of columns in the matrix
 		"""
-		return len(self.m[0])
+		return self._cols
 
 	def row(self, i):
 		"""The ith row of the matrix
 		"""
-		return self.m[i]
+		start = self._index(i, 0)
+		return self._data[start:start + self._cols]
 
 	def col(self, j):
 		"""The jth row of the matrix
 		"""
-		r = []
-		for row in self.m:
-			r.append(row[j])
-		return r
+		return self._data[self._index(0, j)::self._cols]
 
-	def __add__(self, other):
-		"""Add matrix self+other
-		"""
+	def _check_same_size(self, other):
 		if not isinstance(other, Matrix):
 			raise TypeError("Cannot add a matrix to type %s" % type(other))
-		if not (self.cols() == other.cols() and self.rows() == other.rows()):
+		if not (self._cols == other._cols and self._rows == other._rows):
 			raise Matrix_Addition_Error(self, other)
-		r = []
-		for row in xrange(self.rows()):
-			r.append([])
-			for col in xrange(self.cols()):
-				r[row].append(self[(row, col)] + other[(row, col)])
-		return Matrix(r)
+
+	def __add__(self, other):
+		"""Add matrix self+other
+		"""
+		self._check_same_size(other)
+		return Matrix.from_flat(self._rows, self._cols,
+			map(operator.add, self._data, other._data))
+
+	def __iadd__(self, other):
+		"""Add other to the matrix, in place
+		"""
+		self._check_same_size(other)
+		self._data[:] = map(operator.add, self._data, other._data)
+		return self
 
 	def __neg__(self):
 		"""Negate the current matrix
@@ -293,7 +466,16 @@ class Matrix(object):
 	def __sub__(self, other):
 		"""Subtract matrix self-other
 		"""
-		return self + -other
+		self._check_same_size(other)
+		return Matrix.from_flat(self._rows, self._cols,
+			map(operator.sub, self._data, other._data))
+
+	def __isub__(self, other):
+		"""Subtract other from the matrix, in place
+		"""
+		self._check_same_size(other)
+		self._data[:] = map(operator.sub, self._data, other._data)
+		return self
 
 	def __mul__(self, other):
 		"""Multiply matrix self*other
@@ -318,15 +500,37 @@ class Matrix(object):
 			raise TypeError("Cannot right-multiply by %s" % type(other))
 		return self.scalar_multiply(other)
 
+	def __imul__(self, other):
+		"""Multiply the matrix by other (a matrix or a scalar), in place
+
+		As with *, a product of a single value is a scalar, which replaces the
+		matrix.
+		"""
+		if self.is_scalar_element(other):
+			self._data[:] = [x*other for x in self._data]
+			return self
+		product = self * other
+		if not isinstance(product, Matrix):
+			return product
+		self._rows = product._rows
+		self._cols = product._cols
+		self._data[:] = product._data
+		return self
+
 	def scalar_multiply(self, scalar):
 		"""Multiply the matrix by a scalar value.
 
 		This is a private function called by __mul__ and __rmul__.
 		"""
-		r = []
-		for row in self.m:				
-			r.append(map(lambda x: x*scalar, row))
-		return Matrix(r)
+		return Matrix.from_flat(self._rows, self._cols,
+			[x*scalar for x in self._data])
+
+	def _columns(self):
+		"""The columns of the matrix, as lists
+		"""
+		data = self._data
+		cols = self._cols
+		return [data[j::cols] for j in xrange(cols)]
 
 	def matrix_multiply(self, other):
 		"""Multiply the matrix by another matrix.
@@ -334,44 +538,91 @@ class Matrix(object):
 		This is a private function called by __mul__.
 		"""
 		# Take the product of two matricies.
-		r = []
 		assert(isinstance(other, Matrix))
-		if not self.cols() == other.rows():
+		if not self._cols == other._rows:
 			raise Matrix_Multiplication_Error(self, other)
-		for row in xrange(self.rows()):
-			r.append([])
-			for col in xrange(other.cols()):
-				r[row].append( \
-					self.vector_inner_product(self.row(row), other.col(col)))
-		if len(r) == 1 and len(r[0]) == 1:
+		rows = self._rows
+		cols = other._cols
+		a = self._data
+		b = other._data
+		if rows == cols == self._cols == 2:
+			a00, a01, a10, a11 = a
+			b00, b01, b10, b11 = b
+			return Matrix.from_flat(2, 2, [
+				a00*b00 + a01*b10, a00*b01 + a01*b11,
+				a10*b00 + a11*b10, a10*b01 + a11*b11])
+		if rows == cols == self._cols == 3:
+			a00, a01, a02, a10, a11, a12, a20, a21, a22 = a
+			b00, b01, b02, b10, b11, b12, b20, b21, b22 = b
+			return Matrix.from_flat(3, 3, [
+				a00*b00 + a01*b10 + a02*b20,
+				a00*b01 + a01*b11 + a02*b21,
+				a00*b02 + a01*b12 + a02*b22,
+				a10*b00 + a11*b10 + a12*b20,
+				a10*b01 + a11*b11 + a12*b21,
+				a10*b02 + a11*b12 + a12*b22,
+				a20*b00 + a21*b10 + a22*b20,
+				a20*b01 + a21*b11 + a22*b21,
+				a20*b02 + a21*b12 + a22*b22])
+
+		inner = self._cols
+		columns = other._columns()
+		product = self.vector_inner_product
+		r = []
+		for start in xrange(0, rows * inner, inner):
+			row = a[start:start + inner]
+			r.extend([product(row, column) for column in columns])
+		if rows == 1 and cols == 1:
 			# The result is a scalar.
-			return r[0][0]
+			return r[0]
 		else:
 			# The result is a matrix.
-			return Matrix(r)
+			return Matrix.from_flat(rows, cols, r)
+
+	def add_product(self, a, b):
+		"""Add the product of matricies a*b to the matrix, in place
+
+		The sums are accumulated into the matrix directly, without creating
+		the product matrix.
+		"""
+		if not a._cols == b._rows:
+			raise Matrix_Multiplication_Error(a, b)
+		if not (self._rows == a._rows and self._cols == b._cols):
+			raise Matrix_Addition_Error(self, Matrix.from_flat(a._rows, b._cols, []))
+		inner = a._cols
+		a_data = a._data
+		columns = b._columns()
+		data = self._data
+		index = 0
+		for start in xrange(0, a._rows * inner, inner):
+			row = a_data[start:start + inner]
+			for column in columns:
+				data[index] += sum(map(operator.mul, row, column), self.null_element)
+				index += 1
+		return self
 
 	def is_row_vector(self):
 		"""Is the matrix a row vector?
 		"""
-		return self.rows() == 1 and self.cols() > 1
+		return self._rows == 1 and self._cols > 1
 
 	def is_column_vector(self):
 		"""Is the matrix a column vector?
 		"""
-		return self.cols() == 1 and self.rows() > 1
+		return self._cols == 1 and self._rows > 1
 
 	def is_square(self):
 		"""Is the matrix square?
 		"""
-		return self.rows() == self.cols()
+		return self._rows == self._cols
 
 	def transpose(self):
 		"""The transpose of the matrix
 		"""
 		r = []
-		for col in xrange(self.cols()):
-			r.append(self.col(col))
-		return Matrix(r)
+		for column in self._columns():
+			r.extend(column)
+		return Matrix.from_flat(self._cols, self._rows, r)
 
 	def trace(self):
 		"""The trace of the matrix
@@ -379,8 +630,8 @@ class Matrix(object):
 		if not self.is_square():
 			raise Trace_Error()
 		t = 0
-		for i in xrange(self.rows()):
-			t += self[(i,i)]
+		for value in self._data[::self._cols + 1]:
+			t += value
 		return t
 
 	def determinant(self):
@@ -388,11 +639,75 @@ class Matrix(object):
 		"""
 		if not self.is_square():
 			raise Determinant_Error()
-		# Calculate 2x2 determinants directly.
-		if self.rows() == 2:
-			return self[(0, 0)]*self[(1, 1)] - self[(0, 1)]*self[(1, 0)]
-		# Expand by minors for larger matricies.
-		return self.expand_by_minors_on_row(0)
+		values = self._data
+		# Calculate 2x2 and 3x3 determinants directly.
+		if self._rows == 2:
+			return values[0]*values[3] - values[1]*values[2]
+		if self._rows == 3:
+			a, b, c, d, e, f, g, h, i = values
+			return a*(e*i - f*h) - b*(d*i - f*g) + c*(d*h - e*g)
+		# Eliminate for larger matricies.
+		return self.determinant_by_elimination()
+
+	def determinant_by_elimination(self):
+		"""Calculates the determinant by Gaussian elimination
+
+		Takes O(n^3) steps.  Integer matricies are eliminated without division
+		(Bareiss algorithm), so their determinant is exact.  Other matricies
+		are LU decomposed with partial pivoting.
+		"""
+		if not self.is_square():
+			raise Determinant_Error()
+		n = self._rows
+		rows = self._row_lists()
+		if all(isinstance(x, (int, long)) for x in self._data):
+			return self._integer_determinant(rows, n)
+
+		det = self.identity_element
+		for k in xrange(n):
+			pivot_index = max(xrange(k, n), key=lambda i: abs(rows[i][k]))
+			pivot_row = rows[pivot_index]
+			pivot = pivot_row[k]
+			if pivot == 0:
+				return pivot
+			if pivot_index != k:
+				rows[pivot_index] = rows[k]
+				rows[k] = pivot_row
+				det = -det
+			det *= pivot
+			for i in xrange(k + 1, n):
+				row = rows[i]
+				factor = row[k] / pivot
+				if factor:
+					for j in xrange(k + 1, n):
+						row[j] -= factor * pivot_row[j]
+		return det
+
+	def _integer_determinant(self, rows, n):
+		"""Bareiss elimination of rows, a list of lists of integers.
+		Changes rows.
+		"""
+		sign = 1
+		previous = 1
+		for k in xrange(n - 1):
+			if rows[k][k] == 0:
+				for i in xrange(k + 1, n):
+					if rows[i][k] != 0:
+						rows[i], rows[k] = rows[k], rows[i]
+						sign = -sign
+						break
+				else:
+					return 0
+			pivot_row = rows[k]
+			pivot = pivot_row[k]
+			for i in xrange(k + 1, n):
+				row = rows[i]
+				factor = row[k]
+				for j in xrange(k + 1, n):
+					# The division is exact
+					row[j] = (row[j]*pivot - factor*pivot_row[j]) // previous
+			previous = pivot
+		return sign * rows[n - 1][n - 1]
 
 	def expand_by_minors_on_row(self, row):
 		"""Calculates the determinant by expansion of minors
@@ -435,20 +750,18 @@ class Matrix(object):
 			raise ValueError("Row value %d is out of range" % i)
 		if j<0 or j>=self.cols():
 			raise ValueError("Column value %d is out of range" % j)
-		# Create the output matrix.
-		m = Matrix(self.rows()-1, self.cols()-1)
-		# Loop through the matrix, skipping over the row and column specified
-		# by i and j.
-		minor_row = minor_col = 0
-		for self_row in xrange(self.rows()):
-			if not self_row == i:	# Skip row i.
-				for self_col in xrange(self.cols()):
-					if not self_col == j:	# Skip column j.
-						m[(minor_row, minor_col)] = self[(self_row, self_col)]
-						minor_col += 1
-				minor_col = 0
-				minor_row += 1
-		return m
+		size = self._rows - 1
+		if size == 1:
+			raise ValueError("Cannot create 1x1 matrix")
+		# Copy the rows, skipping over the row and column specified by i and j.
+		data = self._data
+		cols = self._cols
+		m = []
+		for start in xrange(0, len(data), cols):
+			if not start == i * cols:	# Skip row i.
+				m.extend(data[start:start + j])
+				m.extend(data[start + j + 1:start + cols])
+		return Matrix.from_flat(size, size, m)
 
 	def vector_inner_product(self, a, b):
 		"""Takes the inner product of vectors a and b
@@ -458,7 +771,7 @@ class Matrix(object):
 		"""
 		assert(isinstance(a, types.ListType))
 		assert(isinstance(b, types.ListType))
-		return reduce(operator.add, map(operator.mul, a, b))
+		return sum(map(operator.mul, a, b), self.null_element)
 
 	def is_scalar_element(self, x):
 		"""Is x a scalar
@@ -483,8 +796,7 @@ def unit_matrix(n):
 		0 0 1
 	"""
 	m = Matrix(n)
-	for i in xrange(m.rows()):
-		m[(i,i)] = m.identity_element
+	m._data[::n + 1] = [m.identity_element] * n
 	return m
 
 eye = unit_matrix
@@ -0,0 +1,174 @@
+"""
+Output size reduction for the graphics layer.
+
+Rounds path data to a given precision, strips Inkscape/Sodipodi editor data
+and metadata, and drops indentation whitespace.
+"""
+import math
+import re
+
+from lxml import etree
+
+import culling
+
+INKSCAPE_NAMESPACE = "http://www.inkscape.org/namespaces/inkscape"
+SODIPODI_NAMESPACE = "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+
+# Namespaces of editor-only elements and attributes
+EDITOR_NAMESPACES = set([INKSCAPE_NAMESPACE, SODIPODI_NAMESPACE])
+
+# Elements that are never rendered
+METADATA_ELEMENTS = set(["metadata"])
+
+# Elements whose whitespace is content
+TEXT_ELEMENTS = set(["text", "tspan", "textPath", "title", "desc", "style", "script"])
+
+# Attributes holding path data, rounded with `round_path_data`
+PATH_DATA_ATTRIBUTES = ("d", "points")
+
+_PATH_TOKEN_RE = re.compile(
+    r"([A-Za-z])|([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|([\s,]+)|(.)")
+
+# An arc flag is a single digit, it may be packed with the next number
+_ARC_FLAG_RE = re.compile(r"[\s,]*([01])")
+
+# Arc arguments: rx ry x-axis-rotation large-arc-flag sweep-flag x y
+_ARC_ARGS = 7
+_ARC_FLAGS = (3, 4)
+
+
+def format_number(value, precision):
+    """Format value rounded to `precision` decimal digits, as short as possible.
+    """
+    text = "%.*f" % (precision, value)
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    if text in ("-0", ""):
+        text = "0"
+    return text
+
+
+def format_scale(value, precision):
+    """Like `format_number`, but keep `precision` significant digits for values
+    below 1 - for factors, where the relative error matters.
+    """
+    if value and abs(value) < 1:
+        precision += int(-math.floor(math.log10(abs(value)))) - 1
+    return format_number(value, precision)
+
+
+def round_path_data(data, precision):
+    """Round the numbers in path data (or a points list) to `precision`
+    decimal digits, and drop unneeded separators.
+
+    Integers and arc flags are kept as they are.
+    Return the data unchanged if it has unexpected characters.
+    """
+    parts = []
+    previous_number = False
+    command = None
+    # Numbers read since the last command
+    arguments = 0
+    pos = 0
+    while pos < len(data):
+        if command in ("A", "a") and arguments % _ARC_ARGS in _ARC_FLAGS:
+            flag = _ARC_FLAG_RE.match(data, pos)
+            if flag is None:
+                return data
+            pos = flag.end()
+            if previous_number:
+                parts.append(" ")
+            parts.append(flag.group(1))
+            arguments += 1
+            previous_number = True
+            continue
+
+        match = _PATH_TOKEN_RE.match(data, pos)
+        pos = match.end()
+        letter, number, _, other = match.groups()
+        if other:
+            return data
+        if letter:
+            parts.append(letter)
+            command = letter
+            arguments = 0
+            previous_number = False
+        elif number:
+            if "." in number or "e" in number or "E" in number:
+                number = format_number(float(number), precision)
+            if previous_number and not number.startswith("-"):
+                parts.append(" ")
+            parts.append(number)
+            arguments += 1
+            previous_number = True
+    return "".join(parts)
+
+
+def _namespace(name):
+    if name.startswith("{"):
+        return name[1:].split("}", 1)[0]
+    return None
+
+
+def _strip_tail(element):
+    """Drop the tail of element if it is whitespace, outside text elements.
+    """
+    parent = element.getparent()
+    if (element.tail is not None and not element.tail.strip() and
+            (parent is None or parent.tag not in TEXT_ELEMENTS)):
+        element.tail = None
+
+
+def minify_graphics(graphics_layer, precision=None, strip_editor_data=True, strip_whitespace=True):
+    """Reduce the size of the graphics layer, in place.
+
+    precision - round path data to this many decimal digits, None to keep it.
+    strip_editor_data - remove metadata, and Inkscape/Sodipodi elements and
+        attributes.
+    strip_whitespace - remove whitespace-only text (outside text elements).
+
+    Return the number of removed nodes.
+    """
+    removed = 0
+    # Materialize first, the tree is modified while iterating
+    for element in list(graphics_layer.iter()):
+        tag = element.tag
+        if not isinstance(tag, basestring):
+            if strip_editor_data and element.getparent() is not None:
+                # Comments and processing instructions
+                if strip_whitespace:
+                    _strip_tail(element)
+                culling.remove_element(element)
+                removed += 1
+            continue
+
+        if strip_editor_data and element is not graphics_layer:
+            if tag in METADATA_ELEMENTS or _namespace(tag) in EDITOR_NAMESPACES:
+                if element.getparent() is not None:
+                    removed += sum(1 for _ in element.iter())
+                    if strip_whitespace:
+                        # Or it ends up in the text before it
+                        _strip_tail(element)
+                    culling.remove_element(element)
+                continue
+
+        if strip_editor_data:
+            for name in element.attrib.keys():
+                if _namespace(name) in EDITOR_NAMESPACES:
+                    del element.attrib[name]
+
+        if precision is not None:
+            for name in PATH_DATA_ATTRIBUTES:
+                value = element.get(name)
+                if value:
+                    element.set(name, round_path_data(value, precision))
+
+        if strip_whitespace:
+            if (tag not in TEXT_ELEMENTS and
+                    element.text is not None and not element.text.strip()):
+                element.text = None
+            _strip_tail(element)
+
+    if strip_editor_data:
+        etree.cleanup_namespaces(graphics_layer)
+    return removed
@@ -0,0 +1,219 @@
+"""
+Call-level profiling of conversions, for finding the hot spots that the
+stage timings of `stats` are too coarse for.
+
+    with profiling.profiling("/tmp/talk") as profiler:
+        create_impress(svg_tree)
+
+writes, for the code in the with-block:
+
+    /tmp/talk.pstats      - a cProfile dump, for pstats/snakeviz etc.
+    /tmp/talk.folded      - sampled call stacks in the collapsed format of
+                            flamegraph.pl and speedscope
+    /tmp/talk.memory.txt  - the top allocations (by line) from tracemalloc.
+                            Without tracemalloc (Python 2), the growth of
+                            the peak RSS and of the live objects by type.
+
+Stacks are sampled on CPU time (a profiling timer signal), so only the main
+thread is seen. The signal handler is left out of the cProfile statistics.
+"""
+import cProfile
+import gc
+import os
+import pstats
+import resource
+import signal
+from collections import Counter
+from contextlib import contextmanager
+from StringIO import StringIO
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Number of entries in the memory report, and in `Profiler.format_top`
+DEFAULT_TOP = 25
+
+# Seconds of CPU time between stack samples
+DEFAULT_INTERVAL = 0.001
+
+# Frames kept by tracemalloc for each allocation
+TRACEMALLOC_FRAMES = 1
+
+
+def _peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _type_counts():
+    return Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+def code_name(code):
+    """The name of the frames of a code object in the collapsed stacks.
+    """
+    return "%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+
+def frame_name(frame):
+    """The name of a stack frame in the collapsed stacks.
+    """
+    return code_name(frame.f_code)
+
+
+class StackSampler(object):
+    """Counts the call stacks of the main thread, sampled every `interval`
+    seconds of CPU time.
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = interval
+        # The code objects of each stack, innermost first -> samples
+        self._samples = {}
+        self._previous_handler = None
+
+    @staticmethod
+    def available():
+        return hasattr(signal, "setitimer") and hasattr(signal, "SIGPROF")
+
+    def _sample(self, signum, frame):
+        # Runs while cProfile is enabled - without calling anything, so only
+        # this handler is profiled (see `_Profile`)
+        codes = ()
+        while frame is not None:
+            codes += (frame.f_code, )
+            frame = frame.f_back
+        try:
+            self._samples[codes] += 1
+        except KeyError:
+            self._samples[codes] = 1
+
+    @property
+    def stacks(self):
+        """The samples of each stack, by its "a;b;c" names (outermost first).
+        """
+        stacks = Counter()
+        for codes, samples in self._samples.iteritems():
+            stacks[";".join(code_name(code) for code in reversed(codes))] += samples
+        return stacks
+
+    def start(self):
+        self._previous_handler = signal.signal(signal.SIGPROF, self._sample)
+        # Restart the system calls the samples interrupt
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+
+    def write_folded(self, path):
+        """Write the stacks in the collapsed format, one "a;b;c <count>" line
+        per stack.
+        """
+        with open(path, "w") as output:
+            for stack, samples in sorted(self.stacks.iteritems()):
+                output.write("%s %d\n" % (stack, samples))
+
+
+class _Profile(cProfile.Profile):
+    """cProfile, without the calls of the `StackSampler` signal handler.
+    """
+    _HANDLER = cProfile.label(StackSampler._sample.im_func.func_code)
+
+    def snapshot_stats(self):
+        cProfile.Profile.snapshot_stats(self)
+        # The handler calls nothing, so it is no other function's caller
+        self.stats.pop(self._HANDLER, None)
+
+
+class Profiler(object):
+    """cProfile, stack sampling and memory tracking of the code between
+    start() and stop().
+    """
+    def __init__(self, top=DEFAULT_TOP, interval=DEFAULT_INTERVAL):
+        self.top = top
+        self.profile = _Profile()
+        self.sampler = StackSampler(interval) if StackSampler.available() else None
+        self._memory = None
+        # The files written by write()
+        self.paths = []
+
+    def start(self):
+        if tracemalloc is not None:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        else:
+            self._memory = (_peak_rss_kb(), _type_counts())
+        if self.sampler is not None:
+            self.sampler.start()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        if tracemalloc is not None:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._memory = snapshot
+        else:
+            start_rss, start_counts = self._memory
+            counts = _type_counts()
+            counts.subtract(start_counts)
+            self._memory = (_peak_rss_kb() - start_rss, counts)
+
+    def format_memory(self):
+        if tracemalloc is not None:
+            lines = ["Top %d allocations by line (tracemalloc):" % (self.top, )]
+            lines.extend(str(stat) for stat in self._memory.statistics("lineno")[:self.top])
+            return "\n".join(lines)
+
+        rss_growth, counts = self._memory
+        lines = [
+            "tracemalloc is not available, peak RSS and live objects instead.",
+            "Peak RSS growth: %d KB" % (rss_growth, ),
+            "",
+            "%-32s %10s" % ("type", "new objects"),
+            ]
+        for name, count in counts.most_common(self.top):
+            if count <= 0:
+                break
+            lines.append("%-32s %10d" % (name, count))
+        return "\n".join(lines)
+
+    def format_top(self, sort="tottime"):
+        """The `top` functions of the cProfile statistics, by `sort`.
+        """
+        stream = StringIO()
+        stats = pstats.Stats(self.profile, stream=stream)
+        stats.sort_stats(sort).print_stats(self.top)
+        return stream.getvalue()
+
+    def write(self, prefix):
+        """Write the profile files (see the module docstring) named prefix +
+        extension, into `paths`.
+        """
+        paths = [prefix + ".pstats", prefix + ".memory.txt"]
+        self.profile.dump_stats(paths[0])
+        with open(paths[1], "w") as output:
+            output.write(self.format_memory() + "\n")
+        if self.sampler is not None:
+            paths.append(prefix + ".folded")
+            self.sampler.write_folded(paths[-1])
+        self.paths = paths
+
+
+@contextmanager
+def profiling(prefix, top=DEFAULT_TOP, interval=DEFAULT_INTERVAL):
+    """Profile the code in the with-block, and write the profile files
+    (see the module docstring) named prefix + extension.
+
+    Yields the `Profiler`, its `paths` are set when the block ends.
+    """
+    profiler = Profiler(top, interval)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write(prefix)
@@ -0,0 +1,181 @@
+"""
+The top-level elements (the children of the root element) of an XML source,
+as byte ranges of the raw source.
+
+A changed source is compared with the previous one byte by byte, so only the
+top-level elements that changed need to be found and parsed again:
+
+    found = split_source(source)
+    ...
+    update = update_segments(source, found, new_source)
+    if update is not None:
+        found, changed = update
+
+The markup is found with a regular expression rather than a parser, but only
+for splitting - each element is still parsed in full before it is used.
+"""
+import re
+from collections import namedtuple
+
+# head_end - the end of the root start tag. tail_start - the start of the
+# root end tag. ranges - (start, end) of every top-level element, with the
+# text after it (up to the next element).
+Segments = namedtuple("Segments", "head_end tail_start ranges")
+
+# Comments, CDATA sections, processing instructions, the DOCTYPE (and its
+# internal subset) and tags. Quoted attribute values may contain ">".
+_MARKUP_RE = re.compile(r"""
+    <!--.*?-->
+    | <!\[CDATA\[.*?\]\]>
+    | <\?.*?\?>
+    | <!DOCTYPE(?:[^\[>]|\[.*?\])*>
+    | <(/?)[^>"']*(?:(?:"[^"]*"|'[^']*')[^>"']*)*>
+    """, re.DOTALL | re.VERBOSE)
+
+# Bytes compared at once, when looking for the first difference
+_BLOCK_SIZE = 1 << 16
+
+
+def _elements(source, start, end):
+    """Find the elements between start and end, that are not inside one
+    another.
+
+    Return (ranges, closing) - closing is the start of an end tag that closes
+    their parent, if found before end (the search stops there). Return None if
+    an element is not closed before end.
+    """
+    ranges = []
+    depth = 0
+    element_start = None
+    for match in _MARKUP_RE.finditer(source, start, end):
+        if match.group(1) is None:
+            # Not a tag
+            continue
+        if match.group(1):
+            if depth == 0:
+                return ranges, match.start()
+            depth -= 1
+            if depth == 0:
+                ranges.append((element_start, match.end()))
+        elif source[match.end() - 2] == "/":
+            if depth == 0:
+                ranges.append((match.start(), match.end()))
+        else:
+            if depth == 0:
+                element_start = match.start()
+            depth += 1
+    if depth:
+        return None
+    return ranges, None
+
+
+def _with_text(ranges, end):
+    """Extend the element ranges over the text after them, up to end.
+    """
+    starts = [start for start, _ in ranges[1:]] + [end]
+    return [(start, next_start) for (start, _), next_start in zip(ranges, starts)]
+
+
+def split_source(source):
+    """Return the Segments of the XML source, None if it can't be split.
+    """
+    for match in _MARKUP_RE.finditer(source):
+        if match.group(1) is not None:
+            break
+    else:
+        return None
+    if match.group(1) or source[match.end() - 2] == "/":
+        return None
+    found = _elements(source, match.end(), len(source))
+    if found is None or found[1] is None:
+        return None
+    ranges, tail_start = found
+    return Segments(match.end(), tail_start, _with_text(ranges, tail_start))
+
+
+def _match_length(same, limit):
+    """The number of bytes (up to limit) that match, by same(offset, size) -
+    whether size bytes from offset match.
+    """
+    matched = 0
+    size = 0
+    while matched < limit:
+        size = min(_BLOCK_SIZE, limit - matched)
+        if not same(matched, size):
+            break
+        matched += size
+    else:
+        return limit
+    # The difference is in the next block, bisect it
+    low, high = 0, size - 1
+    while low < high:
+        middle = (low + high + 1) // 2
+        if same(matched, middle):
+            low = middle
+        else:
+            high = middle - 1
+    return matched + low
+
+
+def common_affixes(old, new):
+    """Return the lengths of the common (prefix, suffix) of the strings,
+    not overlapping in either of them.
+    """
+    limit = min(len(old), len(new))
+    prefix = _match_length(
+        lambda offset, size: buffer(old, offset, size) == buffer(new, offset, size), limit)
+    old_end, new_end = len(old), len(new)
+    suffix = _match_length(
+        lambda offset, size: (buffer(old, old_end - offset - size, size) ==
+                              buffer(new, new_end - offset - size, size)),
+        limit - prefix)
+    return prefix, suffix
+
+
+def update_segments(old, segments, new):
+    """Find the Segments of the new source, from the Segments of the old
+    source.
+
+    Return (Segments, changed) - changed are the indices of the top-level
+    elements whose bytes differ. Return None if the sources differ outside
+    the top-level elements (and the space between them), or in their number
+    - then use `split_source`.
+    """
+    prefix, suffix = common_affixes(old, new)
+    old_changed_end = len(old) - suffix
+    if prefix < segments.head_end or old_changed_end > segments.tail_start:
+        return None
+    ranges = segments.ranges
+    delta = len(new) - len(old)
+
+    # The elements overlapping the changes, first to last
+    first = 0
+    while first < len(ranges) and ranges[first][1] <= prefix:
+        first += 1
+    last = first - 1
+    while last + 1 < len(ranges) and ranges[last + 1][0] < old_changed_end:
+        last += 1
+    # Between the elements around them, outside of any markup
+    start = ranges[first - 1][1] if first else segments.head_end
+    end = ranges[last + 1][0] if last + 1 < len(ranges) else segments.tail_start
+
+    found = _elements(new, start, end + delta)
+    if found is None or found[1] is not None or len(found[0]) != last + 1 - first:
+        return None
+    found = _with_text(found[0], end + delta)
+    changed = [index for index, (new_start, new_end) in enumerate(found, first)
+               if buffer(new, new_start, new_end - new_start) !=
+               buffer(old, ranges[index][0], ranges[index][1] - ranges[index][0])]
+    new_ranges = (ranges[:first] + found +
+                  [(element_start + delta, element_end + delta)
+                   for element_start, element_end in ranges[last + 1:]])
+    return Segments(segments.head_end, segments.tail_start + delta, new_ranges), changed
+
+
+def element_source(source, segments, index):
+    """Return the source of a document with only the top-level element at
+    index (and the text after it) - the same prolog and root element, so it
+    parses the same.
+    """
+    start, end = segments.ranges[index]
+    return source[:segments.head_end] + source[start:end] + source[segments.tail_start:]
@@ -0,0 +1,233 @@
+"""
+Spatial indexing of axis-aligned boxes.
+
+A box is a (min_x, min_y, max_x, max_y) tuple.
+"""
+import heapq
+import itertools
+import math
+
+
+def boxes_intersect(box1, box2):
+    return (box1[0] <= box2[2] and box2[0] <= box1[2] and
+            box1[1] <= box2[3] and box2[1] <= box1[3])
+
+
+def union_box(box1, box2):
+    return (min(box1[0], box2[0]), min(box1[1], box2[1]),
+            max(box1[2], box2[2]), max(box1[3], box2[3]))
+
+
+def transform_box(box, affine):
+    """Return the bounding box of `box` after transforming it with `affine`.
+    """
+    min_x, min_y, max_x, max_y = box
+    xs = []
+    ys = []
+    for x, y in ((min_x, min_y), (max_x, min_y), (min_x, max_y), (max_x, max_y)):
+        x, y = affine.apply(x, y)
+        xs.append(x)
+        ys.append(y)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def rotated_rect_box(x, y, width, height, rotation):
+    """Return the bounding box of a width x height rect centered at (x, y),
+    rotated by `rotation` degrees.
+    """
+    r = math.radians(rotation)
+    cos = abs(math.cos(r))
+    sin = abs(math.sin(r))
+    half_width = (width * cos + height * sin) / 2.
+    half_height = (width * sin + height * cos) / 2.
+    return (x - half_width, y - half_height, x + half_width, y + half_height)
+
+
+def box_distance(box, x, y):
+    """The distance from (x, y) to the closest point in `box`.
+    """
+    dx = max(box[0] - x, 0., x - box[2])
+    dy = max(box[1] - y, 0., y - box[3])
+    return math.hypot(dx, dy)
+
+
+class _Node(object):
+    __slots__ = ("box", "children", "leaf")
+
+    def __init__(self, children, leaf):
+        self.children = children
+        self.leaf = leaf
+        boxes = [child[0] for child in children] if leaf else [child.box for child in children]
+        self.box = (min(box[0] for box in boxes), min(box[1] for box in boxes),
+                    max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+class RTree(object):
+    """A static R-tree over boxes, bulk-loaded with Sort-Tile-Recursive.
+
+    Queries take O(log n) time (plus the number of results) for well
+    distributed boxes.
+    """
+    def __init__(self, entries, max_entries=16):
+        """entries - a list of (box, item) pairs.
+        max_entries - the maximal number of children of each node.
+        """
+        self._max_entries = max_entries
+        # Keep the insertion order, for sorting the results
+        entries = [(box, (order, item)) for order, (box, item) in enumerate(entries)]
+        self._size = len(entries)
+        self._root = None
+        if entries:
+            self._root = self._build(entries)
+
+    def _build(self, entries):
+        nodes = [_Node(group, True) for group in self._tile(entries, lambda entry: entry[0])]
+        while len(nodes) > 1:
+            nodes = [_Node(group, False) for group in self._tile(nodes, lambda node: node.box)]
+        return nodes[0]
+
+    def _tile(self, items, get_box):
+        """Split items into spatially close groups of at most max_entries.
+        """
+        size = self._max_entries
+        group_count = int(math.ceil(len(items) / float(size)))
+        slice_count = int(math.ceil(math.sqrt(group_count)))
+        slice_size = slice_count * size
+
+        center_x = lambda item: get_box(item)[0] + get_box(item)[2]
+        center_y = lambda item: get_box(item)[1] + get_box(item)[3]
+
+        items = sorted(items, key=center_x)
+        groups = []
+        for start in xrange(0, len(items), slice_size):
+            vertical_slice = sorted(items[start:start + slice_size], key=center_y)
+            for group_start in xrange(0, len(vertical_slice), size):
+                groups.append(vertical_slice[group_start:group_start + size])
+        return groups
+
+    def __len__(self):
+        return self._size
+
+    def _search(self, match_box):
+        """Yield the (order, item) of every entry whose box matches.
+        """
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.leaf:
+                for box, entry in node.children:
+                    if match_box(box):
+                        yield entry
+            else:
+                stack.extend(child for child in node.children if match_box(child.box))
+
+    def query(self, box):
+        """Return the items whose boxes intersect `box`, in insertion order.
+        """
+        return [item for _, item in sorted(self._search(lambda other: boxes_intersect(box, other)))]
+
+    def query_point(self, x, y):
+        """Return the items whose boxes contain (x, y), in insertion order.
+        """
+        point = (x, y, x, y)
+        return self.query(point)
+
+    def intersects(self, box):
+        """Does `box` intersect any of the boxes?
+        """
+        for _ in self._search(lambda other: boxes_intersect(box, other)):
+            return True
+        return False
+
+    def nearest(self, x, y, k=1, distance=None):
+        """Return the k items nearest to (x, y), closest first.
+
+        distance - a function of (item, x, y) giving the distance to the item.
+        It must never be smaller than the distance to the item's box. Defaults
+        to the distance to the item's box.
+        """
+        if self._root is None or k <= 0:
+            return []
+
+        # Best-first search. Entries are (distance, order, kind, value), with
+        # kind 0 for items with their final distance, 1 for items that still
+        # need it and 2 for nodes. Items are ordered by insertion order on
+        # ties, nodes by a running counter.
+        counter = itertools.count()
+        heap = [(box_distance(self._root.box, x, y), next(counter), 2, self._root)]
+        result = []
+        while heap and len(result) < k:
+            _, order, kind, value = heapq.heappop(heap)
+            if kind == 0:
+                result.append(value)
+            elif kind == 1:
+                if distance is None:
+                    result.append(value)
+                else:
+                    heapq.heappush(heap, (distance(value, x, y), order, 0, value))
+            elif value.leaf:
+                for box, (item_order, item) in value.children:
+                    heapq.heappush(heap, (box_distance(box, x, y), item_order, 1, item))
+            else:
+                for child in value.children:
+                    heapq.heappush(heap, (box_distance(child.box, x, y), next(counter), 2, child))
+        return result
+
+
+class StepIndex(object):
+    """A spatial index over step rects (see `Ink2Impress.Rect`).
+
+    Steps are indexed by the bounding boxes of their rotated frames.
+    """
+    def __init__(self, rects):
+        self._rects = list(rects)
+        self._tree = RTree((self.frame_box(rect), rect) for rect in self._rects)
+
+    @staticmethod
+    def frame_box(rect):
+        """The bounding box of the rotated frame of the step.
+        """
+        return rotated_rect_box(rect.x, rect.y, rect.w, rect.h, rect.r)
+
+    @staticmethod
+    def frame_contains(rect, x, y):
+        """Is (x, y) inside the rotated frame of the step?
+        """
+        r = math.radians(rect.r)
+        dx = x - rect.x
+        dy = y - rect.y
+        # Rotate the point into the frame's coordinates
+        local_x = dx * math.cos(r) + dy * math.sin(r)
+        local_y = -dx * math.sin(r) + dy * math.cos(r)
+        return abs(local_x) <= rect.w / 2. and abs(local_y) <= rect.h / 2.
+
+    @staticmethod
+    def center_distance(rect, x, y):
+        return math.hypot(x - rect.x, y - rect.y)
+
+    def __len__(self):
+        return len(self._rects)
+
+    def query(self, box):
+        """Return the steps whose frame bounding boxes intersect `box`, in
+        presentation order.
+        """
+        return self._tree.query(box)
+
+    def query_rotated(self, x, y, width, height, rotation):
+        """Return the steps that might overlap a rotated rect (given like a
+        step - center, size and rotation in degrees).
+        """
+        return self._tree.query(rotated_rect_box(x, y, width, height, rotation))
+
+    def at_point(self, x, y):
+        """Return the steps whose frames contain (x, y), in presentation order.
+        """
+        return [rect for rect in self._tree.query_point(x, y) if self.frame_contains(rect, x, y)]
+
+    def nearest(self, x, y, k=1):
+        """Return the k steps whose centers are nearest to (x, y), closest first.
+        """
+        return self._tree.nearest(x, y, k, self.center_distance)
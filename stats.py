@@ -0,0 +1,141 @@
+"""
+Opt-in per-stage timing and counters for conversions.
+
+Instrumented code calls `stage()` and `count()`. They do nothing unless a
+`Stats` collector is active:
+
+    with stats.collecting() as collector:
+        convert_file(source, target)
+    print collector.format_table()
+
+Hooks added with `add_hook` get the stats dict of every finished collection,
+for forwarding the numbers to other metric systems.
+"""
+import json
+import resource
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import affine
+
+_hooks = []
+_current = None
+
+
+def _peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Stats(object):
+    """Wall time and peak memory growth per stage, and named counters.
+
+    The peak RSS of the process never goes down, so a stage is charged with
+    how much it raised it - a stage that only reuses memory freed by earlier
+    stages shows no growth.
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the code in the with-block as stage `name`. Repeated stages add up.
+        """
+        start = time.time()
+        start_peak = _peak_rss_kb()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            growth = _peak_rss_kb() - start_peak
+            entry = self.stages.setdefault(name, {"seconds": 0., "calls": 0,
+                                                  "peak_rss_growth_kb": 0})
+            entry["seconds"] += seconds
+            entry["calls"] += 1
+            entry["peak_rss_growth_kb"] += growth
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def to_dict(self):
+        return {
+            "stages": OrderedDict((name, dict(entry)) for name, entry in self.stages.iteritems()),
+            "counters": OrderedDict(self.counters),
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def format_table(self):
+        lines = ["%-24s %10s %6s %21s" % ("stage", "ms", "calls", "peak RSS growth (KB)")]
+        for name, entry in self.stages.iteritems():
+            lines.append("%-24s %10.1f %6d %21d" % (
+                name, entry["seconds"] * 1000, entry["calls"], entry["peak_rss_growth_kb"]))
+        total = sum(entry["seconds"] for entry in self.stages.itervalues())
+        lines.append("%-24s %10.1f" % ("total", total * 1000))
+        if self.counters:
+            lines.append("")
+            lines.append("%-24s %10s" % ("counter", "value"))
+            for name, value in self.counters.iteritems():
+                lines.append("%-24s %10d" % (name, value))
+        return "\n".join(lines)
+
+
+def add_hook(hook):
+    """Call hook(stats_dict) whenever a collection finishes.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+@contextmanager
+def collecting(collector=None):
+    """Collect the stats of the code in the with-block into a `Stats`.
+    """
+    global _current
+    if collector is None:
+        collector = Stats()
+    previous = _current
+    _current = collector
+    parse_counts = dict(affine.PARSE_COUNTS)
+    try:
+        yield collector
+    finally:
+        _current = previous
+        for name, value in affine.PARSE_COUNTS.iteritems():
+            collector.count("transform_" + name, value - parse_counts[name])
+
+    stats_dict = collector.to_dict()
+    for hook in list(_hooks):
+        hook(stats_dict)
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+def stage(name):
+    """Time a stage in the active collection, if any.
+    """
+    if _current is None:
+        return _no_stage()
+    return _current.stage(name)
+
+
+def count(name, amount=1):
+    """Add to a counter of the active collection, if any.
+    """
+    if _current is not None:
+        _current.count(name, amount)
+
+
+def active():
+    """Is a collection active?
+    """
+    return _current is not None
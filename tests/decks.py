@@ -0,0 +1,32 @@
+"""
+Generated decks for the tests, see benchmarks/generate_svg.py.
+"""
+from io import BytesIO
+
+from lxml import etree
+
+import Ink2Impress
+from generate_svg import generate_svg
+
+
+def generated_source(steps=200, depth=4, graphics=50, seed=0):
+    """Return the SVG source of a generated deck.
+    """
+    svg = BytesIO()
+    generate_svg(svg, steps=steps, depth=depth, graphics=graphics, seed=seed)
+    return svg.getvalue()
+
+
+def generated_deck(steps=200, depth=4, graphics=50, seed=0):
+    """Return the (graphics layer, layout layer) of a generated deck.
+    """
+    svg_tree = Ink2Impress.load_svg(BytesIO(generated_source(steps, depth, graphics, seed)))
+    return Ink2Impress.get_layers(svg_tree.getroot())
+
+
+def rect_values(rect):
+    return (rect.id, rect.x, rect.y, rect.w, rect.h, rect.r)
+
+
+def step_attributes(divs):
+    return [etree.tostring(div) for div in divs]
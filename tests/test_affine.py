@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+import affine
+from affine import Affine, parse_transform_list
+
+
+def assert_affine(actual, expected):
+    assert actual.coefficients == pytest.approx(expected.coefficients)
+
+
+def rotation(degrees):
+    return Affine.rotation(math.radians(degrees))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("", Affine()),
+    ("matrix(1 2 3 4 5 6)", Affine(1, 2, 3, 4, 5, 6)),
+    ("translate(5)", Affine.translation(5, 0)),
+    ("translate(5, -3)", Affine.translation(5, -3)),
+    ("translate(5-3)", Affine.translation(5, -3)),
+    ("scale(2)", Affine.scaling(2, 2)),
+    ("scale(2 .5)", Affine.scaling(2, 0.5)),
+    ("rotate(30)", rotation(30)),
+    ("rotate(90, 10, 20)", Affine(0, 1, -1, 0, 30, 10)),
+    ("skewX(45)", Affine(1, 0, 1, 1, 0, 0)),
+    ("skewY(45)", Affine(1, 1, 0, 1, 0, 0)),
+    ("translate(1e1,2E-1)", Affine.translation(10, 0.2)),
+    ])
+def test_transform_functions(value, expected):
+    assert_affine(parse_transform_list(value), expected)
+
+
+def test_rotate_around_a_point_keeps_it_fixed():
+    x, y = parse_transform_list("rotate(37 4 -7)").apply(4, -7)
+    assert (x, y) == pytest.approx((4, -7))
+
+
+@pytest.mark.parametrize("value", [
+    "translate(10,20) rotate(30) scale(2,3)",
+    " translate(10 20),rotate(30)\n,  scale(2 3) ",
+    "translate(10,20)rotate(30)scale(2,3)",
+    ])
+def test_chained_transforms_apply_right_to_left(value):
+    expected = Affine.translation(10, 20) * rotation(30) * Affine.scaling(2, 3)
+    assert_affine(parse_transform_list(value), expected)
+
+
+@pytest.mark.parametrize("value", [
+    "translate(1,,2)",
+    "translate(,1)",
+    "translate(1,)",
+    "translate(1 2 3)",
+    "rotate(1, 2)",
+    "rotate()",
+    "matrix(1 2 3 4 5)",
+    "skewX(1 2)",
+    "scale(1x)",
+    "scale 2",
+    "translate(1) foo",
+    "foo(1)",
+    "translate(1 scale(2))",
+    ])
+def test_invalid_transform_lists(value):
+    with pytest.raises(ValueError):
+        parse_transform_list(value)
+
+
+def test_results_are_cached():
+    value = "translate(3 4) skewX(10)"
+    affine._PARSE_CACHE.pop(value, None)
+    counts = dict(affine.PARSE_COUNTS)
+    first = parse_transform_list(value)
+    assert parse_transform_list(value) is first
+    assert affine.PARSE_COUNTS["parsed"] == counts["parsed"] + 1
+    assert affine.PARSE_COUNTS["cache_hits"] == counts["cache_hits"] + 1
+
+
+def test_invalid_values_are_not_cached():
+    with pytest.raises(ValueError):
+        parse_transform_list("translate(1,,2)")
+    assert "translate(1,,2)" not in affine._PARSE_CACHE
@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import Ink2Impress
+from conftest import ROOT
+from decks import generated_source
+
+
+def write_sources(tmpdir):
+    """Write two decks and a broken SVG between them, return their paths.
+    """
+    sources = []
+    for name in ("first", "broken", "second"):
+        source = tmpdir.join(name + ".svg")
+        if name == "broken":
+            source.write("<svg><g>", "wb")
+        else:
+            source.write(generated_source(steps=5, graphics=5), "wb")
+        sources.append(str(source))
+    return sources
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_a_failure_does_not_stop_the_batch(tmpdir, jobs):
+    sources = write_sources(tmpdir)
+    pairs = [(source, Ink2Impress.default_target(source)) for source in sources]
+    conversions = sorted(Ink2Impress.convert_files(pairs, jobs))
+    assert [os.path.basename(conversion.source) for conversion in conversions] == [
+        "broken.svg", "first.svg", "second.svg"]
+    broken, first, second = conversions
+    assert "XMLSyntaxError" in broken.error
+    assert first.error is None and second.error is None
+    assert os.path.exists(first.target) and os.path.exists(second.target)
+
+
+def test_exit_status(tmpdir):
+    sources = write_sources(tmpdir)
+    output_dir = tmpdir.join("out")
+    command = [sys.executable, os.path.join(ROOT, "Ink2Impress.py"), "--no-cache",
+               "-o", str(output_dir)]
+    process = subprocess.Popen(command + sources, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    assert process.returncode == 1
+    assert "Converted 2 of 3 files" in out
+    assert "broken.svg FAILED" in err
+    assert sorted(os.listdir(str(output_dir))) == ["first.html", "second.html"]
+
+    process = subprocess.Popen(command + [sources[0]], stdout=subprocess.PIPE)
+    process.communicate()
+    assert process.returncode == 0
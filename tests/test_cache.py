@@ -0,0 +1,94 @@
+import os
+
+import cache
+import Ink2Impress
+from decks import generated_source
+
+
+def write_file(path, content):
+    with open(path, "wb") as output:
+        output.write(content)
+
+
+def read_file(path):
+    with open(path, "rb") as source:
+        return source.read()
+
+
+def test_store_and_fetch(tmpdir):
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")))
+    source = str(tmpdir.join("talk.svg"))
+    write_file(source, "<svg/>")
+    page = str(tmpdir.join("talk.html"))
+    write_file(page, "<html/>")
+    asset = str(tmpdir.join("talk.graphics-1234.svg"))
+    write_file(asset, "<svg>graphics</svg>")
+
+    key = build_cache.key(source, {"cull": True})
+    assert build_cache.fetch(key, page) == (False, None)
+    build_cache.store(key, page, {"result": 1}, [asset])
+
+    os.remove(page)
+    os.remove(asset)
+    assert build_cache.fetch(key, page) == (True, {"result": 1})
+    assert read_file(page) == "<html/>"
+    assert read_file(asset) == "<svg>graphics</svg>"
+    assert build_cache.asset_names(key) == ["talk.graphics-1234.svg"]
+
+
+def test_key_changes(tmpdir):
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")))
+    source = str(tmpdir.join("talk.svg"))
+    write_file(source, "<svg/>")
+    key = build_cache.key(source, {"cull": True})
+    assert build_cache.key(source, {"cull": True}) == key
+    assert build_cache.key(source, {"cull": False}) != key
+    assert build_cache.key(source, {"cull": True, "precision": 3}) != key
+    write_file(source, "<svg></svg>")
+    assert build_cache.key(source, {"cull": True}) != key
+
+
+def test_convert_file_cached(tmpdir):
+    source = tmpdir.join("talk.svg")
+    source.write(generated_source(steps=10, graphics=10), "wb")
+    target = str(tmpdir.join("talk.html"))
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")))
+
+    assert not Ink2Impress.convert_file_cached(str(source), target, build_cache)[1]
+    page = read_file(target)
+    os.remove(target)
+    assert Ink2Impress.convert_file_cached(str(source), target, build_cache)[1]
+    assert read_file(target) == page
+
+    # A miss when the options change
+    assert not Ink2Impress.convert_file_cached(str(source), target, build_cache, cull=True)[1]
+    assert Ink2Impress.convert_file_cached(str(source), target, build_cache, cull=True)[1]
+
+
+def test_least_recently_used_entries_are_evicted(tmpdir):
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")), max_bytes=250)
+    page = str(tmpdir.join("talk.html"))
+    write_file(page, "x" * 100)
+    for number, key in enumerate(["first", "second"]):
+        build_cache.store(key, page)
+        for path in build_cache._paths(key):
+            os.utime(path, (number, number))
+    # Fetching marks the entry as recently used
+    assert build_cache.fetch("first", page)[0]
+
+    build_cache.store("third", page)
+    assert build_cache.fetch("first", page)[0]
+    assert build_cache.fetch("third", page)[0]
+    assert not build_cache.fetch("second", page)[0]
+    assert sorted(os.listdir(build_cache.directory)) == [
+        "first.html", "first.result", "third.html", "third.result"]
+
+
+def test_clear(tmpdir):
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")))
+    page = str(tmpdir.join("talk.html"))
+    write_file(page, "<html/>")
+    build_cache.store("key", page)
+    build_cache.clear()
+    assert os.listdir(build_cache.directory) == []
+    assert not build_cache.fetch("key", page)[0]
@@ -0,0 +1,80 @@
+from lxml import etree
+
+import chunking
+import Ink2Impress
+
+LAYER = """\
+<g>
+  <rect id="first" x="0" y="0" width="10" height="10"/>
+  <rect id="second" x="1000" y="0" width="10" height="10"/>
+  <text id="unknown" x="2000" y="0">no box</text>
+  <rect id="second-and-third" x="1000" y="0" width="1000" height="10"/>
+  <g id="third"><circle cx="2000" cy="0" r="5"/><circle cx="2010" cy="0" r="5"/></g>
+  <g id="everywhere" opacity="0.5">
+    <rect x="0" y="0" width="10" height="10"/><rect x="2000" y="0" width="10" height="10"/>
+  </g>
+  <g id="split">
+    <rect id="split-first" x="0" y="0" width="10" height="10"/>
+    <rect id="split-third" x="2000" y="0" width="10" height="10"/>
+  </g>
+</g>"""
+
+STEPS = [Ink2Impress.Rect(x=x, y=0, w=100, h=100, id_="step%d" % i)
+         for i, x in enumerate([0, 1000, 2000])]
+
+
+def ids(layer):
+    return [element.get("id") for element in layer.iter()
+            if element.get("id") and not element.get("id").startswith(chunking.PLACEHOLDER_PREFIX)]
+
+
+def load_chunks(layer, files):
+    """Insert the chunks of the files into their placeholders, like the
+    loader script.
+    """
+    for text in files:
+        for chunk in etree.fromstring(text):
+            placeholder_id = chunking.PLACEHOLDER_PREFIX + chunk.get("data-chunk")
+            placeholder = layer.find(".//g[@id='%s']" % (placeholder_id, ))
+            for child in chunk:
+                child.tag = etree.QName(child).localname
+                placeholder.append(child)
+
+
+def test_split_graphics():
+    layer = etree.fromstring(LAYER)
+    split = chunking.split_graphics(layer, STEPS, margin=0)
+    assert ids(layer) == ["first", "unknown", "everywhere", "split", "split-first"]
+    # The files of the second and the third step - the third step also
+    # shows an element of the second
+    assert len(split.files) == 2
+    assert split.steps == [[], [0], [0, 1]]
+
+
+def test_loaded_chunks_keep_the_drawing_order():
+    layer = etree.fromstring(LAYER)
+    split = chunking.split_graphics(layer, STEPS, margin=0)
+    load_chunks(layer, split.files)
+    assert ids(layer) == ids(etree.fromstring(LAYER))
+
+
+def test_jumping_to_a_later_step():
+    layer = etree.fromstring(LAYER)
+    split = chunking.split_graphics(layer, STEPS, margin=0)
+    load_chunks(layer, [split.files[index] for index in split.steps[2]])
+    assert "second-and-third" in ids(layer)
+    assert "third" in ids(layer) and "split-third" in ids(layer)
+
+
+def test_without_steps():
+    layer = etree.fromstring(LAYER)
+    split = chunking.split_graphics(layer, [], margin=0)
+    assert split == chunking.SplitGraphics([], [])
+    assert ids(layer) == ids(etree.fromstring(LAYER))
+
+
+def test_loader_script_manifest():
+    script = chunking.loader_script(["talk.chunk-0.svg", "</script>.svg"], [[], [0], [0, 1]])
+    assert 'var manifest = {"files":["talk.chunk-0.svg","\\u003c/script>.svg"],' in script
+    assert '"steps":[[],[0],[0,1]]};' in script
+    assert script.count("</script>") == 1
@@ -0,0 +1,74 @@
+import pytest
+from lxml import etree
+
+from affine import Affine
+import culling
+import Ink2Impress
+
+
+@pytest.mark.parametrize("d, expected", [
+    ("M1 2 3 4 5 6z", [("M", [1, 2]), ("L", [3, 4]), ("L", [5, 6]), ("z", [])]),
+    ("m1,2-3.5.5", [("m", [1, 2]), ("l", [-3.5, 0.5])]),
+    ("M0 0h10v-5Q1 2 3 4t5 6", [("M", [0, 0]), ("h", [10]), ("v", [-5]),
+                               ("Q", [1, 2, 3, 4]), ("t", [5, 6])]),
+    # Packed arc flags
+    ("M0 0a10 10 0 011.5 2", [("M", [0, 0]), ("a", [10, 10, 0, 0, 1, 1.5, 2])]),
+    ("M0 0A1,1,0,1,0,2,0 1 1 0 0 1 4 0", [("M", [0, 0]), ("A", [1, 1, 0, 1, 0, 2, 0]),
+                                           ("A", [1, 1, 0, 0, 1, 4, 0])]),
+    ])
+def test_path_commands(d, expected):
+    assert list(culling.path_commands(d)) == expected
+
+
+@pytest.mark.parametrize("d", ["1 2", "M1", "M0 0L1 2 3", "M0 0z 1 2", "M0 0a1 1 0 2 0 3 4"])
+def test_invalid_path_commands(d):
+    with pytest.raises(ValueError):
+        list(culling.path_commands(d))
+    assert culling.path_points(d) is None
+
+
+LAYER = """\
+<g xmlns:xlink="http://www.w3.org/1999/xlink">
+  <defs><marker id="arrow"><path d="M0 0L5 5"/></marker></defs>
+  <rect id="inside" x="10" y="10" width="10" height="10"/>
+  <rect id="outside" x="1000" y="1000" width="10" height="10"/>
+  <rect id="moved-in" transform="translate(-990 -990)" x="1000" y="1000" width="10" height="10"/>
+  <rect id="wide-stroke" x="1000" y="1000" width="10" height="10"
+        style="stroke:black;stroke-width:4000"/>
+  <g id="group" style="stroke:black;stroke-width:4000">
+    <rect id="stroke-inherited" x="1000" y="1000" width="10" height="10"/>
+  </g>
+  <rect id="referenced" x="1000" y="1000" width="10" height="10"/>
+  <use xlink:href="#referenced" x="-990" y="-990"/>
+  <path id="marked" d="M1000 1000L1010 1010" marker-end="url(#arrow)"/>
+  <text id="text" x="1000" y="1000">far away</text>
+  <g id="emptied"><rect x="1000" y="1000" width="10" height="10"/><circle cx="900" cy="900" r="5"/></g>
+  <g id="empty"/>
+</g>"""
+
+
+def culled_layer(**options):
+    layer = etree.fromstring(LAYER)
+    step = Ink2Impress.Rect(x=50, y=50, w=100, h=100, id_="step")
+    result = culling.cull_graphics(layer, [step], margin=0, **options)
+    return layer, result
+
+
+def test_cull_graphics():
+    layer, result = culled_layer()
+    assert [element.get("id") for element in layer.iter() if element.get("id")] == [
+        "arrow", "inside", "moved-in", "wide-stroke", "group", "stroke-inherited",
+        "referenced", "marked", "text", "empty",
+        ]
+    # "outside", and the emptied group with its 2 elements
+    assert result.nodes == 4
+    assert result.bytes > 0
+    # The whitespace after the removed elements is kept
+    assert layer.find("rect[@id='inside']").tail == "\n  \n  "
+
+
+def test_cull_graphics_in_a_transformed_layer():
+    layer, _ = culled_layer(parent_transform=Affine.translation(-990, -990))
+    ids = [element.get("id") for element in layer.iter() if element.get("id")]
+    assert "outside" in ids and "emptied" in ids
+    assert "inside" not in ids
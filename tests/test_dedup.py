@@ -0,0 +1,87 @@
+import base64
+
+from lxml import etree
+
+import dedup
+
+XLINK = "http://www.w3.org/1999/xlink"
+XLINK_HREF = "{%s}href" % (XLINK, )
+
+STOPS = '<stop offset="0" style="stop-color:#fff"/><stop offset="1" style="stop-color:#000"/>'
+
+LAYER = """\
+<g xmlns:xlink="http://www.w3.org/1999/xlink">
+  <defs>
+    <linearGradient id="stops-a">%(stops)s</linearGradient>
+    <linearGradient id="stops-b">%(stops)s</linearGradient>
+    <linearGradient id="grad-a" xlink:href="#stops-a" x1="0" x2="1"/>
+    <linearGradient id="grad-b" xlink:href="#stops-b" x1="0" x2="1"/>
+    <linearGradient id="other" xlink:href="#stops-b" x1="1" x2="0"/>
+    <style>.shape { fill: url('#grad-b'); }</style>
+  </defs>
+  <rect id="r1" style="fill:url(#grad-a)" width="1" height="1"/>
+  <rect id="r2" style="fill:url(#grad-b);stroke:url(&quot;#other&quot;)" width="1" height="1"/>
+  <rect id="r3" fill="url(#grad-b)" width="1" height="1"/>
+  <use href="#grad-b"/>
+</g>""" % {"stops": STOPS}
+
+
+def test_merge_definitions():
+    layer = etree.fromstring(LAYER)
+    # stops-b, then grad-b once it refers to stops-a
+    assert dedup.merge_definitions(layer) == 2
+    assert [element.get("id") for element in layer.iter("linearGradient")] == [
+        "stops-a", "grad-a", "other"]
+    assert layer.find(".//*[@id='other']").get(XLINK_HREF) == "#stops-a"
+    assert layer.find("rect[@id='r1']").get("style") == "fill:url(#grad-a)"
+    assert layer.find("rect[@id='r2']").get("style") == 'fill:url(#grad-a);stroke:url("#other")'
+    assert layer.find("rect[@id='r3']").get("fill") == "url(#grad-a)"
+    assert layer.find("use").get("href") == "#grad-a"
+    assert layer.find(".//style").text == ".shape { fill: url('#grad-a'); }"
+
+
+def test_different_definitions_are_kept():
+    layer = etree.fromstring(LAYER)
+    layer.find(".//*[@id='stops-b']")[0].set("offset", "0.5")
+    assert dedup.merge_definitions(layer) == 0
+
+
+PIXEL = base64.b64encode("\x89PNG\r\n\x1a\n" + "pixel" * 20)
+SMALL = base64.b64encode("\x89PNG\r\n\x1a\n")
+
+
+def image(x, data=PIXEL, size="10"):
+    return '<image xlink:href="data:image/png;base64,%s" x="%s" width="%s" height="10"/>' % (
+        data, x, size)
+
+
+def image_layer(*images):
+    return etree.fromstring('<g xmlns:xlink="%s">%s</g>' % (XLINK, "".join(images)))
+
+
+def test_share_images():
+    layer = image_layer(image(1), image(2), image(3, data=PIXEL[:40] + "\n" + PIXEL[40:]),
+                        image(4, size="20"), image(5, data=PIXEL[:-4]))
+    assert dedup.share_images(layer) == 3
+    definition = layer.find("defs/image")
+    assert definition.get("id") == "image0"
+    assert definition.get("width") == "10"
+    uses = layer.findall("use")
+    assert [use.get("x") for use in uses] == ["1", "2", "3"]
+    assert all(use.get(XLINK_HREF) == "#image0" for use in uses)
+    # Different sizes, or data
+    assert [element.get("x") for element in layer.findall("image")] == ["4", "5"]
+
+
+def test_extract_images():
+    layer = image_layer(image(1), image(2), image(3, data=SMALL))
+    written = []
+
+    def write_image(data, extension):
+        written.append(data)
+        return "image%d.%s" % (len(written), extension)
+
+    assert dedup.extract_images(layer, write_image, min_bytes=50) == 2
+    assert written == [base64.b64decode(PIXEL)]
+    assert [element.get(XLINK_HREF) for element in layer] == [
+        "image1.png", "image1.png", "data:image/png;base64," + SMALL]
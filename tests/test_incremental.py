@@ -0,0 +1,92 @@
+from io import BytesIO
+
+import pytest
+
+import Ink2Impress
+from decks import generated_source
+
+OPTIONS = [{}, {"cull": True}, {"precision": 3, "strip_editor_data": True}]
+
+
+def full_conversion(source, options):
+    output = BytesIO()
+    Ink2Impress.write_impress(Ink2Impress.load_svg(BytesIO(source)), output, **options)
+    return output.getvalue()
+
+
+def replace_last(source, old, new):
+    start = source.rindex(old)
+    return source[:start] + new + source[start + len(old):]
+
+
+def edits(source):
+    """(name, source, layout changed, graphics changed) of a series of edits.
+    """
+    layout = replace_last(source, 'width="', 'width="1')
+    graphics = layout.replace("#00aa00", "#00aa01", 1)
+    editor = graphics.replace('inkscape:zoom="0.35"', 'inkscape:zoom="0.5"')
+    pagecolor = editor.replace('pagecolor="#ffffff"', 'pagecolor="#000000"').replace(
+        'inkscape:pageopacity="0.0"', 'inkscape:pageopacity="0.5"')
+    spaced = pagecolor.replace("</metadata>", "</metadata>\n  ")
+    new_layer = spaced.replace("<metadata", '<g id="new"/><metadata')
+    return [
+        ("unchanged", source, False, False),
+        ("layout", layout, True, None),
+        ("graphics", graphics, False, True),
+        ("editor", editor, False, False),
+        ("pagecolor", pagecolor, False, False),
+        ("spaced", spaced, False, False),
+        ("new layer", new_layer, True, True),
+        ]
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+def test_matches_full_conversion(options):
+    source = generated_source(steps=50, graphics=100)
+    converter = Ink2Impress.IncrementalConverter(**options)
+    output = BytesIO()
+    assert converter.convert(BytesIO(source), output) == (True, True)
+    assert output.getvalue() == full_conversion(source, options)
+
+    for name, edited, layout_rebuilt, graphics_rebuilt in edits(source):
+        if graphics_rebuilt is None:
+            # The culled graphics depend on the layout
+            graphics_rebuilt = bool(options.get("cull"))
+        output = BytesIO()
+        assert converter.convert(BytesIO(edited), output) == (layout_rebuilt, graphics_rebuilt), name
+        assert output.getvalue() == full_conversion(edited, options), name
+
+
+def test_invalid_source_is_not_kept():
+    source = generated_source(steps=20, graphics=20)
+    converter = Ink2Impress.IncrementalConverter()
+    converter.convert(BytesIO(source), BytesIO())
+    broken = replace_last(source, "<rect", "<rect <")
+    with pytest.raises(Exception):
+        converter.convert(BytesIO(broken), BytesIO())
+    with pytest.raises(Exception):
+        converter.convert(BytesIO(broken), BytesIO())
+
+    edited = replace_last(source, 'width="', 'width="1')
+    output = BytesIO()
+    assert converter.convert(BytesIO(edited), output) == (True, False)
+    assert output.getvalue() == full_conversion(edited, {})
+
+
+def test_preview_reloads_on_changes(tmpdir):
+    source = generated_source(steps=20, graphics=20)
+    source_svg = tmpdir.join("talk.svg")
+    source_svg.write(source, "wb")
+    state = Ink2Impress._PreviewState(str(source_svg))
+    assert state.update() is None
+    assert state.version == 1
+    assert Ink2Impress.LIVE_RELOAD_SCRIPT in state.page
+
+    # Saved again without changes
+    assert state.update() is None
+    assert state.version == 1
+
+    source_svg.write(replace_last(source, 'width="', 'width="1'), "wb")
+    assert state.update() is None
+    assert state.version == 2
+    assert Ink2Impress.LIVE_RELOAD_SCRIPT in state.page
@@ -0,0 +1,45 @@
+import pytest
+
+import Ink2Impress
+from decks import generated_deck, rect_values, step_attributes
+
+SEEDS = [0, 1, 2]
+
+
+def old_layout_rects(layout_layer):
+    """The rects of the layout layer, from the ancestor walk of every rect
+    that process_layout_layer used to do.
+    """
+    return [
+        Ink2Impress.Rect(element=rect, transform=Ink2Impress.sum_parent_transform(rect, layout_layer))
+        for rect in layout_layer.xpath(".//rect")
+        ]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_single_pass_matches_ancestor_walk(seed):
+    _, layout_layer = generated_deck(seed=seed)
+    rects = Ink2Impress.process_layout_layer(layout_layer, use_numpy=False)
+    expected = old_layout_rects(layout_layer)
+
+    assert [rect.id for rect in rects] == [rect.id for rect in expected]
+    # The transforms are composed in another order, so the last bit may differ
+    for rect, expected_rect in zip(rects, expected):
+        assert rect_values(rect)[1:] == pytest.approx(rect_values(expected_rect)[1:], rel=1e-12)
+    # but never the output
+    assert (step_attributes(Ink2Impress.build_step_divs(rects, use_numpy=False)) ==
+            step_attributes(Ink2Impress.build_step_divs(expected, use_numpy=False)))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_numpy_path_matches_python_path(seed):
+    pytest.importorskip("numpy")
+    _, layout_layer = generated_deck(steps=400, seed=seed)
+    rects = Ink2Impress.process_layout_layer(layout_layer, use_numpy=True)
+    expected = Ink2Impress.process_layout_layer(layout_layer, use_numpy=False)
+
+    assert [rect.id for rect in rects] == [rect.id for rect in expected]
+    for rect, expected_rect in zip(rects, expected):
+        assert rect_values(rect)[1:] == pytest.approx(rect_values(expected_rect)[1:], rel=1e-12)
+    assert (step_attributes(Ink2Impress.build_step_divs(rects, use_numpy=True)) ==
+            step_attributes(Ink2Impress.build_step_divs(expected, use_numpy=False)))
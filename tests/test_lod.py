@@ -0,0 +1,30 @@
+from lxml import etree
+
+import lod
+
+ZIGZAG = "M 0 0 L 1 1 L 2 0 L 3 1 L 4 0 L 5 1 L 6 0 L 7 1 L 8 0 L 40 0 L 40 40"
+
+
+def simplified_layer(path_class):
+    layer = etree.fromstring('<g><path d="%s"/></g>' % ZIGZAG)
+    if path_class is not None:
+        layer[0].set("class", path_class)
+    levels = [lod.Level(5., ["overview"]), lod.Level(20., ["far"])]
+    assert lod.add_detail_levels(layer, levels) == 2
+    return layer
+
+
+def test_copies_keep_the_path_classes():
+    layer = simplified_layer("outline thick")
+    assert [path.get("class") for path in layer] == [
+        "outline thick impress-detail-0 impress-detail-1",
+        "outline thick impress-lod-0",
+        "outline thick impress-lod-1",
+        ]
+
+
+def test_copies_without_path_classes():
+    layer = simplified_layer(None)
+    assert [path.get("class") for path in layer] == [
+        "impress-detail-0 impress-detail-1", "impress-lod-0", "impress-lod-1",
+        ]
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+import matrix
+
+SEEDS = [0, 1, 2]
+
+
+def cofactor_determinant(rows):
+    """The determinant by expansion of minors on the first row, as
+    Matrix.determinant used to calculate it.
+    """
+    if len(rows) == 1:
+        return rows[0][0]
+    return sum((-1) ** col * rows[0][col] *
+               cofactor_determinant([row[:col] + row[col + 1:] for row in rows[1:]])
+               for col in xrange(len(rows)))
+
+
+def random_rows(rng, size, kind):
+    values = {
+        "int": lambda: rng.randint(-9, 9),
+        "float": lambda: rng.uniform(-9, 9),
+        "mixed": lambda: rng.choice([rng.randint(-9, 9), rng.uniform(-9, 9)]),
+        "complex": lambda: complex(rng.randint(-9, 9), rng.randint(-9, 9)),
+        }[kind]
+    return [[values() for _ in xrange(size)] for _ in xrange(size)]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("kind", ["int", "float", "mixed", "complex"])
+@pytest.mark.parametrize("size", [2, 3, 4, 5, 6])
+def test_determinant_matches_expansion_by_minors(seed, kind, size):
+    rows = random_rows(random.Random(seed), size, kind)
+    expected = cofactor_determinant(rows)
+    assert matrix.Matrix(rows).determinant() == pytest.approx(expected)
+
+
+def test_mixed_determinant_divides_exactly():
+    rows = [[2, 1, 0, 0.5], [3, 1, 4, 1], [1, 5, 9, 2], [6, 5, 3, 5]]
+    assert matrix.Matrix(rows).determinant() == pytest.approx(-126.5)
+
+
+def test_complex_determinant():
+    rows = [[1 + 2j, 3, 0, 1], [2, 1j, 4, 0], [0, 5, 1, 2j], [3, 0, 2, 1]]
+    assert matrix.Matrix(rows).determinant() == pytest.approx(16 - 82j)
+
+
+def test_rows_are_live():
+    mat = matrix.Matrix([[1, 2], [3, 4]])
+    mat.m[0][0] = 9
+    mat.m[1] = [7, 8]
+    assert mat.m == [[9, 2], [7, 8]]
+    assert mat[(0, 0)] == 9
+    assert mat.determinant() == 9 * 8 - 2 * 7
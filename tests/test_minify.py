@@ -0,0 +1,68 @@
+import pytest
+from lxml import etree
+
+import minify
+
+
+@pytest.mark.parametrize("data, precision, expected", [
+    ("M 10.123456,20.987654 L 30,40", 2, "M10.12 20.99L30 40"),
+    ("M1.5-2.25 l-0.001 3", 1, "M1.5-2.2l0 3"),
+    ("m 1e-1 2.5E1 h 3.14159", 3, "m0.1 25h3.142"),
+    ("10.55,20.44 30.9,40", 1, "10.6 20.4 30.9 40"),
+    ("M0 0 007 1", 1, "M0 0 007 1"),
+    ("M0 0 # 1", 1, "M0 0 # 1"),
+    ])
+def test_round_path_data(data, precision, expected):
+    assert minify.round_path_data(data, precision) == expected
+
+
+@pytest.mark.parametrize("data, expected", [
+    # Packed flags, the second one followed by the end point
+    ("M0 0a10 10 0 011.5 2", "M0 0a10 10 0 0 1 1.5 2"),
+    ("M0 0A10.123 10 30 1,0 11.555 2", "M0 0A10.123 10 30 1 0 11.555 2"),
+    # Implicit repetitions of the arc command
+    ("M0 0a1 1 0 1 0 2.0004 0 1 1 0 00.5 .5", "M0 0a1 1 0 1 0 2 0 1 1 0 0 0 0.5 0.5"),
+    # Flags after the arc, are numbers again
+    ("M0 0a1 1 0 1 0 2 0l011.5 2", "M0 0a1 1 0 1 0 2 0l11.5 2"),
+    ])
+def test_round_path_data_keeps_arc_flags(data, expected):
+    assert minify.round_path_data(data, 3) == expected
+
+
+def test_round_path_data_keeps_invalid_arcs():
+    data = "M0 0a10 10 0 2 1 3 4"
+    assert minify.round_path_data(data, 1) == data
+
+
+# Tags without the SVG namespace, as load_svg parses them
+LAYER = """\
+<g xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape"
+   xmlns:sodipodi="http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd"
+   inkscape:label="graphics">
+  <metadata><title>talk</title></metadata>
+  <!-- a comment -->
+  <sodipodi:namedview id="view"/>
+  <path d="M 0.12345,0 A 5,5 0 0,1 10.555,10" inkscape:connector-curvature="0"/>
+  <polyline points="1.111,2.222 3.333,4.444"/>
+  <text> keep <tspan> this </tspan></text>
+</g>"""
+
+
+def test_minify_graphics():
+    layer = etree.fromstring(LAYER)
+    removed = minify.minify_graphics(layer, precision=1)
+    assert removed == 4
+    assert etree.tostring(layer) == (
+        '<g>'
+        '<path d="M0.1 0A5 5 0 0 1 10.6 10"/>'
+        '<polyline points="1.1 2.2 3.3 4.4"/>'
+        '<text> keep <tspan> this </tspan></text>'
+        '</g>')
+
+
+def test_minify_graphics_only_rounds():
+    layer = etree.fromstring(LAYER)
+    assert minify.minify_graphics(layer, precision=1, strip_editor_data=False,
+                                  strip_whitespace=False) == 0
+    assert layer.find("path").get("d") == "M0.1 0A5 5 0 0 1 10.6 10"
+    assert len(layer) == 6
@@ -0,0 +1,53 @@
+import cache
+import Ink2Impress
+from decks import generated_source
+
+
+def write_source(tmpdir):
+    source_svg = tmpdir.join("talk.svg")
+    source_svg.write(generated_source(steps=10, graphics=10), "wb")
+    return str(source_svg)
+
+
+def test_stale_compressed_page_is_removed(tmpdir):
+    source_svg = write_source(tmpdir)
+    target_html = str(tmpdir.join("talk.html"))
+    Ink2Impress.convert_file(source_svg, target_html, gzip_level=6)
+    assert tmpdir.join("talk.html.gz").check()
+
+    Ink2Impress.convert_file(source_svg, target_html)
+    assert tmpdir.join("talk.html").check()
+    assert not tmpdir.join("talk.html.gz").check()
+
+
+def test_stale_compressed_page_is_removed_on_cache_hits(tmpdir):
+    source_svg = write_source(tmpdir)
+    target_html = str(tmpdir.join("talk.html"))
+    build_cache = cache.BuildCache(str(tmpdir.join("cache")))
+    assert not Ink2Impress.convert_file_cached(source_svg, target_html, build_cache)[1]
+
+    Ink2Impress.convert_file(source_svg, target_html, gzip_level=6)
+    assert tmpdir.join("talk.html.gz").check()
+    assert Ink2Impress.convert_file_cached(source_svg, target_html, build_cache)[1]
+    assert not tmpdir.join("talk.html.gz").check()
+
+
+def test_incremental_converter_removes_stale_compressed_page(tmpdir):
+    source_svg = write_source(tmpdir)
+    target_html = str(tmpdir.join("talk.html"))
+    Ink2Impress.IncrementalConverter(gzip_level=6).convert(source_svg, target_html)
+    assert tmpdir.join("talk.html.gz").check()
+
+    Ink2Impress.IncrementalConverter().convert(source_svg, target_html)
+    assert not tmpdir.join("talk.html.gz").check()
+
+
+def test_variant_targets_are_unique():
+    viewports = [Ink2Impress.Viewport("big screen", 1920, 1080),
+                 Ink2Impress.Viewport("big_screen", 1280, 720)]
+    variants = Ink2Impress.variant_targets("talk.html", ["a b", "a_b", None], viewports)
+    assert [variant.target for variant in variants] == [
+        "talk-a_b-big_screen.html", "talk-a_b-big_screen-2.html",
+        "talk-a_b-2-big_screen.html", "talk-a_b-2-big_screen-2.html",
+        "talk-default-big_screen.html", "talk-default-big_screen-2.html",
+        ]
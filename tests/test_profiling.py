@@ -0,0 +1,25 @@
+import pstats
+
+import pytest
+
+import profiling
+
+
+def busy():
+    total = 0
+    for i in xrange(300000):
+        total += i % 7
+    return total
+
+
+@pytest.mark.skipif(not profiling.StackSampler.available(), reason="no profiling timer")
+def test_sampler_is_not_in_the_profile(tmpdir):
+    prefix = str(tmpdir.join("busy"))
+    with profiling.profiling(prefix, interval=0.0005) as profiler:
+        for _ in xrange(5):
+            busy()
+    assert profiler.sampler.stacks
+
+    names = set(name for _, _, name in pstats.Stats(prefix + ".pstats").stats)
+    assert "busy" in names
+    assert not names & set(["_sample", "frame_name", "code_name"])
@@ -0,0 +1,89 @@
+import math
+import random
+
+import pytest
+
+import Ink2Impress
+import spatial
+
+SEEDS = [0, 1, 2]
+
+
+def random_box(rng, size=100.):
+    x = rng.uniform(-1000, 1000)
+    y = rng.uniform(-1000, 1000)
+    return (x, y, x + rng.uniform(0, size), y + rng.uniform(0, size))
+
+
+def random_tree(seed, count=500, max_entries=4):
+    rng = random.Random(seed)
+    boxes = [random_box(rng) for _ in xrange(count)]
+    return rng, boxes, spatial.RTree(((box, i) for i, box in enumerate(boxes)), max_entries)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_query_matches_scan(seed):
+    rng, boxes, tree = random_tree(seed)
+    assert len(tree) == len(boxes)
+    for _ in xrange(50):
+        query = random_box(rng, 400.)
+        expected = [i for i, box in enumerate(boxes) if spatial.boxes_intersect(query, box)]
+        assert tree.query(query) == expected
+        assert tree.intersects(query) == bool(expected)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_query_point_matches_scan(seed):
+    rng, boxes, tree = random_tree(seed)
+    points = [(rng.uniform(-1000, 1100), rng.uniform(-1000, 1100)) for _ in xrange(50)]
+    # The corners of a box are inside it
+    points += [(box[0], box[3]) for box in boxes[:10]]
+    for x, y in points:
+        expected = [i for i, box in enumerate(boxes)
+                    if box[0] <= x <= box[2] and box[1] <= y <= box[3]]
+        assert tree.query_point(x, y) == expected
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+@pytest.mark.parametrize("k", [1, 5, 600])
+def test_nearest_matches_scan(seed, k):
+    rng, boxes, tree = random_tree(seed)
+    for _ in xrange(20):
+        x, y = rng.uniform(-1200, 1200), rng.uniform(-1200, 1200)
+        expected = sorted(xrange(len(boxes)), key=lambda i: (spatial.box_distance(boxes[i], x, y), i))
+        assert tree.nearest(x, y, k) == expected[:k]
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_nearest_with_distance_matches_scan(seed):
+    rng, boxes, tree = random_tree(seed)
+    # The distance to the far corner is never smaller than to the box
+    corner = lambda i, x, y: max(math.hypot(bx - x, by - y)
+                                 for bx in boxes[i][0::2] for by in boxes[i][1::2])
+    for _ in xrange(20):
+        x, y = rng.uniform(-1200, 1200), rng.uniform(-1200, 1200)
+        expected = sorted(xrange(len(boxes)), key=lambda i: (corner(i, x, y), i))
+        assert tree.nearest(x, y, 5, corner) == expected[:5]
+
+
+def test_empty_tree():
+    tree = spatial.RTree([])
+    assert len(tree) == 0
+    assert tree.query((0, 0, 1, 1)) == []
+    assert tree.query_point(0, 0) == []
+    assert not tree.intersects((0, 0, 1, 1))
+    assert tree.nearest(0, 0) == []
+
+
+def test_step_index():
+    steps = [Ink2Impress.Rect(x=0, y=0, w=100, h=50, r=0, id_="flat"),
+             Ink2Impress.Rect(x=0, y=0, w=100, h=50, r=90, id_="upright"),
+             Ink2Impress.Rect(x=500, y=0, w=100, h=50, r=45, id_="far")]
+    index = spatial.StepIndex(steps)
+    assert [step.id for step in index.at_point(40, 0)] == ["flat"]
+    assert [step.id for step in index.at_point(0, 40)] == ["upright"]
+    assert [step.id for step in index.at_point(0, 0)] == ["flat", "upright"]
+    # In the bounding box of the rotated frame, but not in the frame
+    assert index.at_point(540, 40) == []
+    assert [step.id for step in index.nearest(400, 0, 2)] == ["far", "flat"]
+    assert [step.id for step in index.query_rotated(250, 0, 10, 10, 0)] == []